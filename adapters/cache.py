@@ -0,0 +1,233 @@
+import abc
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class AbstractCache(abc.ABC):
+    """
+    The evictions are the entries dropped to make room for new ones, the expirations
+    the entries found past their time to live
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._get(key)
+        self._count("misses" if value is None else "hits")
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """The value of a key, without counting a hit or a miss"""
+        return self._get(key)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @abc.abstractmethod
+    def _get(self, key: Hashable) -> Optional[Any]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, key: Hashable):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_where(self, predicate: Callable[[Hashable, Any], bool]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+
+class LRUCache(AbstractCache):
+    """
+    In-process cache bounded by number of entries and time to live. When the cache is
+    full the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # type: OrderedDict[Hashable, tuple[float, Any]]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._count("expirations")
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        """
+        this function stores a value
+        Args:
+            key: the key of the entry
+            value: the value to be cached, None values are not cached
+            ttl: seconds the entry is valid, it can only be shorter than the cache ttl
+        Returns:
+
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if value is None or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._count("evictions")
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            keys = [
+                key
+                for key, (_, value) in self._entries.items()
+                if predicate(key, value)
+            ]
+            for key in keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedCacheStandIn(AbstractCache):
+    """
+    Local stand-in of a shared cache server (redis, memcached). Values are stored
+    serialized as json, like a network cache would, so only json values can be cached.
+    """
+
+    def __init__(self, ttl: float):
+        super().__init__()
+        self.ttl = ttl
+        self._entries = {}  # type: dict[str, tuple[float, str]]
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(self._key(key))
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            self.delete(key)
+            self._count("expirations")
+            return None
+        return json.loads(payload)
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if value is None or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[self._key(key)] = (time.time() + ttl, json.dumps(value))
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(self._key(key), None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            keys = [
+                key
+                for key, (_, payload) in self._entries.items()
+                if predicate(key, json.loads(payload))
+            ]
+            for key in keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _key(key) -> str:
+        return key if isinstance(key, str) else json.dumps(key)
+
+
+class TieredCache(AbstractCache):
+    """
+    In-process cache in front of a shared one. Reads fall back to the shared cache and
+    fill the local one, writes and deletes go to both.
+    """
+
+    def __init__(self, local: AbstractCache, shared: AbstractCache):
+        super().__init__()
+        self.local = local
+        self.shared = shared
+
+    def _get(self, key):
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def peek(self, key):
+        value = self.local.peek(key)
+        return self.shared.peek(key) if value is None else value
+
+    def set(self, key, value, ttl: float = None):
+        self.shared.set(key, value, ttl)
+        self.local.set(key, value, ttl)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+    def delete_where(self, predicate):
+        self.shared.delete_where(predicate)
+        self.local.delete_where(predicate)
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+    def stats(self) -> dict:
+        return {
+            **super().stats(),
+            "evictions": self.local.evictions + self.shared.evictions,
+            "expirations": self.local.expirations + self.shared.expirations,
+            "local": self.local.stats(),
+            "shared": self.shared.stats(),
+        }
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+import config
+
+
+class PoolWaitStats:
+    """Time spent by the callers of a pool waiting for a connection"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "total_wait_seconds": round(self.total_wait, 6),
+                "max_wait_seconds": round(self.max_wait, 6),
+                "avg_wait_seconds": round(self.total_wait / self.checkouts, 6)
+                if self.checkouts
+                else 0.0,
+            }
+
+
+class WaitTimeMixin:
+    """Measures how long every checkout waits for a free or new connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_stats.record(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(WaitTimeMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(WaitTimeMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def build_engine(url: str = None) -> Engine:
+    """Create the engine of a connection string with the settings of its backend"""
+    url = url or config.get_db_connection_string()
+    engine = create_engine(url, **_pool_arguments(url, InstrumentedQueuePool))
+    _configure_sqlite(engine, url)
+    return engine
+
+
+def build_async_engine(url: str = None) -> AsyncEngine:
+    """Same as build_engine with an asyncio driver"""
+    url = url or config.get_async_db_connection_string()
+    engine = create_async_engine(
+        url, **_pool_arguments(url, InstrumentedAsyncQueuePool)
+    )
+    _configure_sqlite(engine.sync_engine, url)
+    return engine
+
+
+def pool_status(engine) -> dict:
+    """Connections checked out, overflow and wait times of the pool of an engine"""
+    if isinstance(engine, AsyncEngine):
+        engine = engine.sync_engine
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    if isinstance(pool, WaitTimeMixin):
+        status.update(pool.wait_stats.to_dict())
+    return status
+
+
+def begin_before_savepoint(connection: Connection):
+    """
+    The sqlite drivers only begin a transaction before a write, a savepoint opened after
+    the reads of a transaction would not be part of it, so the transaction is begun first
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    if not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN")
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    return url.startswith("sqlite") and (":memory:" in url or url.endswith("://"))
+
+
+def _pool_arguments(url: str, pool_class) -> dict:
+    # in memory sqlite databases live in a single connection, they keep the default pool
+    if _is_sqlite_memory(url):
+        return {}
+    return {"poolclass": pool_class, **config.get_engine_settings(url)}
+
+
+def _configure_sqlite(engine: Engine, url: str):
+    if not url.startswith("sqlite"):
+        return
+    pragmas = config.get_sqlite_pragmas()
+    if _is_sqlite_memory(url):
+        # WAL and mmap don't apply to in memory databases
+        pragmas = {"busy_timeout": pragmas["busy_timeout"]}
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
@@ -1,5 +1,5 @@
 from abc import abstractmethod, ABC
-from typing import Union
+from typing import List, Union
 
 from domain import events
 
@@ -41,7 +41,7 @@ class ProductCreatedStrategy(AbstractMessageStrategy):
             events.ProductModified, events.ProductCreated, events.ProductDeleted
         ],
     ) -> (str, str):
-        fields = event.dict()
+        fields = event.dict(exclude={"updated_at"})
         body = ProductCreatedStrategy._create_body(sku=event.sku, fields=fields)
         subject = f"Product {event.sku} has been created"
         return subject, body
@@ -66,8 +66,54 @@ class ProductDeletedStrategy(AbstractMessageStrategy):
         return subject, body
 
 
+class ProductsBulkCreatedStrategy(AbstractMessageStrategy):
+    # the body lists at most this number of skus
+    MAX_SKUS_IN_BODY = 50
+
+    @staticmethod
+    def create_message_and_subject(
+        event: events.ProductsBulkCreated,
+    ) -> (str, str):
+        skus = event.skus[: ProductsBulkCreatedStrategy.MAX_SKUS_IN_BODY]
+        body = f"The following products have been created: {', '.join(skus)}"
+        if len(event.skus) > len(skus):
+            body += f" and {len(event.skus) - len(skus)} more"
+        subject = f"{len(event.skus)} products have been created"
+        return subject, body
+
+
+class ProductChangesDigestStrategy:
+    """One message for several product changes, each change is a line of the body"""
+
+    # the body lists at most this number of changes
+    MAX_CHANGES_IN_BODY = 50
+
+    @staticmethod
+    def create_message_and_subject(
+        changes: List[
+            Union[
+                events.ProductModified,
+                events.ProductCreated,
+                events.ProductDeleted,
+                events.ProductsBulkCreated,
+            ]
+        ],
+    ) -> (str, str):
+        listed = changes[: ProductChangesDigestStrategy.MAX_CHANGES_IN_BODY]
+        lines = [
+            FACTORY_MESSAGE[type(change)].create_message_and_subject(change)[0]
+            for change in listed
+        ]
+        if len(changes) > len(listed):
+            lines.append(f"and {len(changes) - len(listed)} more changes")
+        body = "The following products have changed:\n" + "\n".join(lines)
+        subject = f"{len(changes)} product changes"
+        return subject, body
+
+
 FACTORY_MESSAGE = {
     events.ProductCreated: ProductCreatedStrategy,
     events.ProductModified: ProductChangedStrategy,
     events.ProductDeleted: ProductDeletedStrategy,
+    events.ProductsBulkCreated: ProductsBulkCreatedStrategy,
 }
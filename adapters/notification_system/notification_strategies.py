@@ -1,14 +1,30 @@
+import functools
 import smtplib
+import threading
 from email.message import EmailMessage
-from typing import List
+from typing import List, NamedTuple
 
 from decouple import config
 
-PORT = config("PORT")
-SMTP_SERVER = config("SMTP_SERVER")
-SENDER_EMAIL = config("SENDER_EMAIL")
-RECEIVER_EMAIL = config("RECEIVER_EMAIL")
-PASSWORD = config("PASSWORD")
+
+class SmtpSettings(NamedTuple):
+    port: int
+    server: str
+    sender_email: str
+    receiver_email: str
+    password: str
+
+
+@functools.lru_cache(maxsize=None)
+def get_smtp_settings() -> SmtpSettings:
+    """The SMTP settings are read when the first e-mail is sent, not on import"""
+    return SmtpSettings(
+        port=config("PORT", cast=int),
+        server=config("SMTP_SERVER"),
+        sender_email=config("SENDER_EMAIL"),
+        receiver_email=config("RECEIVER_EMAIL"),
+        password=config("PASSWORD"),
+    )
 
 
 class AbstractNotification:
@@ -20,12 +36,67 @@ class AbstractNotification:
 class EmailNotification:
     @staticmethod
     def send(addressees: List, subject: str, body: str):
-        msg = EmailMessage()
-        msg["Subject"] = subject
-        msg["From"] = SENDER_EMAIL
-        msg["To"] = ", ".join(addressees)
-        msg.set_content(body)
-
-        with smtplib.SMTP_SSL(SMTP_SERVER, PORT, timeout=3) as smtp:
-            smtp.login(SENDER_EMAIL, PASSWORD)
+        msg = build_email_message(addressees, subject, body)
+        settings = get_smtp_settings()
+        with smtplib.SMTP_SSL(settings.server, settings.port, timeout=3) as smtp:
+            smtp.login(settings.sender_email, settings.password)
             smtp.send_message(msg)
+
+
+class PersistentEmailNotification(AbstractNotification):
+    """
+    Sends e-mails through a single SMTP connection that is reused between messages,
+    the connection is opened again when the server closes it
+    """
+
+    def __init__(self, connection_factory=None):
+        self.connection_factory = connection_factory or self._connect
+        self._smtp = None
+        self._lock = threading.Lock()
+
+    def send(self, addressees: List, subject: str, body: str):
+        msg = build_email_message(addressees, subject, body)
+        with self._lock:
+            try:
+                self._connection().send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                self._connection().send_message(msg)
+            except (smtplib.SMTPException, OSError):
+                # the connection may be in a bad state, the next message opens a new one
+                self._quit()
+                raise
+
+    def close(self):
+        with self._lock:
+            self._quit()
+
+    def _quit(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    @staticmethod
+    def _connect():
+        settings = get_smtp_settings()
+        return smtplib.SMTP_SSL(settings.server, settings.port, timeout=3)
+
+    def _connection(self):
+        if self._smtp is None:
+            smtp = self.connection_factory()
+            settings = get_smtp_settings()
+            smtp.login(settings.sender_email, settings.password)
+            self._smtp = smtp
+        return self._smtp
+
+
+def build_email_message(addressees: List, subject: str, body: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = get_smtp_settings().sender_email
+    msg["To"] = ", ".join(addressees)
+    msg.set_content(body)
+    return msg
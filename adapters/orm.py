@@ -1,3 +1,5 @@
+from collections import deque
+
 from sqlalchemy import (
     Table,
     Column,
@@ -5,15 +7,18 @@ from sqlalchemy import (
     String,
     Enum,
     Float,
+    Date,
     DateTime,
     func,
-    ForeignKey,
+    Index,
+    Text,
     event,
+    text,
 )
 from sqlalchemy.orm import registry
 
-from domain.models import Product, User, ProductSeen
-from schemas.enums import Roles
+from domain.models import Product, User, ProductSeen, Notification
+from schemas.enums import Roles, NotificationStatus
 
 mapper_registry = registry()
 products = Table(
@@ -25,6 +30,21 @@ products = Table(
     Column("price", Float, nullable=False),
     Column("brand", String, nullable=False),
     Column("quantity", Float, nullable=False),
+    # bumped on every change of the product, they are the validators of the HTTP caches.
+    # The version has no server default, or the ORM would read it back after the updates
+    # instead of checking their row count
+    Column("version", Integer, nullable=False, default=1),
+    Column("updated_at", DateTime, nullable=False, server_default=func.now()),
+    # indexes of the keyset pagination of the product listing, id breaks the ties
+    Index("ix_products_brand_price_id", "brand", "price", "id"),
+    Index("ix_products_price_id", "price", "id"),
+    Index("ix_products_name_id", "name", "id"),
+    Index(
+        "ix_products_in_stock_id",
+        "id",
+        sqlite_where=text("quantity > 0"),
+        postgresql_where=text("quantity > 0"),
+    ),
 )
 
 users = Table(
@@ -35,45 +55,123 @@ users = Table(
     Column("username", String, nullable=False),
     Column("password", String, nullable=False),
     Column("email", String, nullable=False, unique=True),
+    Column("version", Integer, nullable=False, default=1),
 )
+# the login matches the e-mail without case, so it is unique without case
+Index("ix_users_email_lower", func.lower(users.c.email), unique=True)
 
+# raw views, they are kept after the product or the user is deleted
 product_seen = Table(
     "product_seen",
     mapper_registry.metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
-    Column("product_sku", ForeignKey("products.id"), nullable=False),
+    Column("product_sku", String, nullable=False),
     Column("date", DateTime, nullable=False, server_default=func.now()),
-    Column("user_email", ForeignKey("users.id"), nullable=False),
+    Column("user_email", String, nullable=False),
     Column("role", Enum(Roles), nullable=False, server_default=Roles.anonymous.name),
+    Index("ix_product_seen_product_sku_date", "product_sku", "date"),
+)
+
+# view counts per product and role, incremented when the raw views are written
+product_views_hourly = Table(
+    "product_views_hourly",
+    mapper_registry.metadata,
+    Column("product_sku", String, primary_key=True),
+    Column("role", Enum(Roles), primary_key=True),
+    Column("hour", DateTime, primary_key=True),
+    Column("views", Integer, nullable=False),
+    Index("ix_product_views_hourly_hour", "hour"),
+)
+
+product_views_daily = Table(
+    "product_views_daily",
+    mapper_registry.metadata,
+    Column("product_sku", String, primary_key=True),
+    Column("role", Enum(Roles), primary_key=True),
+    Column("day", Date, primary_key=True),
+    Column("views", Integer, nullable=False),
+    Index("ix_product_views_daily_day_product_sku", "day", "product_sku"),
+)
+
+notification_outbox = Table(
+    "notification_outbox",
+    mapper_registry.metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("subject", String, nullable=False),
+    Column("body", Text, nullable=False),
+    Column(
+        "status",
+        Enum(NotificationStatus),
+        nullable=False,
+        server_default=NotificationStatus.pending.name,
+    ),
+    Column("attempts", Integer, nullable=False, server_default="0"),
+    Column("next_attempt_at", DateTime, nullable=False, server_default=func.now()),
+    Column("created_at", DateTime, nullable=False, server_default=func.now()),
+    Column("sent_at", DateTime, nullable=True),
+    Column("last_error", String, nullable=True),
+    Index("ix_notification_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+)
+
+# domain events stored in the same transaction as the changes that raised them
+outbox = Table(
+    "outbox",
+    mapper_registry.metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("event_type", String, nullable=False),
+    Column("payload", Text, nullable=False),
+    Column("created_at", DateTime, nullable=False, server_default=func.now()),
+    Column("dispatched_at", DateTime, nullable=True),
+    Index(
+        "ix_outbox_pending_id",
+        "id",
+        sqlite_where=text("dispatched_at IS NULL"),
+        postgresql_where=text("dispatched_at IS NULL"),
+    ),
 )
 
 
 def start_mappers():
-    """Configure the SQLAlchemy mappers"""
+    """Configure the SQLAlchemy mappers, nothing is done when they are already mapped"""
+    if mapper_registry.mappers:
+        return
+    # the updates of products and users check that the version didn't change since the
+    # row was read and increment it, the value set by a handler is kept instead
     mapper_registry.map_imperatively(
         Product,
         products,
+        version_id_col=products.c.version,
     )
     mapper_registry.map_imperatively(
         User,
         users,
+        version_id_col=users.c.version,
     )
     mapper_registry.map_imperatively(
         ProductSeen,
         product_seen,
     )
+    mapper_registry.map_imperatively(
+        Notification,
+        notification_outbox,
+    )
 
 
 @event.listens_for(Product, "load")
 def receive_load(product, _):
-    product.events = []
+    product.events = deque()
 
 
 @event.listens_for(User, "load")
 def receive_load(user, _):
-    user.events = []
+    user.events = deque()
 
 
 @event.listens_for(ProductSeen, "load")
 def receive_load(prod_seen, _):
-    prod_seen.events = []
+    prod_seen.events = deque()
+
+
+@event.listens_for(Notification, "load")
+def receive_load(notification, _):
+    notification.events = deque()
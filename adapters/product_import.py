@@ -0,0 +1,123 @@
+import codecs
+import csv
+import json
+from typing import AsyncIterator, Iterable, List, Tuple
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from starlette.requests import Request
+
+from schemas.product import ProductSchema
+
+JSON_CONTENT_TYPES = {"application/json"}
+NDJSON_CONTENT_TYPES = {
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+}
+CSV_CONTENT_TYPES = {"text/csv"}
+
+
+async def parse_products(
+    request: Request,
+) -> Tuple[List[Tuple[int, ProductSchema]], List[dict]]:
+    """
+    Parse the products of a bulk import, the body can be a json array or a streamed
+    ndjson or csv file whose rows are validated as they arrive. Returns the valid
+    products with their row number and the errors of the invalid rows, rows are
+    numbered from 1 (csv header not counted)
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in JSON_CONTENT_TYPES:
+        rows = await request.json()
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="A json array is expected")
+        return validate_rows(rows)
+    if content_type in NDJSON_CONTENT_TYPES:
+        return await validate_stream(_ndjson_rows(_lines(request.stream())))
+    if content_type in CSV_CONTENT_TYPES:
+        return await validate_stream(_csv_rows(_lines(request.stream())))
+    raise HTTPException(
+        status_code=415,
+        detail="Supported content types: application/json, application/x-ndjson, "
+        "text/csv",
+    )
+
+
+def validate_rows(
+    rows: Iterable,
+) -> Tuple[List[Tuple[int, ProductSchema]], List[dict]]:
+    products, invalid = [], []
+    for row_number, row in enumerate(rows, 1):
+        _validate(row_number, row, products, invalid)
+    return products, invalid
+
+
+async def validate_stream(
+    rows: AsyncIterator,
+) -> Tuple[List[Tuple[int, ProductSchema]], List[dict]]:
+    """Same as validate_rows, only the products are kept and not the raw rows"""
+    products, invalid = [], []
+    row_number = 0
+    async for row in rows:
+        row_number += 1
+        _validate(row_number, row, products, invalid)
+    return products, invalid
+
+
+def _validate(row_number: int, row, products: list, invalid: list):
+    try:
+        if isinstance(row, Exception):
+            raise row
+        products.append((row_number, ProductSchema.parse_obj(row)))
+    except ValidationError as ex:
+        invalid.append({"row": row_number, "detail": ex.errors()})
+    except ValueError as ex:
+        invalid.append({"row": row_number, "detail": str(ex)})
+
+
+async def _ndjson_rows(lines: AsyncIterator[str]):
+    async for line in lines:
+        try:
+            yield json.loads(line)
+        except ValueError as ex:
+            yield ex
+
+
+async def _csv_rows(lines: AsyncIterator[str]):
+    """
+    The rows of a csv file as dicts keyed by the header like csv.DictReader, a quoted
+    value with new lines spans several lines, an odd number of quotes means the record
+    goes on
+    """
+    header = None
+    record = ""
+    async for line in lines:
+        record += line
+        if record.count('"') % 2:
+            record += "\n"
+            continue
+        values = next(csv.reader([record]))
+        record = ""
+        if header is None:
+            header = values
+        else:
+            yield dict(zip(header, values))
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Split a streamed body in lines without loading it at once, empty lines are skipped.
+    The decoder keeps the bytes of a character split between two chunks
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
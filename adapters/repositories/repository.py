@@ -1,12 +1,84 @@
 import abc
-from typing import Union, Set
+from typing import Union, Set, List, Iterable, Tuple
 
 from fastapi import HTTPException
-from sqlalchemy import delete, select
+from sqlalchemy import Table, case, delete, inspect, or_, select, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm.exc import StaleDataError
 from starlette import status
 
 from domain.models import Product, User, ProductSeen
-from logger import logger
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# INSERT ... ON CONFLICT DO UPDATE of each dialect
+UPSERT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+# dialects whose UPDATE ... FROM ... RETURNING returns the columns of the FROM subquery,
+# sqlite only returns the columns of the updated table
+UPDATE_RETURNING_OLD_VALUES = {"postgresql"}
+
+
+def apply_update(
+    row: dict, values: dict, on_change: dict = None, version_column: str = None
+) -> dict:
+    """
+    The new values of a row, the values are always set, on_change and the increment of
+    the version are only applied when the values change the row
+    """
+    new = {**row, **values}
+    if any(row[column] != value for column, value in values.items()):
+        new.update(on_change or {})
+        if version_column:
+            new[version_column] = row[version_column] + 1
+    return new
+
+
+def update_returning_statement(
+    table: Table, where: list, values: dict, on_change: dict, version_column: str = None
+):
+    """
+    UPDATE ... FROM ... RETURNING that returns the old values of the rows, read by a
+    locking subquery of the same statement, followed by the new ones
+    """
+    previous = select(table).where(*where).with_for_update().subquery("previous")
+    changed = or_(
+        *(table.c[column].is_distinct_from(value) for column, value in values.items())
+    )
+    set_ = dict(values)
+    for column, value in on_change.items():
+        set_[column] = case((changed, value), else_=table.c[column])
+    if version_column:
+        version = table.c[version_column]
+        set_[version_column] = case((changed, version + 1), else_=version)
+    return (
+        update(table)
+        .where(*(column == previous.c[column.name] for column in table.primary_key))
+        .values(set_)
+        .returning(*previous.c, *table.c)
+    )
+
+
+def _table_of(table) -> Table:
+    return table if isinstance(table, Table) else inspect(table).local_table
+
+
+def loaded_objects(session, table, dict_to_filter: dict) -> list:
+    """
+    The objects of the session that match dict_to_filter, a row is read once per
+    session. The attributes that are not loaded don't match, so the objects expired by
+    a commit or a rollback are read again
+    """
+    table = _table_of(table)
+    return [
+        instance
+        for instance in session.identity_map.values()
+        if inspect(instance).mapper.local_table is table
+        and all(
+            column in vars(instance) and vars(instance)[column] == value
+            for column, value in dict_to_filter.items()
+        )
+    ]
 
 
 class AbstractRepository(abc.ABC):
@@ -31,6 +103,44 @@ class AbstractRepository(abc.ABC):
     def delete(self, *args, **kwargs):
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def update_where(
+        self,
+        table: Union[type[Product], type[User]],
+        dict_to_filter: dict,
+        values: dict,
+        on_change: dict = None,
+        version_column: str = None,
+    ) -> List[Tuple[dict, dict]]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_returning(
+        self, table: Union[type[Product], type[User]], dict_to_filter: dict
+    ) -> List[dict]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def bulk_insert(
+        self,
+        table: Union[type[Product], type[User], type[ProductSeen]],
+        rows: List[dict],
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def bulk_increment(self, table: Table, rows: List[dict], counter: str):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def filter_existing(
+        self,
+        table: Union[type[Product], type[User], type[ProductSeen]],
+        column_name: str,
+        values: Iterable,
+    ) -> set:
+        raise NotImplementedError
+
     @abc.abstractmethod
     def _add(self, row: Union[Product, User, ProductSeen]):
         raise NotImplementedError
@@ -73,8 +183,160 @@ class SQLAlchemyRepository(AbstractRepository):
         """
         statement = delete(table).where(table.__dict__[column_name] == column_value)
         response = self.session.execute(statement)
+        for instance in loaded_objects(
+            self.session, table, {column_name: column_value}
+        ):
+            self.session.expunge(instance)
         return response.rowcount
 
+    def update_where(
+        self,
+        table,
+        dict_to_filter: dict,
+        values: dict,
+        on_change: dict = None,
+        version_column: str = None,
+    ) -> List[Tuple[dict, dict]]:
+        """
+        this function updates the rows that match dict_to_filter without loading them in
+        the session, with a single UPDATE ... RETURNING when the database returns the old
+        values, otherwise with a SELECT and an UPDATE of the changed columns that checks
+        the version
+        Args:
+            table: table name
+            dict_to_filter: a dict to filter {var1:val1,var2:val2}, all must match
+            values: the values set on the rows {column1:val1,column2:val2}
+            on_change: the values only set on the rows that values change
+            version_column: the version column, incremented on the rows that values change
+        Returns: the old and the new values of every updated row, as dicts
+
+        """
+        # the objects of the session are read again, the statements don't update them
+        for instance in loaded_objects(self.session, table, dict_to_filter):
+            self.session.expire(instance)
+        table = _table_of(table)
+        where = [table.c[column] == value for column, value in dict_to_filter.items()]
+        dialect = self.session.get_bind().dialect.name
+        if dialect in UPDATE_RETURNING_OLD_VALUES:
+            return self._update_returning(
+                table, where, values, on_change or {}, version_column
+            )
+        statement = select(table).where(*where).with_for_update()
+        updated = []
+        for row in self.session.execute(statement).mappings().all():
+            old = dict(row)
+            new = apply_update(old, values, on_change, version_column)
+            changes = {
+                column: new[column] for column in new if new[column] != old[column]
+            }
+            updated.append((old, new))
+            if not changes:
+                continue
+            statement = (
+                update(table)
+                .where(*(column == old[column.name] for column in table.primary_key))
+                .values(changes)
+            )
+            if version_column:
+                statement = statement.where(
+                    table.c[version_column] == old[version_column]
+                )
+            if self.session.execute(statement).rowcount != 1:
+                raise StaleDataError(
+                    f"UPDATE statement on table '{table.name}' expected to update "
+                    f"1 row(s); 0 were matched."
+                )
+        return updated
+
+    def _update_returning(
+        self, table: Table, where: list, values: dict, on_change: dict, version_column
+    ) -> List[Tuple[dict, dict]]:
+        statement = update_returning_statement(
+            table, where, values, on_change, version_column
+        )
+        columns = table.c.keys()
+        return [
+            (
+                dict(zip(columns, row[: len(columns)])),
+                dict(zip(columns, row[len(columns) :])),
+            )
+            for row in self.session.execute(statement)
+        ]
+
+    def delete_returning(self, table, dict_to_filter: dict) -> List[dict]:
+        """
+        this function deletes the rows that match dict_to_filter, with a single
+        DELETE ... RETURNING when the database supports it, otherwise with a SELECT and a
+        DELETE
+        Args:
+            table: table name
+            dict_to_filter: a dict to filter {var1:val1,var2:val2}, all must match
+        Returns: the values of the deleted rows, as dicts
+
+        """
+        for instance in loaded_objects(self.session, table, dict_to_filter):
+            self.session.expunge(instance)
+        table = _table_of(table)
+        where = [table.c[column] == value for column, value in dict_to_filter.items()]
+        if self.session.get_bind().dialect.delete_returning:
+            statement = delete(table).where(*where).returning(*table.c)
+            return [dict(row) for row in self.session.execute(statement).mappings()]
+        statement = select(table).where(*where).with_for_update()
+        rows = [dict(row) for row in self.session.execute(statement).mappings()]
+        if rows:
+            self.session.execute(delete(table).where(*where))
+        return rows
+
+    def bulk_insert(self, table, rows: List[dict]):
+        """
+        this function inserts many rows with a single executemany statement, the rows are not
+        tracked by the session so no events are collected from them
+        Args:
+            table: table name
+            rows: a list of dicts {column1:val1,column2:val2}, all with the same keys
+        Returns:
+
+        """
+        if rows:
+            self.session.execute(insert(table), rows)
+
+    def bulk_increment(self, table: Table, rows: List[dict], counter: str):
+        """
+        this function adds the counter of each row to the stored row with the same primary
+        key, the rows that don't exist yet are inserted, all with a single statement
+        Args:
+            table: a Core table with a primary key
+            rows: a list of dicts with the primary key columns and the counter
+            counter: the name of the column to be incremented
+        Returns:
+
+        """
+        if not rows:
+            return
+        dialect = self.session.get_bind().dialect.name
+        if dialect not in UPSERT_INSERTS:
+            raise NotImplementedError(f"Upserts are not supported on {dialect}")
+        statement = UPSERT_INSERTS[dialect](table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key],
+            set_={counter: table.c[counter] + statement.excluded[counter]},
+        )
+        self.session.execute(statement, rows)
+
+    def filter_existing(self, table, column_name: str, values: Iterable) -> set:
+        """
+        this function returns which of the values are already stored in a column
+        Args:
+            table: table name
+            column_name: the name of the column to be compared
+            values: the values to look for
+        Returns: the set of values found in the table
+
+        """
+        column = table.__dict__[column_name]
+        statement = select(column).where(column.in_(list(values)))
+        return set(self.session.execute(statement).scalars())
+
     def _get(self, table, dict_to_filter: dict):
         """
         this function filters a table by dict_to_filter and returns the first row
@@ -85,10 +347,95 @@ class SQLAlchemyRepository(AbstractRepository):
         Returns: row
 
         """
+        loaded = loaded_objects(self.session, table, dict_to_filter)
+        if loaded:
+            return loaded[0]
         statement = select(table).filter_by(**dict_to_filter)
         response = self.session.execute(statement).scalar()
         if not response:
-            logger.error(f"Error trying to get {table} with {dict_to_filter}")
+            logger.error("Error trying to get %s with %s", table, dict_to_filter)
+            raise HTTPException(
+                status.HTTP_404_NOT_FOUND,
+                "The resource you are trying to access was not found",
+            )
+        return response
+
+
+class AbstractAsyncRepository(abc.ABC):
+    def __init__(self):
+        self.seen = set()  # type: Union[Set[Product], Set[User]]
+
+    async def add(self, row: Union[Product, User, ProductSeen]):
+        await self._add(row)
+        self.seen.add(row)
+
+    async def get(
+        self,
+        table: Union[type[Product], type[User], type[ProductSeen]],
+        dict_to_filter: dict,
+    ) -> Union[Product, User, ProductSeen]:
+        row = await self._get(table, dict_to_filter)
+        if row:
+            self.seen.add(row)
+        return row
+
+    @abc.abstractmethod
+    async def delete(self, *args, **kwargs):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def bulk_insert(
+        self,
+        table: Union[type[Product], type[User], type[ProductSeen]],
+        rows: List[dict],
+    ):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _add(self, row: Union[Product, User, ProductSeen]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def _get(
+        self,
+        table: Union[type[Product], type[User], type[ProductSeen]],
+        dict_to_filter: dict,
+    ) -> Union[Product, User, ProductSeen]:
+        raise NotImplementedError
+
+
+class AsyncSQLAlchemyRepository(AbstractAsyncRepository):
+    """Same operations as SQLAlchemyRepository over an AsyncSession"""
+
+    def __init__(self, session):
+        super().__init__()
+        self.session = session
+
+    async def _add(self, row):
+        self.session.add(row)
+        await self.session.flush([row])
+
+    async def delete(self, table, column_name: str, column_value: str):
+        statement = delete(table).where(table.__dict__[column_name] == column_value)
+        response = await self.session.execute(statement)
+        for instance in loaded_objects(
+            self.session, table, {column_name: column_value}
+        ):
+            self.session.expunge(instance)
+        return response.rowcount
+
+    async def bulk_insert(self, table, rows: List[dict]):
+        if rows:
+            await self.session.execute(insert(table), rows)
+
+    async def _get(self, table, dict_to_filter: dict):
+        loaded = loaded_objects(self.session, table, dict_to_filter)
+        if loaded:
+            return loaded[0]
+        statement = select(table).filter_by(**dict_to_filter)
+        response = (await self.session.execute(statement)).scalar()
+        if not response:
+            logger.error("Error trying to get %s with %s", table, dict_to_filter)
             raise HTTPException(
                 status.HTTP_404_NOT_FOUND,
                 "The resource you are trying to access was not found",
@@ -0,0 +1,282 @@
+"""
+Latency and throughput of the API under load, run it with `python -m benchmarks.bench_api`.
+A catalog is seeded in a temporary SQLite database and the scenarios run against the
+ASGI app in this process, so the numbers only depend on the code and the machine:
+
+- read_heavy: product reads of random skus
+- login_storm: logins of random users
+- admin_writes: product creations and updates, the notifications are discarded
+- mixed: reads, batch reads, logins and writes
+
+The report is printed as JSON, save it with `--output` and pass it as `--baseline` on
+another commit to fail when a scenario got slower than the tolerance.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+SCENARIOS = ("read_heavy", "login_storm", "admin_writes", "mixed")
+# share of every kind of request in the mixed scenario
+MIXED_WEIGHTS = {"read": 80, "batch": 10, "login": 5, "write": 5}
+
+Request = Tuple[str, str, dict]
+
+
+class DiscardedNotification:
+    """The notifications of the writes are counted instead of sent"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, addressees: List, subject: str, body: str):
+        self.sent += 1
+
+
+def _configure_environment(db_path: Path, args):
+    """The settings are read when the app is imported, they are set before"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.pop("DB_REPLICA_URLS", None)
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ["VIEW_RETENTION_IN_PROCESS"] = "false"
+    # the login storm measures the logins, not the rate limiter
+    for setting in (
+        "LOGIN_RATE_LIMIT_IP_CAPACITY",
+        "LOGIN_RATE_LIMIT_IP_PER_MINUTE",
+        "LOGIN_RATE_LIMIT_EMAIL_CAPACITY",
+        "LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE",
+    ):
+        os.environ[setting] = str(10**9)
+
+
+def _percentile(quantiles: List[float], percentile: int) -> float:
+    return round(quantiles[percentile - 1] * 1000, 2)
+
+
+async def _run_scenario(
+    client,
+    name: str,
+    next_request: Callable[[int], Request],
+    requests_number: int,
+    concurrency: int,
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statuses = Counter()
+
+    async def send(i: int):
+        method, url, kwargs = next_request(i)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(requests_number)))
+    elapsed = time.perf_counter() - start
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "scenario": name,
+        "requests": requests_number,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(requests_number / elapsed, 1),
+        "latency_ms": {
+            "p50": _percentile(quantiles, 50),
+            "p95": _percentile(quantiles, 95),
+            "p99": _percentile(quantiles, 99),
+            "max": round(max(latencies) * 1000, 2),
+        },
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def _request_factories(args, headers: dict, rng: random.Random) -> dict:
+    def read(_):
+        sku = f"seed-sku{rng.randrange(args.products)}"
+        return "GET", f"/product/get_product/{sku}", {"headers": headers}
+
+    def batch(_):
+        skus = [f"seed-sku{rng.randrange(args.products)}" for _ in range(20)]
+        return "GET", "/product/batch", {"headers": headers, "params": {"sku": skus}}
+
+    def login(_):
+        email = f"user{rng.randrange(args.users)}@test.com"
+        credentials = {"email": email, "password": "password"}
+        return "POST", "/user/login", {"json": credentials}
+
+    def write(i):
+        product = {
+            "sku": f"bench-sku{i}-{rng.random()}",
+            "name": "name",
+            "price": 1,
+            "brand": "brand",
+            "quantity": 1,
+        }
+        if i % 2 and args.products:
+            # the update keeps the sku, only the other fields change
+            product["sku"] = f"seed-sku{rng.randrange(args.products)}"
+            product["price"] = rng.randrange(1, 100)
+            return (
+                "PUT",
+                f"/product/update_product/{product['sku']}",
+                {"headers": headers, "json": product},
+            )
+        return "POST", "/product/create_product", {"headers": headers, "json": product}
+
+    kinds = list(MIXED_WEIGHTS)
+    weights = list(MIXED_WEIGHTS.values())
+    mixed_factories = {"read": read, "batch": batch, "login": login, "write": write}
+
+    def mixed(i):
+        return mixed_factories[rng.choices(kinds, weights)[0]](i)
+
+    return {
+        "read_heavy": read,
+        "login_storm": login,
+        "admin_writes": write,
+        "mixed": mixed,
+    }
+
+
+async def _run(args) -> List[dict]:
+    import httpx
+
+    import main
+    from logger import logger
+    from service_layer.notification_dispatcher import notification_dispatcher
+
+    # the logs of every request would be part of the measure
+    logger.setLevel(args.log_level)
+
+    sender = DiscardedNotification()
+    notification_dispatcher.sender = sender
+    app = main.create_app()
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+            response = await client.post(
+                "/user/login",
+                json={"email": "super@test.com", "password": "password1"},
+            )
+            headers = {"Authorization": f"Bearer {response.json()['token']}"}
+            factories = _request_factories(args, headers, random.Random(args.seed))
+            results = []
+            for name in args.scenarios:
+                requests_number = args.requests
+                if name == "login_storm":
+                    requests_number = args.logins
+                results.append(
+                    await _run_scenario(
+                        client,
+                        name,
+                        factories[name],
+                        requests_number,
+                        args.concurrency,
+                    )
+                )
+    finally:
+        await app.router.shutdown()
+    return results
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """The scenarios whose p95 latency or throughput is worse than the baseline"""
+    regressions = []
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    for result in report["results"]:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95 > p95_before * (1 + tolerance):
+            regressions.append(
+                f"{result['scenario']}: p95 went from {p95_before}ms to {p95}ms"
+            )
+        throughput = result["requests_per_second"]
+        throughput_before = before["requests_per_second"]
+        if throughput < throughput_before * (1 - tolerance):
+            regressions.append(
+                f"{result['scenario']}: throughput went from {throughput_before} "
+                f"to {throughput} requests per second"
+            )
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--log-level", default="WARNING", choices=("DEBUG", "INFO", "WARNING", "ERROR")
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_name = Path(directory) / "bench"
+        _configure_environment(db_name.with_suffix(".db"), args)
+        import db_script
+
+        db_script.generate_sample_db(db_name, args.products, args.users)
+        results = asyncio.run(_run(args))
+
+    report = {
+        "commit": _commit(),
+        "settings": {
+            "products": args.products,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    if args.baseline:
+        regressions = find_regressions(
+            report, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
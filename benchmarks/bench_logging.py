@@ -0,0 +1,166 @@
+"""
+Logging overhead of a request, run it with `python -m benchmarks.bench_logging`.
+A request writes the INFO lines of a product read: the view, the sessions of the units
+of work and the views recorded, and waits for its query in the middle like a real request.
+The pipelines write to a file and report the time spent logging in the thread of the
+request, the wait of the query is not counted, and the time until the lines are in the
+file:
+
+- before: the handlers write in the thread of the request and the messages are f-strings
+- after: the lines go through the queue of `logger.py` and are written by its listener
+- after_sampled: like after, one of every ten lines of the units of work is written
+- disabled_before and disabled_after: the INFO lines are filtered by the level, the
+  f-strings are built anyway and the lazy messages are not
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import queue
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import logger as app_logger
+
+NAME = "bench_logging"
+
+
+class Product:
+    sku = "seed-sku42"
+    name = "product"
+    price = 10.5
+
+
+def request_eager(views: logging.Logger, uow: logging.Logger, product: Product, query):
+    views.info(f"Getting product with sku: {product.sku}")
+    uow.info("Async database Session was created")
+    query()
+    uow.info("Async database Session closed")
+    views.info(f"Product {product.sku} found: {product.name} at {product.price}")
+    uow.info(f"Creating views of {1} reads")
+    uow.info("Database Session was created")
+    uow.info("Committing changes to database")
+    uow.info("Database Session closed")
+
+
+def request_lazy(views: logging.Logger, uow: logging.Logger, product: Product, query):
+    views.info("Getting product with sku: %s", product.sku)
+    uow.info("Async database Session was created")
+    query()
+    uow.info("Async database Session closed")
+    views.info("Product %s found: %s at %s", product.sku, product.name, product.price)
+    uow.info("Creating views of %d reads", 1)
+    uow.info("Database Session was created")
+    uow.info("Committing changes to database")
+    uow.info("Database Session closed")
+
+
+def _loggers(root: logging.Logger, level: int):
+    root.setLevel(level)
+    root.propagate = False
+    return root.getChild("views"), root.getChild("service_layer.unit_of_work")
+
+
+def _reset(root: logging.Logger):
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def _measure(root, request, args, drain=lambda: None) -> dict:
+    views, uow = root.getChild("views"), root.getChild("service_layer.unit_of_work")
+    product = Product()
+    latencies = []
+    waited = 0.0
+
+    def query():
+        nonlocal waited
+        started = time.perf_counter()
+        time.sleep(args.query_ms / 1000)
+        waited += time.perf_counter() - started
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        waited = 0.0
+        started = time.perf_counter()
+        request(views, uow, product, query)
+        latencies.append(time.perf_counter() - started - waited)
+    drain()
+    written = time.perf_counter() - start
+    return {
+        "per_request_us": {
+            "mean": round(statistics.fmean(latencies) * 1e6, 2),
+            "p50": round(statistics.median(latencies) * 1e6, 2),
+            "p99": round(
+                statistics.quantiles(latencies, n=100, method="inclusive")[98] * 1e6,
+                2,
+            ),
+        },
+        "written_after_s": round(written, 3),
+    }
+
+
+def run_before(path: Path, args, level: int) -> dict:
+    """The synchronous pipeline, as configured before the queue"""
+    root = logging.getLogger(f"{NAME}.before.{level}")
+    _loggers(root, level)
+    handler = logging.StreamHandler(path.open("w"))
+    handler.setFormatter(app_logger.text_formatter)
+    root.addHandler(handler)
+    try:
+        return _measure(root, request_eager, args)
+    finally:
+        _reset(root)
+
+
+def run_after(path: Path, args, level: int, sampling=None) -> dict:
+    root = logging.getLogger(f"{NAME}.after.{level}.{bool(sampling)}")
+    _loggers(root, level)
+    handler = logging.StreamHandler(path.open("w"))
+    handler.setFormatter(app_logger.JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    queue_handler = app_logger.NonBlockingQueueHandler(log_queue)
+    if sampling:
+        queue_handler.addFilter(app_logger.SamplingFilter(sampling, root.name))
+    queue_handler.addFilter(app_logger.RequestIdFilter())
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    token = app_logger.request_id.set("bench")
+    try:
+        return _measure(root, request_lazy, args, listener.stop)
+    finally:
+        app_logger.request_id.reset(token)
+        _reset(root)
+        handler.close()
+
+
+def main(args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "log"
+        return {
+            "requests": args.requests,
+            "query_ms": args.query_ms,
+            "before": run_before(path, args, logging.INFO),
+            "after": run_after(path, args, logging.INFO),
+            "after_sampled": run_after(
+                path,
+                args,
+                logging.INFO,
+                sampling={"service_layer.unit_of_work": 0.1},
+            ),
+            "disabled_before": run_before(path, args, logging.WARNING),
+            "disabled_after": run_after(path, args, logging.WARNING),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--query-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    print(json.dumps(main(args), indent=2))
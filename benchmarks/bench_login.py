@@ -0,0 +1,120 @@
+"""
+Login throughput under concurrency, run it with `python -m benchmarks.bench_login`.
+The same burst of concurrent logins is run with bcrypt in a thread pool and in the
+process pool of the password hasher. Besides the logins per second, it reports the
+worst delay of a ticker coroutine, which is how long the other requests of the worker
+would have been starved during the burst.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from adapters.orm import mapper_registry, start_mappers, users
+from schemas.enums import Roles
+from schemas.user import UserLogin
+from service_layer.password_hasher import PasswordHasher
+from service_layer.unit_of_work import AsyncSqlalchemyUnitOfWork
+from views import user_views
+
+TICK = 0.005
+
+
+async def _max_loop_delay(stop: asyncio.Event) -> float:
+    max_delay = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        max_delay = max(max_delay, time.perf_counter() - start - TICK)
+    return max_delay
+
+
+async def _burst(session_factory, hasher, logins: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    credentials = UserLogin(email="bench@test.com", password="password")
+
+    async def login():
+        async with semaphore:
+            await user_views.login_user(
+                credentials, AsyncSqlalchemyUnitOfWork(session_factory), hasher=hasher
+            )
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_max_loop_delay(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return {
+        "logins": logins,
+        "seconds": round(elapsed, 3),
+        "logins_per_second": round(logins / elapsed, 1),
+        "max_event_loop_delay_ms": round(await ticker * 1000, 1),
+    }
+
+
+def run(logins: int, concurrency: int, rounds: int, workers: int) -> list:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / "bench.db"
+        hashed_password = PasswordHasher(
+            rounds=rounds, executor=ThreadPoolExecutor(max_workers=1)
+        ).hash("password")
+        engine = create_engine(f"sqlite:///{db_path}")
+        mapper_registry.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(
+                insert(users),
+                {
+                    "email": "bench@test.com",
+                    "username": "bench",
+                    "password": hashed_password,
+                    "role": Roles.admin.name,
+                },
+            )
+        engine.dispose()
+        for name, executor in (
+            ("thread_pool", ThreadPoolExecutor(max_workers=workers)),
+            ("process_pool", ProcessPoolExecutor(max_workers=workers)),
+        ):
+            hasher = PasswordHasher(rounds=rounds, executor=executor)
+            # start the workers before the burst
+            hasher.hash("password")
+            session_factory = async_sessionmaker(
+                bind=create_async_engine(f"sqlite+aiosqlite:///{db_path}"),
+                expire_on_commit=False,
+            )
+            result = asyncio.run(_burst(session_factory, hasher, logins, concurrency))
+            hasher.shutdown()
+            results.append(
+                {
+                    "executor": name,
+                    "workers": workers,
+                    "concurrency": concurrency,
+                    "rounds": rounds,
+                    **result,
+                }
+            )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    start_mappers()
+    print(
+        json.dumps(
+            run(args.logins, args.concurrency, args.rounds, args.workers), indent=2
+        )
+    )
@@ -0,0 +1,72 @@
+"""
+Throughput of the message bus, run it with `python -m benchmarks.bench_messagebus`.
+The same events are handled one `handle` call per event and with a single
+`handle_many` call, where the events of the same type are coalesced: the views are
+queued with one call to the recorder and the product changes make one notification.
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from adapters.orm import mapper_registry, start_mappers
+from domain import events
+from schemas.enums import Roles
+from service_layer import messagebus
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+from service_layer.view_recorder import view_recorder
+
+EVENT_FACTORIES = {
+    "ProductViewed": lambda i: events.ProductViewed(
+        sku=f"sku{i % 100}", user_email="bench@test.com", role=Roles.admin
+    ),
+    "ProductDeleted": lambda i: events.ProductDeleted(sku=f"sku{i}"),
+}
+
+
+def run(event_name: str, events_number: int, coalesce: bool) -> dict:
+    batch = [EVENT_FACTORIES[event_name](i) for i in range(events_number)]
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{Path(directory) / 'bench.db'}")
+        mapper_registry.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        uow = SqlalchemyUnitOfWork(session_factory, use_outbox=False)
+        start = time.perf_counter()
+        if coalesce:
+            messagebus.handle_many(batch, uow)
+        else:
+            for event in batch:
+                messagebus.handle(event, uow)
+        # the views are written by the recorder, the write is part of the handling
+        view_recorder.flush(uow)
+        elapsed = time.perf_counter() - start
+        with session_factory() as session:
+            notifications = session.execute(
+                text("SELECT count(*) FROM notification_outbox")
+            ).scalar()
+        engine.dispose()
+    return {
+        "event": event_name,
+        "coalesce": coalesce,
+        "events": events_number,
+        "notifications": notifications,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(events_number / elapsed, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=2000)
+    args = parser.parse_args()
+    start_mappers()
+    results = [
+        run(event_name, args.events, coalesce)
+        for event_name in EVENT_FACTORIES
+        for coalesce in (False, True)
+    ]
+    print(json.dumps(results, indent=2))
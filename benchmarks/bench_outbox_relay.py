@@ -0,0 +1,61 @@
+"""
+Throughput of the outbox relay, run it with `python -m benchmarks.bench_outbox_relay`.
+Every event is a ProductDeleted, so each dispatch refreshes the product cache and
+writes a notification to the notification outbox, like a real product change does.
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from adapters.orm import mapper_registry, outbox, start_mappers
+from domain import events
+from service_layer.outbox_relay import OutboxRelay
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+
+
+def run(events_number: int, batch_size: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{Path(directory) / 'bench.db'}")
+        mapper_registry.metadata.create_all(engine)
+        session_factory = sessionmaker(bind=engine)
+        with session_factory() as session:
+            session.execute(
+                insert(outbox),
+                [
+                    {
+                        "event_type": events.ProductDeleted.__name__,
+                        "payload": events.ProductDeleted(sku=f"sku{i}").json(),
+                    }
+                    for i in range(events_number)
+                ],
+            )
+            session.commit()
+        relay = OutboxRelay(
+            uow_factory=lambda: SqlalchemyUnitOfWork(session_factory, use_outbox=True),
+            batch_size=batch_size,
+        )
+        start = time.perf_counter()
+        dispatched = relay.relay_pending()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+    return {
+        "batch_size": batch_size,
+        "events": dispatched,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(dispatched / elapsed, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100, 500])
+    args = parser.parse_args()
+    start_mappers()
+    results = [run(args.events, batch_size) for batch_size in args.batch_sizes]
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,82 @@
+"""
+Startup time of the API, run it with `python -m benchmarks.bench_startup`.
+Every run is a new interpreter, so the imports are cold like in a new worker. It
+reports how long it takes to import `main`, to build the app with `create_app`, to run
+the startup handlers and to answer the first request.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+# the logs of the app are written to stdout too, the timings are on the marked line
+MARKER = "startup timings: "
+
+RUN = f"""
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+
+async def serve():
+    import httpx
+    await app.router.startup()
+    started = time.perf_counter()
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        await client.get("/openapi.json")
+    answered = time.perf_counter()
+    await app.router.shutdown()
+    return started, answered
+
+started, answered = asyncio.run(serve())
+print({MARKER!r} + json.dumps({{
+    "import": imported - start,
+    "create_app": created - imported,
+    "startup": started - created,
+    "first_request": answered - started,
+    "total": answered - start,
+}}), flush=True)
+"""
+
+
+def run_once(env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", RUN],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+        cwd=Path(__file__).resolve().parent.parent,
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith(MARKER))
+    return json.loads(line[len(MARKER) :])
+
+
+def main(runs: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{Path(directory) / 'b.db'}")
+        timings = [run_once(env) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "median_ms": {
+            phase: round(statistics.median(t[phase] for t in timings) * 1000, 1)
+            for phase in timings[0]
+        },
+        "min_ms": {
+            phase: round(min(t[phase] for t in timings) * 1000, 1)
+            for phase in timings[0]
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(main(args.runs), indent=2))
@@ -1,11 +1,16 @@
-from sqlalchemy import create_engine
+import argparse
+
+from sqlalchemy import create_engine, insert
 from sqlalchemy.orm import sessionmaker
 
-from adapters.orm import mapper_registry
+from adapters.orm import mapper_registry, products, users
 from domain.models import Product, User
 from schemas.enums import Roles
+from service_layer.password_hasher import password_hasher
 from tests.integration.test_uow import insert_product, insert_user
 
+SEEDED_USERS_PASSWORD = "password"
+
 
 def insert_tables_example(session):
     insert_product(session, Product("sku1", "name1", 1, "brand1", 1))
@@ -30,15 +35,57 @@ def insert_tables_example(session):
     )
 
 
-def generate_sample_db(name):
+def insert_catalog(session, products_number: int, users_number: int):
+    """
+    Insert generated products and admin users, the users share the same password so
+    it is hashed only once
+    """
+    if products_number:
+        session.execute(
+            insert(products),
+            [
+                {
+                    "sku": f"seed-sku{i}",
+                    "name": f"name{i}",
+                    "price": 1 + i % 100,
+                    "brand": f"brand{i % 20}",
+                    "quantity": i % 50,
+                }
+                for i in range(products_number)
+            ],
+        )
+    if users_number:
+        password = password_hasher.hash(SEEDED_USERS_PASSWORD)
+        session.execute(
+            insert(users),
+            [
+                {
+                    "email": f"user{i}@test.com",
+                    "username": f"user{i}",
+                    "password": password,
+                    "role": Roles.admin,
+                }
+                for i in range(users_number)
+            ],
+        )
+
+
+def generate_sample_db(name, products_number: int = 0, users_number: int = 0):
     engine = create_engine(f"sqlite:///{name}.db")
     mapper_registry.metadata.drop_all(engine)
     mapper_registry.metadata.create_all(engine)
     session = sessionmaker(bind=engine)()
     insert_tables_example(session)
+    insert_catalog(session, products_number, users_number)
     session.commit()
+    engine.dispose()
 
 
 if __name__ == "__main__":
-    generate_sample_db("product")
+    parser = argparse.ArgumentParser(description="Create a database with example data")
+    parser.add_argument("--name", default="product")
+    parser.add_argument("--products", type=int, default=0)
+    parser.add_argument("--users", type=int, default=0)
+    args = parser.parse_args()
+    generate_sample_db(args.name, args.products, args.users)
     print("Database generated!")
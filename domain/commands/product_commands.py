@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import List, Optional
 
 from domain.commands import Command
 from schemas.product import ProductSchema
@@ -17,8 +18,16 @@ class CreateProduct(Command):
 class UpdateProduct(Command):
     sku: str
     product: ProductSchema
+    # version the client read, the update is rejected when the product has another one
+    version: Optional[int] = None
 
 
 @dataclass
 class DeleteProduct(Command):
     sku: str
+
+
+@dataclass
+class BulkCreateProducts(Command):
+    products: List[ProductSchema]
+    chunk_size: int = 1000
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 from domain.commands.product_commands import Command
 from schemas.enums import Roles
@@ -22,6 +23,8 @@ class MakeUserSuperAdmin(Command):
 class UpdateUser(Command):
     email: str
     new_user: UserRegisterIn
+    # version the client read, the update is rejected when the user has another one
+    version: Optional[int] = None
 
 
 @dataclass
@@ -1,7 +1,10 @@
-from typing import Optional
+from datetime import datetime
+from typing import Optional, List
 
 from pydantic import BaseModel
 
+from schemas.enums import Roles
+
 
 class Event:
     ...
@@ -18,6 +21,13 @@ class ProductModified(Event, BaseModel):
 class ProductViewed(Event, BaseModel):
     sku: str
     user_email: Optional[str]
+    role: Optional[Roles]
+
+
+class ProductsViewed(Event, BaseModel):
+    skus: List[str]
+    user_email: Optional[str]
+    role: Optional[Roles]
 
 
 class ProductCreated(Event, BaseModel):
@@ -26,7 +36,12 @@ class ProductCreated(Event, BaseModel):
     price: float
     brand: str
     quantity: float
+    updated_at: Optional[datetime] = None
 
 
 class ProductDeleted(Event, BaseModel):
     sku: str
+
+
+class ProductsBulkCreated(Event, BaseModel):
+    skus: List[str]
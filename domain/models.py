@@ -1,7 +1,8 @@
+from collections import deque
 from datetime import datetime
-from typing import List
+from typing import Deque
 
-from schemas.enums import Roles
+from schemas.enums import Roles, NotificationStatus
 
 
 class Product:
@@ -13,7 +14,9 @@ class Product:
         self.price: float = price
         self.brand: str = brand
         self.quantity: float = quantity
-        self.events = []  # type: List[events.Event]
+        self.version: int = 1
+        self.updated_at: datetime = datetime.utcnow()
+        self.events = deque()  # type: Deque[events.Event]
 
 
 class User:
@@ -26,7 +29,8 @@ class User:
         self.username: str = username
         self.password: str = password
         self.role: Roles = role
-        self.events = []  # type: List[events.Event]
+        self.version: int = 1
+        self.events = deque()  # type: Deque[events.Event]
 
 
 class ProductSeen:
@@ -37,4 +41,16 @@ class ProductSeen:
         self.user_email: str = user_email
         self.role: Roles = role
         self.date: datetime = datetime.now()
-        self.events = []  # type: List[events.Event]
+        self.events = deque()  # type: Deque[events.Event]
+
+
+class Notification:
+    __tablename__ = "notification_outbox"
+
+    def __init__(self, subject: str, body: str):
+        self.subject: str = subject
+        self.body: str = body
+        self.status: NotificationStatus = NotificationStatus.pending
+        self.attempts: int = 0
+        self.next_attempt_at: datetime = datetime.utcnow()
+        self.events = deque()  # type: Deque[events.Event]
@@ -1,6 +1,14 @@
+import itertools
+import json
 import logging
+import logging.handlers
+import queue
 import sys
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
 
+from decouple import config
 
 # By default, the logging module print the messages through the stderr output. This is not the desired behavior for
 # azure analytics workspace. We want to print from ERROR level and above to stderr and everything else to stdout.
@@ -13,6 +21,19 @@ import sys
 # Level 10: DEBUG
 # Level 0: NOTSET
 
+LOGGER_NAME = "RestAPI_logger"
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+# json or text
+LOG_FORMAT = config("LOG_FORMAT", default="json")
+# levels of some modules, example: service_layer.unit_of_work=WARNING,views=DEBUG
+LOG_LEVELS = config("LOG_LEVELS", default="")
+# share of the INFO and DEBUG lines of some modules that is written, the warnings and
+# errors are always written, example: service_layer.unit_of_work=0.01
+LOG_SAMPLING = config("LOG_SAMPLING", default="")
+
+# set by the middleware for every request, the log lines of the request carry it
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
 
 class InfoFilter(logging.Filter):
     def filter(self, rec: logging.LogRecord):
@@ -22,6 +43,120 @@ class InfoFilter(logging.Filter):
         return rec.levelno <= logging.WARNING
 
 
+class RequestIdFilter(logging.Filter):
+    def filter(self, rec: logging.LogRecord):
+        """Add the id of the current request, it runs in the thread of the request"""
+        rec.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one of every N INFO and DEBUG lines of the modules that are sampled, N is the
+    inverse of their rate. The modules are the names of the loggers under `root`
+    """
+
+    def __init__(self, rates: Dict[str, float], root: str = LOGGER_NAME):
+        super().__init__()
+        self.rates = rates
+        self.root = root
+        self._counters = {}
+        self._every = {}
+
+    def filter(self, rec: logging.LogRecord):
+        if rec.levelno >= logging.WARNING:
+            return True
+        every = self._every.get(rec.name)
+        if every is None:
+            every = self._every[rec.name] = self._sampling_of(rec.name)
+            self._counters[rec.name] = itertools.count()
+        if every == 1:
+            return True
+        if every == 0:
+            return False
+        return next(self._counters[rec.name]) % every == 0
+
+    def _sampling_of(self, name: str) -> int:
+        module = name[len(self.root) + 1 :]
+        prefixes = [
+            prefix
+            for prefix in self.rates
+            if module == prefix or module.startswith(f"{prefix}.")
+        ]
+        if not prefixes:
+            return 1
+        rate = self.rates[max(prefixes, key=len)]
+        return round(1 / rate) if rate > 0 else 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, the time is in UTC"""
+
+    encoder = json.JSONEncoder(default=str)
+
+    def format(self, record: logging.LogRecord) -> str:
+        created = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+        payload = {
+            "time": f"{created}.{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "function": record.funcName,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exception"] = record.exc_text
+        return self.encoder.encode(payload)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts the records in a queue that is written by a listener thread. The message is
+    interpolated here because its arguments may change once the call returns, the
+    rest of the formatting and the writes are done by the listener. The records stay in
+    the process, they are not copied nor made picklable like in `QueueHandler.prepare`
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class ListenerHandler(NonBlockingQueueHandler):
+    """
+    Puts the records in the queue of the listener while it runs. The app starts it on
+    startup and stops it on shutdown, before that and in the scripts that don't start it
+    the records are written by the thread that logs them
+    """
+
+    def __init__(self, listener: logging.handlers.QueueListener):
+        super().__init__(listener.queue)
+        self.listener = listener
+        self.listening = False
+
+    def emit(self, record: logging.LogRecord):
+        if self.listening:
+            super().emit(record)
+        else:
+            self.listener.handle(record)
+
+
+def _parse(setting: str) -> Dict[str, str]:
+    """Parse `module=value` pairs separated by commas"""
+    pairs = (pair.split("=", 1) for pair in setting.split(",") if "=" in pair)
+    return {module.strip(): value.strip() for module, value in pairs}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger of a module, its lines go through the pipeline of the app logger"""
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
 # Format:
 # asctime: The time at which the LogRecord was created (as returned by time.time()).
 # name: The name of the logger used to log the call.
@@ -31,13 +166,17 @@ class InfoFilter(logging.Filter):
 # levelname: The text logging level for the message ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL').
 # message: The logged message, computed as msg % args. This is set when Formatter.format() is invoked.
 
-formatter = logging.Formatter(
+text_formatter = logging.Formatter(
     "%(asctime)s - %(name)s - %(module)s - %(lineno)d - %(funcName)s - %(levelname)s - %("
     "message)s",
     datefmt="%d/%m/%Y %H:%M:%S",
 )
-logger = logging.getLogger("RestAPI_logger")
-logger.setLevel(logging.DEBUG)
+formatter = JsonFormatter() if LOG_FORMAT == "json" else text_formatter
+
+logger = logging.getLogger(LOGGER_NAME)
+logger.setLevel(LOG_LEVEL.upper())
+for module_name, module_level in _parse(LOG_LEVELS).items():
+    get_logger(module_name).setLevel(module_level.upper())
 # handler for stdout
 handler_stdout = logging.StreamHandler(sys.stdout)
 handler_stdout.setLevel(logging.INFO)
@@ -48,5 +187,29 @@ handler_stderr = logging.StreamHandler()
 handler_stderr.setLevel(logging.ERROR)
 handler_stderr.setFormatter(formatter)
 
-logger.addHandler(handler_stdout)
-logger.addHandler(handler_stderr)
+# once started, the request threads only put the records in the queue and the
+# listener writes them
+log_queue = queue.SimpleQueue()
+listener = logging.handlers.QueueListener(
+    log_queue, handler_stdout, handler_stderr, respect_handler_level=True
+)
+queue_handler = ListenerHandler(listener)
+sampling = {module: float(rate) for module, rate in _parse(LOG_SAMPLING).items()}
+if sampling:
+    queue_handler.addFilter(SamplingFilter(sampling))
+queue_handler.addFilter(RequestIdFilter())
+logger.addHandler(queue_handler)
+
+
+def start_listener():
+    """Write the log lines in the listener thread, from the startup of the app"""
+    if not queue_handler.listening:
+        listener.start()
+        queue_handler.listening = True
+
+
+def stop_listener():
+    """Write the lines left in the queue, the next lines are written directly"""
+    if queue_handler.listening:
+        queue_handler.listening = False
+        listener.stop()
@@ -1,17 +1,69 @@
 from fastapi import FastAPI
 
+import config
 from adapters.orm import start_mappers
-from logger import logger
+import logger as app_logger
+from logger import get_logger
+from resources.middleware import assign_request_id, track_database_queries
 from resources.routes import api_router
+from service_layer.notification_dispatcher import notification_dispatcher
+from service_layer.outbox_relay import outbox_relay
+from service_layer.password_hasher import password_hasher
+from service_layer.retention import view_retention
+from service_layer.unit_of_work import database
+from service_layer.view_recorder import view_recorder
 
-app = FastAPI(
-    title="Amazing Product Catalog API",
-)
+logger = get_logger(__name__)
 
-app.include_router(api_router)
-start_mappers()
 
+def create_app(settings: config.Settings = None) -> FastAPI:
+    """
+    Build the API, nothing is connected here: the mappers, the database engines and
+    the background workers are set up on startup and released on shutdown
+    """
+    settings = settings or config.Settings()
+    app = FastAPI(title=settings.title)
+    app.state.settings = settings
+    app.include_router(api_router)
+    app.middleware("http")(track_database_queries)
+    # the last middleware is the outermost, the queries warnings carry the request id
+    app.middleware("http")(assign_request_id)
 
-@app.on_event("startup")
-def startup():
-    logger.info("Application is starting up")
+    @app.on_event("startup")
+    def startup():
+        app_logger.start_listener()
+        logger.info("Application is starting up")
+        start_mappers()
+        database.configure(settings.database_url, settings.async_database_url)
+        database.connect()
+        view_recorder.worker.start()
+        notification_dispatcher.worker.start()
+        if settings.outbox_relay_in_process:
+            outbox_relay.worker.start()
+        if settings.view_retention_in_process:
+            view_retention.worker.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        logger.info("Application is shutting down")
+        if outbox_relay.worker.running:
+            outbox_relay.worker.stop()
+        view_retention.worker.stop()
+        view_recorder.worker.stop()
+        notification_dispatcher.stop()
+        password_hasher.shutdown()
+        await database.dispose_async()
+        app_logger.stop_listener()
+
+    return app
+
+
+def __getattr__(name):
+    """
+    main.app is built on first access for `uvicorn main:app`, importing main doesn't
+    build an app that create_app(settings) would replace
+    """
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
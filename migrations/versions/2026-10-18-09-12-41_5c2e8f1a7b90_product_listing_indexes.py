@@ -0,0 +1,36 @@
+"""product listing indexes
+
+Revision ID: 5c2e8f1a7b90
+Revises: d054542df5b3
+Create Date: 2026-10-18 09:12:41.385201
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5c2e8f1a7b90"
+down_revision = "d054542df5b3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_products_brand_price_id", "products", ["brand", "price", "id"])
+    op.create_index("ix_products_price_id", "products", ["price", "id"])
+    op.create_index("ix_products_name_id", "products", ["name", "id"])
+    op.create_index(
+        "ix_products_in_stock_id",
+        "products",
+        ["id"],
+        sqlite_where=sa.text("quantity > 0"),
+        postgresql_where=sa.text("quantity > 0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_products_in_stock_id", table_name="products")
+    op.drop_index("ix_products_name_id", table_name="products")
+    op.drop_index("ix_products_price_id", table_name="products")
+    op.drop_index("ix_products_brand_price_id", table_name="products")
@@ -0,0 +1,166 @@
+"""product view rollups
+
+Revision ID: 7e2d4a9b1c58
+Revises: c3f0b8d25a17
+Create Date: 2026-10-18 11:20:34.518207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "7e2d4a9b1c58"
+down_revision = "c3f0b8d25a17"
+branch_labels = None
+depends_on = None
+
+ROLES = sa.Enum("admin", "super_admin", "anonymous", name="roles")
+
+
+def _product_seen(key_type, *foreign_keys) -> sa.Table:
+    return sa.Table(
+        "product_seen",
+        sa.MetaData(),
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("product_sku", key_type, *foreign_keys[:1], nullable=False),
+        sa.Column(
+            "date",
+            sa.DateTime(),
+            server_default=sa.text("(CURRENT_TIMESTAMP)"),
+            nullable=False,
+        ),
+        sa.Column("user_email", key_type, *foreign_keys[1:], nullable=False),
+        sa.Column("role", ROLES, server_default="anonymous", nullable=False),
+    )
+
+
+def upgrade() -> None:
+    # the sku and the e-mail were stored in integer columns with foreign keys to ids
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table(
+            "product_seen", copy_from=_product_seen(sa.Integer()), recreate="always"
+        ) as batch_op:
+            batch_op.alter_column(
+                "product_sku", type_=sa.String(), existing_nullable=False
+            )
+            batch_op.alter_column(
+                "user_email", type_=sa.String(), existing_nullable=False
+            )
+    else:
+        op.drop_constraint(
+            "product_seen_product_sku_fkey", "product_seen", type_="foreignkey"
+        )
+        op.drop_constraint(
+            "product_seen_user_email_fkey", "product_seen", type_="foreignkey"
+        )
+        op.alter_column(
+            "product_seen",
+            "product_sku",
+            type_=sa.String(),
+            postgresql_using="product_sku::varchar",
+        )
+        op.alter_column(
+            "product_seen",
+            "user_email",
+            type_=sa.String(),
+            postgresql_using="user_email::varchar",
+        )
+    op.create_index(
+        "ix_product_seen_product_sku_date", "product_seen", ["product_sku", "date"]
+    )
+    op.create_table(
+        "product_views_hourly",
+        sa.Column("product_sku", sa.String(), nullable=False),
+        sa.Column("role", ROLES, nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("views", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("product_sku", "role", "hour"),
+    )
+    op.create_index("ix_product_views_hourly_hour", "product_views_hourly", ["hour"])
+    op.create_table(
+        "product_views_daily",
+        sa.Column("product_sku", sa.String(), nullable=False),
+        sa.Column("role", ROLES, nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("views", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("product_sku", "role", "day"),
+    )
+    op.create_index(
+        "ix_product_views_daily_day_product_sku",
+        "product_views_daily",
+        ["day", "product_sku"],
+    )
+    _backfill_rollups()
+
+
+def _backfill_rollups():
+    if op.get_bind().dialect.name == "sqlite":
+        hour = "strftime('%Y-%m-%d %H:00:00.000000', date)"
+        day = "date(date)"
+    else:
+        hour = "date_trunc('hour', date)"
+        day = "CAST(date AS DATE)"
+    op.execute(
+        "INSERT INTO product_views_hourly (product_sku, role, hour, views)"
+        f" SELECT product_sku, role, {hour}, COUNT(*) FROM product_seen"
+        f" GROUP BY product_sku, role, {hour}"
+    )
+    op.execute(
+        "INSERT INTO product_views_daily (product_sku, role, day, views)"
+        f" SELECT product_sku, role, {day}, COUNT(*) FROM product_seen"
+        f" GROUP BY product_sku, role, {day}"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_product_views_daily_day_product_sku", table_name="product_views_daily"
+    )
+    op.drop_table("product_views_daily")
+    op.drop_index("ix_product_views_hourly_hour", table_name="product_views_hourly")
+    op.drop_table("product_views_hourly")
+    op.drop_index("ix_product_seen_product_sku_date", table_name="product_seen")
+    if op.get_bind().dialect.name == "sqlite":
+        with op.batch_alter_table(
+            "product_seen",
+            copy_from=_product_seen(
+                sa.String(),
+                sa.ForeignKey("products.id"),
+                sa.ForeignKey("users.id"),
+            ),
+            recreate="always",
+        ) as batch_op:
+            batch_op.alter_column(
+                "product_sku", type_=sa.Integer(), existing_nullable=False
+            )
+            batch_op.alter_column(
+                "user_email", type_=sa.Integer(), existing_nullable=False
+            )
+    else:
+        op.alter_column(
+            "product_seen",
+            "product_sku",
+            type_=sa.Integer(),
+            postgresql_using="product_sku::integer",
+        )
+        op.alter_column(
+            "product_seen",
+            "user_email",
+            type_=sa.Integer(),
+            postgresql_using="user_email::integer",
+        )
+        op.create_foreign_key(
+            "product_seen_product_sku_fkey",
+            "product_seen",
+            "products",
+            ["product_sku"],
+            ["id"],
+        )
+        op.create_foreign_key(
+            "product_seen_user_email_fkey",
+            "product_seen",
+            "users",
+            ["user_email"],
+            ["id"],
+        )
@@ -0,0 +1,39 @@
+"""product version
+
+Revision ID: 4b8e1d6f2a93
+Revises: 7e2d4a9b1c58
+Create Date: 2026-10-18 14:32:08.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4b8e1d6f2a93"
+down_revision = "7e2d4a9b1c58"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # sqlite can't add a column whose default is the current time, the table is copied
+    recreate = "always" if op.get_bind().dialect.name == "sqlite" else "auto"
+    with op.batch_alter_table("products", recreate=recreate) as batch_op:
+        batch_op.add_column(
+            sa.Column("version", sa.Integer(), server_default="1", nullable=False)
+        )
+        batch_op.add_column(
+            sa.Column(
+                "updated_at",
+                sa.DateTime(),
+                server_default=sa.text("(CURRENT_TIMESTAMP)"),
+                nullable=False,
+            )
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("updated_at")
+        batch_op.drop_column("version")
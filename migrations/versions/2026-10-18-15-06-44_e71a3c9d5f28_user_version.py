@@ -0,0 +1,28 @@
+"""user version
+
+Revision ID: e71a3c9d5f28
+Revises: 4b8e1d6f2a93
+Create Date: 2026-10-18 15:06:44.671352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e71a3c9d5f28"
+down_revision = "4b8e1d6f2a93"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.add_column(
+            sa.Column("version", sa.Integer(), server_default="1", nullable=False)
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("version")
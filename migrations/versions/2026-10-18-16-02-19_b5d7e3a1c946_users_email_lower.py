@@ -0,0 +1,27 @@
+"""users email lower
+
+Revision ID: b5d7e3a1c946
+Revises: e71a3c9d5f28
+Create Date: 2026-10-18 16:02:19.384127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b5d7e3a1c946"
+down_revision = "e71a3c9d5f28"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # fails when two users have the same e-mail in different cases
+    op.create_index(
+        "ix_users_email_lower", "users", [sa.text("lower(email)")], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_email_lower", table_name="users")
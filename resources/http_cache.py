@@ -0,0 +1,89 @@
+import re
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from decouple import config
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from schemas.product import VersionedProduct
+
+# the ETags of the products and the users start with their version
+IF_MATCH_PATTERN = re.compile(r'"(\d+)(-\d+)?"')
+
+# the product reads need a token, so only the clients keep them and they revalidate
+# them on every read, which keeps the views of the products counted
+PRODUCT_CACHE_CONTROL = config("PRODUCT_CACHE_CONTROL", default="private, no-cache")
+
+
+def entity_tag(product: VersionedProduct) -> str:
+    """
+    The version and the time of the last change, a product deleted and created again
+    starts with the same version
+    """
+    updated_at = product.updated_at.replace(tzinfo=timezone.utc)
+    return f'"{product.version}-{int(updated_at.timestamp())}"'
+
+
+def version_tag(version: int) -> str:
+    """ETag of the resources that only have a version, like the users"""
+    return f'"{version}"'
+
+
+def validators(product: VersionedProduct) -> dict:
+    """The `ETag`, `Last-Modified` and `Cache-Control` headers of a product"""
+    headers = {"Cache-Control": PRODUCT_CACHE_CONTROL}
+    if product.version is not None and product.updated_at is not None:
+        headers["ETag"] = entity_tag(product)
+        headers["Last-Modified"] = format_datetime(
+            product.updated_at.replace(tzinfo=timezone.utc, microsecond=0),
+            usegmt=True,
+        )
+    return headers
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of the tags of an `If-None-Match` header"""
+    if header.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in header.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def is_not_modified(request: Request, product: VersionedProduct) -> bool:
+    """
+    Whether the copy of the client is still valid, `If-None-Match` takes precedence
+    over `If-Modified-Since` like in RFC 9110
+    """
+    if product.version is None or product.updated_at is None:
+        return False
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, entity_tag(product))
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return product.updated_at.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def if_match_version(request: Request) -> Optional[int]:
+    """
+    The version of the ETag of the `If-Match` header, the updates are only applied to
+    that version. There is no precondition without the header or with `*`
+    """
+    if_match = request.headers.get("If-Match", "*").strip()
+    if if_match == "*":
+        return None
+    match = IF_MATCH_PATTERN.fullmatch(if_match)
+    if match is None:
+        raise HTTPException(
+            status_code=400, detail="If-Match must be an ETag sent by the API"
+        )
+    return int(match.group(1))
@@ -0,0 +1,41 @@
+import re
+import uuid
+
+from fastapi import Request
+
+import logger
+from service_layer import query_stats
+
+# the ids sent by the clients are only kept when they are safe to write in the logs
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,128}")
+
+
+async def assign_request_id(request: Request, call_next):
+    """
+    Every log line of a request carries its id, it comes from the `X-Request-ID`
+    header or a new one is generated, and it is sent back in the same header
+    """
+    request_id = request.headers.get("X-Request-ID", "")
+    if not REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = uuid.uuid4().hex
+    token = logger.request_id.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        logger.request_id.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+async def track_database_queries(request: Request, call_next):
+    """
+    Count the queries and the database time of every request, debug mode sends them
+    back in the `X-DB-Queries` and `X-DB-Time-Ms` headers
+    """
+    stats = query_stats.start_request()
+    response = await call_next(request)
+    query_stats.finish_request(stats, request.url.path)
+    if request.app.state.settings.debug:
+        response.headers["X-DB-Queries"] = str(stats.queries)
+        response.headers["X-DB-Time-Ms"] = f"{stats.seconds * 1000:.1f}"
+    return response
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Response
+
+from adapters.database import pool_status
+from service_layer.auth import oauth2_scheme, is_admin_or_super_admin
+from service_layer.metrics import PrometheusExporter, metrics_registry
+from service_layer.unit_of_work import database
+
+router = APIRouter(prefix="/monitoring", tags=["monitoring"])
+# scraped by prometheus, it is served at the root of the API
+metrics_router = APIRouter(tags=["monitoring"])
+prometheus_exporter = PrometheusExporter()
+
+
+@router.get(
+    "/db_pool",
+    dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
+)
+async def get_db_pool_stats():
+    """
+    connections checked out, overflow and checkout wait times of the database pools
+    """
+    return {
+        "sync": pool_status(database.engine),
+        "async": pool_status(database.async_engine),
+        "replicas": {
+            "sync": [pool_status(engine) for engine in database.read_engines],
+            "async": [pool_status(engine) for engine in database.async_read_engines],
+        },
+    }
+
+
+@metrics_router.get("/metrics", response_class=Response)
+async def get_metrics():
+    """
+    handler latencies and errors, queue depth of the message bus and commit durations
+    in the prometheus text format
+    """
+    return Response(
+        prometheus_exporter.export(metrics_registry.collect()),
+        media_type=PrometheusExporter.CONTENT_TYPE,
+    )
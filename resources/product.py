@@ -1,55 +1,215 @@
-from fastapi import APIRouter, Depends
+from typing import List, Optional
+
+from decouple import config
+from fastapi import APIRouter, Depends, Query, Response
 from starlette.requests import Request
 
+from adapters.product_import import parse_products
 from domain.commands import product_commands
-from schemas.product import ProductSchema
+from resources import http_cache
+from schemas.enums import ProductSortField, Roles, SortOrder
+from schemas.product import (
+    ProductBatch,
+    ProductSchema,
+    ProductPage,
+    ProductStats,
+    ProductViews,
+)
 from service_layer import messagebus
 from service_layer.auth import oauth2_scheme, is_admin_or_super_admin
-from service_layer.unit_of_work import SqlalchemyUnitOfWork
+from service_layer.product_cache import product_cache
+from service_layer.unit_of_work import (
+    AsyncSqlalchemyUnitOfWork,
+    request_unit_of_work,
+)
 from views import product_views
 
 router = APIRouter(prefix="/product", tags=["products"])
 
+BATCH_MAX_SKUS = config("BATCH_MAX_SKUS", default=200, cast=int)
+
 
 @router.post(
     "/create_product",
     dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
     status_code=201,
 )
-def create_product(product: ProductSchema):
+async def create_product(
+    product: ProductSchema,
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
     """
     create product
     """
     cmd = product_commands.CreateProduct(**product.dict())
-    messagebus.handle(cmd, SqlalchemyUnitOfWork())
+    await messagebus.handle_async(cmd, uow)
     return {"message": "Product created successfully"}
 
 
+@router.post(
+    "/bulk_create",
+    dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
+)
+async def bulk_create_products(
+    request: Request,
+    chunk_size: int = Query(default=1000, gt=0, le=10000),
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
+    """
+    create products in bulk from a json array, or a ndjson or csv upload, the
+    invalid rows and the rows whose sku already exists are reported by row number
+    """
+    products, invalid = await parse_products(request)
+    cmd = product_commands.BulkCreateProducts(
+        products=[product for _, product in products], chunk_size=chunk_size
+    )
+    result = await messagebus.handle_async(cmd, uow)
+    conflicts = [
+        {
+            "row": products[conflict["index"]][0],
+            "sku": conflict["sku"],
+            "detail": conflict["detail"],
+        }
+        for conflict in result["conflicts"]
+    ]
+    return {"created": result["created"], "conflicts": conflicts, "invalid": invalid}
+
+
+@router.get(
+    "",
+    response_model=ProductPage,
+    dependencies=[Depends(oauth2_scheme)],
+)
+async def list_products(
+    brand: Optional[str] = None,
+    min_price: Optional[float] = Query(default=None, ge=0),
+    max_price: Optional[float] = Query(default=None, ge=0),
+    in_stock: bool = False,
+    sort_by: ProductSortField = ProductSortField.id,
+    order: SortOrder = SortOrder.asc,
+    limit: int = Query(default=50, gt=0, le=200),
+    cursor: Optional[str] = None,
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
+    """
+    list products, pass the next_cursor of a page as cursor to get the next one
+    """
+    return await uow.run_sync(
+        product_views.list_products,
+        brand=brand,
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=in_stock,
+        sort_by=sort_by,
+        order=order,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+@router.get(
+    "/batch",
+    # documented with the schema, the rows are returned as they are without validation
+    responses={200: {"model": ProductBatch}},
+    dependencies=[Depends(oauth2_scheme)],
+)
+async def get_products(
+    request: Request,
+    sku: List[str] = Query(min_items=1, max_items=BATCH_MAX_SKUS),
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
+    """
+    get many products by sku with a single query, example: /product/batch?sku=a&sku=b,
+    the skus that don't exist are reported in missing
+    """
+    return await uow.run_sync(
+        product_views.get_products,
+        sku,
+        user_email=request.state.user.email,
+        user_role=request.state.user.role,
+    )
+
+
 @router.get(
     "/get_product/{sku}",
     response_model=ProductSchema,
     dependencies=[Depends(oauth2_scheme)],
 )
-def get_product(sku: str, request: Request):
+async def get_product(
+    sku: str,
+    request: Request,
+    response: Response,
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
     """
-    get product by sku
+    get product by sku, the product has an ETag and a Last-Modified date, and a 304 is
+    sent when the If-None-Match or If-Modified-Since of the request are still valid
     """
-    product = product_views.get_product(
-        sku, user_email=request.state.user.email, uow=SqlalchemyUnitOfWork()
+    product = await uow.run_sync(
+        product_views.get_product,
+        sku,
+        user_email=request.state.user.email,
+        user_role=request.state.user.role,
     )
+    headers = http_cache.validators(product)
+    if http_cache.is_not_modified(request, product):
+        # the ProductViewed of this read was already handled by the view
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return product
 
 
+@router.get(
+    "/top",
+    response_model=List[ProductViews],
+    dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
+)
+async def get_top_products(
+    limit: int = Query(default=10, gt=0, le=100),
+    days: int = Query(default=7, gt=0, le=365),
+    role: Optional[Roles] = None,
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
+    """
+    most viewed products of the last days, optionally only the views of a role
+    """
+    return await uow.run_sync(
+        product_views.get_top_products, limit=limit, days=days, role=role
+    )
+
+
+@router.get(
+    "/{sku}/stats",
+    response_model=ProductStats,
+    dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
+)
+async def get_product_stats(
+    sku: str,
+    days: int = Query(default=7, gt=0, le=365),
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
+    """
+    views of a product in the last days by day and role, and by hour in the last 24 hours
+    """
+    return await uow.run_sync(product_views.get_product_stats, sku, days=days)
+
+
 @router.put(
     "/update_product/{sku}",
     dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
 )
-def update_product(sku: str, product: ProductSchema):
+async def update_product(
+    sku: str,
+    product: ProductSchema,
+    version: Optional[int] = Depends(http_cache.if_match_version),
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
     """
-    update product by sku
+    update product by sku, with the ETag of a read as If-Match the update is rejected
+    with a 409 when the product changed since that read
     """
-    cmd = product_commands.UpdateProduct(sku, product)
-    messagebus.handle(cmd, SqlalchemyUnitOfWork())
+    cmd = product_commands.UpdateProduct(sku, product, version)
+    await messagebus.handle_async(cmd, uow)
     return {"message": "Product updated successfully"}
 
 
@@ -59,10 +219,23 @@ def update_product(sku: str, product: ProductSchema):
     dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
     status_code=204,
 )
-def delete_product(sku: str):
+async def delete_product(
+    sku: str, uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work)
+):
     """
     delete product by sku
     """
     cmd = product_commands.DeleteProduct(sku)
-    messagebus.handle(cmd, SqlalchemyUnitOfWork())
+    await messagebus.handle_async(cmd, uow)
     return {"message": "Product deleted successfully"}
+
+
+@router.get(
+    "/cache_stats",
+    dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
+)
+async def get_cache_stats():
+    """
+    hit, miss, eviction and expiration counters of the product read model cache
+    """
+    return product_cache.stats()
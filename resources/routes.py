@@ -1,7 +1,9 @@
 from fastapi import APIRouter
 
-from resources import product, user
+from resources import monitoring, product, user
 
 api_router = APIRouter()
 api_router.include_router(product.router)
 api_router.include_router(user.router)
+api_router.include_router(monitoring.router)
+api_router.include_router(monitoring.metrics_router)
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Response
 
 from domain.commands import user_commands
-from schemas.user import UserRegisterIn, UserLogin
+from resources import http_cache
+from schemas.user import UserRegisterIn, UserLogin, UserOut
 from service_layer import messagebus
 from service_layer.auth import oauth2_scheme, is_admin_or_super_admin, is_super_admin
-from service_layer.unit_of_work import SqlalchemyUnitOfWork
+from service_layer.rate_limiter import limit_login_attempts
+from service_layer.unit_of_work import (
+    AsyncSqlalchemyUnitOfWork,
+    request_unit_of_work,
+)
 from views import user_views
 
 router = APIRouter(prefix="/user", tags=["users"])
@@ -15,34 +22,47 @@ router = APIRouter(prefix="/user", tags=["users"])
     dependencies=[Depends(oauth2_scheme), Depends(is_super_admin)],
     status_code=201,
 )
-def register_user(user: UserRegisterIn):
+async def register_user(
+    user: UserRegisterIn, uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work)
+):
     """
     Only super admin can register admin
     """
     cmd = user_commands.RegisterUser(**user.dict())
-    messagebus.handle(cmd, SqlalchemyUnitOfWork())
+    await messagebus.handle_async(cmd, uow)
     return {"message": "User registered successfully"}
 
 
-@router.post("/login", status_code=200)
-def login_user(user: UserLogin):
+@router.post("/login", dependencies=[Depends(limit_login_attempts)], status_code=200)
+async def login_user(user: UserLogin):
     """
-    login user
+    login user, the attempts are rate limited by client address and e-mail
     """
-    token, role = user_views.login_user(user, SqlalchemyUnitOfWork())
+    token, role = await user_views.login_user(
+        user,
+        AsyncSqlalchemyUnitOfWork(read_only=True),
+        rehash_uow=AsyncSqlalchemyUnitOfWork(),
+    )
     return {"token": token, "role": role}
 
 
 @router.get(
     "/get_user/{email}",
+    response_model=UserOut,
     dependencies=[Depends(oauth2_scheme), Depends(is_admin_or_super_admin)],
     status_code=200,
 )
-def get_user(email: str):
+async def get_user(
+    email: str,
+    response: Response,
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
     """
-    get user by email
+    get user by email, its version is sent as the ETag
     """
-    return user_views.get_user_by_email(email, SqlalchemyUnitOfWork())
+    user = await uow.run_sync(user_views.get_user_by_email, email)
+    response.headers["ETag"] = http_cache.version_tag(user.version)
+    return user
 
 
 @router.put(
@@ -50,12 +70,18 @@ def get_user(email: str):
     dependencies=[Depends(oauth2_scheme), Depends(is_super_admin)],
     status_code=200,
 )
-def update_user(email: str, user: UserRegisterIn):
+async def update_user(
+    email: str,
+    user: UserRegisterIn,
+    version: Optional[int] = Depends(http_cache.if_match_version),
+    uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+):
     """
-    update user
+    update user, with the ETag of a read as If-Match the update is rejected with a 409
+    when the user changed since that read
     """
-    cmd = user_commands.UpdateUser(email, user)
-    messagebus.handle(cmd, SqlalchemyUnitOfWork())
+    cmd = user_commands.UpdateUser(email, user, version)
+    await messagebus.handle_async(cmd, uow)
     return {"message": "User updated successfully"}
 
 
@@ -64,12 +90,14 @@ def update_user(email: str, user: UserRegisterIn):
     dependencies=[Depends(oauth2_scheme), Depends(is_super_admin)],
     status_code=204,
 )
-def delete_user(email: str):
+async def delete_user(
+    email: str, uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work)
+):
     """
     delete user
     """
     cmd = user_commands.DeleteUser(email)
-    messagebus.handle(cmd, SqlalchemyUnitOfWork())
+    await messagebus.handle_async(cmd, uow)
 
 
 @router.put(
@@ -77,10 +105,12 @@ def delete_user(email: str):
     dependencies=[Depends(oauth2_scheme), Depends(is_super_admin)],
     status_code=200,
 )
-def make_super_admin(email: str):
+async def make_super_admin(
+    email: str, uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work)
+):
     """
     Make admin super admin
     """
     cmd = user_commands.MakeUserSuperAdmin(email)
-    messagebus.handle(cmd, SqlalchemyUnitOfWork())
+    await messagebus.handle_async(cmd, uow)
     return {"message": "User role changed successfully"}
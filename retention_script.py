@@ -0,0 +1,37 @@
+import argparse
+import json
+
+from service_layer.retention import (
+    HOURLY_ROLLUP_RETENTION_DAYS,
+    RETENTION_BATCH_PAUSE,
+    RETENTION_BATCH_SIZE,
+    VIEW_RETENTION_DAYS,
+    ViewRetention,
+)
+
+
+def compact_views(
+    retention_days: int, hourly_retention_days: int, batch_size: int, batch_pause: float
+) -> dict:
+    retention = ViewRetention(
+        retention_days=retention_days,
+        hourly_retention_days=hourly_retention_days,
+        batch_size=batch_size,
+        batch_pause=batch_pause,
+    )
+    return retention.compact()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Delete the product views and hourly view rollups past retention"
+    )
+    parser.add_argument("--days", type=int, default=VIEW_RETENTION_DAYS)
+    parser.add_argument("--hourly-days", type=int, default=HOURLY_ROLLUP_RETENTION_DAYS)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--batch-pause", type=float, default=RETENTION_BATCH_PAUSE)
+    args = parser.parse_args()
+    report = compact_views(
+        args.days, args.hourly_days, args.batch_size, args.batch_pause
+    )
+    print(json.dumps(report, indent=2))
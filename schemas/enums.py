@@ -7,3 +7,25 @@ class Roles(str, Enum):
     admin = "admin"
     super_admin = "super_admin"
     anonymous = "anonymous"
+
+
+class ProductSortField(str, Enum):
+    """Fields the product listing can be sorted by"""
+
+    id = "id"
+    sku = "sku"
+    name = "name"
+    price = "price"
+
+
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class NotificationStatus(str, Enum):
+    """Delivery status of the notifications of the outbox"""
+
+    pending = "pending"
+    sent = "sent"
+    failed = "failed"
@@ -1,5 +1,10 @@
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel
 
+from schemas.enums import Roles
+
 
 class ProductSchema(BaseModel):
     sku: str
@@ -10,3 +15,47 @@ class ProductSchema(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class VersionedProduct(ProductSchema):
+    """A product and the validators of the HTTP caches, they are not in the body"""
+
+    version: Optional[int] = None
+    updated_at: Optional[datetime] = None
+
+
+class ProductPage(BaseModel):
+    items: List[ProductSchema]
+    # opaque cursor to get the next page, None on the last page
+    next_cursor: Optional[str]
+
+
+class ProductBatch(BaseModel):
+    products: List[VersionedProduct]
+    # requested skus that don't exist
+    missing: List[str]
+
+
+class DailyViews(BaseModel):
+    day: date
+    views: int
+
+
+class HourlyViews(BaseModel):
+    hour: datetime
+    views: int
+
+
+class ProductStats(BaseModel):
+    sku: str
+    days: int
+    total: int
+    by_role: Dict[Roles, int]
+    daily: List[DailyViews]
+    # views of the last 24 hours
+    hourly: List[HourlyViews]
+
+
+class ProductViews(BaseModel):
+    sku: str
+    views: int
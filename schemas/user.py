@@ -1,8 +1,18 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 from schemas.enums import Roles
 
 
+def normalize_email(email: str) -> str:
+    """
+    The e-mails are unique and matched without case, they are stored in lower case and
+    this is the key of an e-mail in the rate limits and the caches of the login
+    """
+    return email.strip().lower()
+
+
 class UserBase(BaseModel):
     email: str
 
@@ -25,3 +35,9 @@ class UserOut(UserBase):
 
     class Config:
         orm_mode = True
+
+
+class VersionedUser(UserOut):
+    """A user and its version, the version is the ETag and is not in the body"""
+
+    version: Optional[int] = None
@@ -1,17 +1,32 @@
+import time
 from datetime import datetime, timedelta
 
 import jwt
 from decouple import config
-from fastapi import HTTPException
+from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer
 from fastapi.security.utils import get_authorization_scheme_param
 from starlette.requests import Request
 
+from adapters.cache import LRUCache
 from domain.models import User
-from logger import logger
+from logger import get_logger
 from schemas.enums import Roles
-from schemas.user import UserRegisterIn
-from service_layer.unit_of_work import SqlalchemyUnitOfWork
+from schemas.user import UserRegisterIn, normalize_email
+from service_layer.unit_of_work import AsyncSqlalchemyUnitOfWork, request_unit_of_work
+
+logger = get_logger(__name__)
+
+# token -> UserRegisterIn, the ttl of each entry never outlives the token expiration
+user_cache = LRUCache(
+    max_size=config("AUTH_CACHE_SIZE", default=10000, cast=int),
+    ttl=config("AUTH_CACHE_TTL", default=60, cast=float),
+)
+# e-mails without an account, the login fails without a query while they are cached
+unknown_account_cache = LRUCache(
+    max_size=config("UNKNOWN_ACCOUNT_CACHE_SIZE", default=10000, cast=int),
+    ttl=config("UNKNOWN_ACCOUNT_CACHE_TTL", default=30, cast=float),
+)
 
 
 class AuthManager:
@@ -24,11 +39,11 @@ class AuthManager:
             }
             return jwt.encode(payload, config("SECRET_KEY"), algorithm="HS256")
         except Exception as ex:
-            logger.error(f"Error while encoding token: {ex}")
+            logger.error("Error while encoding token: %s", ex)
             raise ex
 
     @staticmethod
-    def get_user_from_token(credentials, request, uow):
+    async def get_user_from_token(credentials, request, uow):
         """
         Get user from token
         Args:
@@ -39,35 +54,50 @@ class AuthManager:
         Returns:
 
         """
+        cached_user = user_cache.get(credentials)
+        if cached_user is not None:
+            request.state.user = cached_user
+            return cached_user
         try:
             payload = jwt.decode(
                 credentials, config("SECRET_KEY"), algorithms=["HS256"]
             )
-            user_data = uow.repository.get(
-                User, dict_to_filter={"email": payload["email"]}
-            )
-            request.state.user = user_data
-            return user_data
+            async with uow:
+                user_data = UserRegisterIn.from_orm(
+                    await uow.repository.get(
+                        User, dict_to_filter={"email": payload["email"]}
+                    )
+                )
         except jwt.ExpiredSignatureError:
             raise HTTPException(401, "Token is expired")
         except jwt.InvalidTokenError:
             raise HTTPException(401, "Invalid token")
+        user_cache.set(credentials, user_data, ttl=payload["exp"] - time.time())
+        request.state.user = user_data
+        return user_data
+
+    @staticmethod
+    def invalidate_user(email: str):
+        """Drop the cached tokens of a user, so changes to the user are seen immediately"""
+        user_cache.delete_where(lambda _, user: user.email == email)
+        unknown_account_cache.delete(normalize_email(email))
 
 
 class CustomHHTPBearer(HTTPBearer):
     """
-    Custom HTTP Bearer class to handle user authentication
+    Custom HTTP Bearer class to handle user authentication, the user is read with the
+    unit of work of the request
     """
 
-    async def __call__(self, request: Request):
+    async def __call__(
+        self,
+        request: Request,
+        uow: AsyncSqlalchemyUnitOfWork = Depends(request_unit_of_work),
+    ):
         authorization = request.headers.get("Authorization")
         _, credentials = get_authorization_scheme_param(authorization)
-        uow = SqlalchemyUnitOfWork()
         if credentials:
-            with uow:
-                user_data = AuthManager.get_user_from_token(credentials, request, uow)
-
-                request.state.user = UserRegisterIn.from_orm(user_data)
+            await AuthManager.get_user_from_token(credentials, request, uow)
         else:
             request.state.user = User(role=Roles.anonymous, email="")
 
@@ -0,0 +1,68 @@
+import threading
+from typing import Callable, Optional
+
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class PeriodicWorker:
+    """
+    Runs a target in a daemon thread every `interval` seconds, or earlier when
+    somebody calls `wake`. `stop` runs the target one last time so pending work
+    is not lost on shutdown, unless `run_on_stop` is False.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        target: Callable[[], None],
+        interval: float,
+        run_on_stop: bool = True,
+    ):
+        self.name = name
+        self.target = target
+        self.interval = interval
+        self.run_on_stop = run_on_stop
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info("Background worker %s started", self.name)
+
+    def wake(self):
+        self._wake_event.set()
+
+    def stop(self, timeout: float = None):
+        if self.running:
+            self._stop_event.set()
+            self._wake_event.set()
+            self._thread.join(timeout)
+        self._thread = None
+        if self.run_on_stop:
+            self._run_target()
+        logger.info("Background worker %s stopped", self.name)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            self._run_target()
+
+    def _run_target(self):
+        try:
+            self.target()
+        except Exception:
+            logger.exception("Error running background worker %s", self.name)
@@ -0,0 +1,25 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def batch_handler(handler):
+    """
+    Mark an event handler as batch-capable, the message bus calls it once with the list
+    of the events of the same type that were coalesced instead of once per event
+    """
+    handler.handles_batches = True
+    return handler
+
+
+def check_version(entity, expected_version: Optional[int]):
+    """
+    Reject the change of an entity when the client read another version of it, the
+    commands without a version are applied to the current one
+    """
+    if expected_version is not None and entity.version != expected_version:
+        raise HTTPException(
+            status_code=409,
+            detail=f"The {type(entity).__name__.lower()} was changed by another "
+            f"request, it is at version {entity.version}",
+        )
@@ -1,12 +1,24 @@
+from datetime import datetime
+from typing import Union, List
+
 from fastapi import HTTPException
 from sqlalchemy.exc import IntegrityError
 
 from domain import events
 from domain.commands import product_commands
 from domain.models import Product
-from logger import logger
+from logger import get_logger
 from schemas.product import ProductSchema
-from service_layer.unit_of_work import AbstractUnitOfWork
+from adapters.cache import AbstractCache
+from service_layer.handler import check_version
+from service_layer.product_cache import (
+    cached_product,
+    invalidate_product,
+    product_cache,
+)
+from service_layer.unit_of_work import AbstractUnitOfWork, ConcurrencyConflict
+
+logger = get_logger(__name__)
 
 
 class ProductHandler:
@@ -16,7 +28,7 @@ class ProductHandler:
     ) -> ProductSchema:
         """Create a new product"""
         with uow:
-            logger.info(f"Creating product with sku: {cmd.sku}")
+            logger.info("Creating product with sku: %s", cmd.sku)
             product = Product(
                 sku=cmd.sku,
                 name=cmd.name,
@@ -27,7 +39,7 @@ class ProductHandler:
             try:
                 uow.repository.add(product)
             except IntegrityError:
-                logger.error(f"Product with sku: {product.sku} already exists")
+                logger.error("Product with sku: %s already exists", product.sku)
                 raise HTTPException(status_code=400, detail="Product already exists")
             product.events.append(
                 events.ProductCreated(
@@ -36,58 +48,153 @@ class ProductHandler:
                     price=cmd.price,
                     quantity=cmd.quantity,
                     brand=cmd.brand,
+                    updated_at=product.updated_at,
                 )
             )
             return ProductSchema.from_orm(product)
 
     @staticmethod
-    def update_product(cmd: product_commands.UpdateProduct, uow: AbstractUnitOfWork):
-        """Update a product"""
+    def bulk_create_products(
+        cmd: product_commands.BulkCreateProducts, uow: AbstractUnitOfWork
+    ) -> dict:
+        """
+        Create many products with one multi-row insert per chunk, each chunk is committed
+        on its own. Products whose sku already exists are reported as conflicts with their
+        index in cmd.products instead of failing the whole import.
+        """
+        created, conflicts = [], []
+        skus_in_request = set()
         with uow:
-            logger.info(f"Updating product with sku: {cmd.sku}")
+            logger.info("Creating %d products in bulk", len(cmd.products))
+            for start in range(0, len(cmd.products), cmd.chunk_size):
+                chunk = []
+                for index, product in enumerate(
+                    cmd.products[start : start + cmd.chunk_size], start
+                ):
+                    if product.sku in skus_in_request:
+                        conflicts.append(
+                            {
+                                "index": index,
+                                "sku": product.sku,
+                                "detail": "Duplicated sku in the request",
+                            }
+                        )
+                        continue
+                    skus_in_request.add(product.sku)
+                    chunk.append((index, product))
+                created_skus, chunk_conflicts = ProductHandler._insert_chunk(chunk, uow)
+                created.extend(created_skus)
+                conflicts.extend(chunk_conflicts)
+            if created:
+                uow.events.append(events.ProductsBulkCreated(skus=created))
+        return {"created": len(created), "conflicts": conflicts}
+
+    @staticmethod
+    def _insert_chunk(chunk: List[tuple[int, ProductSchema]], uow: AbstractUnitOfWork):
+        """
+        Insert the products whose sku doesn't exist yet, if another transaction inserts
+        one of them in the meantime the existing skus are checked again once
+        """
+        conflicts = []
+        for attempt in range(2):
+            existing = uow.repository.filter_existing(
+                Product, "sku", [product.sku for _, product in chunk]
+            )
+            conflicts.extend(
+                {"index": index, "sku": product.sku, "detail": "Product already exists"}
+                for index, product in chunk
+                if product.sku in existing
+            )
+            chunk = [
+                (index, product)
+                for index, product in chunk
+                if product.sku not in existing
+            ]
             try:
-                product = uow.repository.get(Product, dict_to_filter={"sku": cmd.sku})
-                product.events.append(
-                    events.ProductModified(
-                        sku=cmd.product.sku,
-                        name=None
-                        if cmd.product.name == product.name
-                        else cmd.product.name,
-                        price=None
-                        if cmd.product.price == product.price
-                        else cmd.product.price,
-                        quantity=None
-                        if cmd.product.quantity == product.quantity
-                        else cmd.product.quantity,
-                        brand=None
-                        if cmd.product.brand == product.brand
-                        else cmd.product.brand,
-                    )
+                uow.repository.bulk_insert(
+                    Product, [product.dict() for _, product in chunk]
                 )
-                ProductHandler._update_product_inplace(product, cmd.product)
                 uow.commit()
+                return [product.sku for _, product in chunk], conflicts
+            except IntegrityError:
+                logger.error("Conflict inserting a chunk of products, retrying")
+                uow.rollback()
+        conflicts.extend(
+            {
+                "index": index,
+                "sku": product.sku,
+                "detail": "Product could not be created",
+            }
+            for index, product in chunk
+        )
+        return [], conflicts
+
+    @staticmethod
+    def update_product(cmd: product_commands.UpdateProduct, uow: AbstractUnitOfWork):
+        """
+        Update a product with a single statement, the version and the time of the last
+        change only move when a field changes
+        """
+        with uow:
+            logger.info("Updating product with sku: %s", cmd.sku)
+            dict_to_filter = {"sku": cmd.sku}
+            if cmd.version is not None:
+                dict_to_filter["version"] = cmd.version
+            try:
+                updated = uow.repository.update_where(
+                    Product,
+                    dict_to_filter,
+                    values=cmd.product.dict(exclude={"sku"}),
+                    # the cached copies of the clients are stale from now on
+                    on_change={"updated_at": datetime.utcnow()},
+                    version_column="version",
+                )
             except IntegrityError:
-                logger.error(f"The parameters are not valid, remember sku is unique")
+                logger.error("The parameters are not valid, remember sku is unique")
                 raise HTTPException(
                     status_code=400,
                     detail="The parameters are not valid, remember sku is unique",
                 )
-
-    @staticmethod
-    def _update_product_inplace(product: Product, product_updated: ProductSchema):
-        product.name = product_updated.name
-        product.price = product_updated.price
-        product.quantity = product_updated.quantity
-        product.brand = product_updated.brand
+            if not updated:
+                # the product doesn't exist or the client read another version of it
+                product = uow.repository.get(Product, dict_to_filter={"sku": cmd.sku})
+                check_version(product, cmd.version)
+                raise ConcurrencyConflict()
+            [(old, new)] = updated
+            uow.events.append(
+                events.ProductModified(
+                    sku=new["sku"],
+                    **{
+                        field: None if old[field] == new[field] else new[field]
+                        for field in ("name", "price", "quantity", "brand")
+                    },
+                )
+            )
+            uow.commit()
 
     @staticmethod
     def delete_product(cmd: product_commands.DeleteProduct, uow: AbstractUnitOfWork):
         """Delete a product"""
         with uow:
-            logger.info(f"Deleting product with sku: {cmd.sku}")
-            product = uow.repository.get(Product, dict_to_filter={"sku": cmd.sku})
-            deleted_product_number = uow.repository.delete(Product, "sku", cmd.sku)
-            if deleted_product_number == 0:
+            logger.info("Deleting product with sku: %s", cmd.sku)
+            deleted = uow.repository.delete_returning(Product, {"sku": cmd.sku})
+            if not deleted:
                 logger.error("Product not found")
                 raise HTTPException(status_code=404, detail="Product not found")
-            product.events.append(events.ProductDeleted(sku=cmd.sku))
+            uow.events.append(events.ProductDeleted(sku=cmd.sku))
+
+    @staticmethod
+    def refresh_cached_product(
+        event: Union[
+            events.ProductModified, events.ProductCreated, events.ProductDeleted
+        ],
+        uow: AbstractUnitOfWork,
+        cache: AbstractCache = None,
+    ):
+        """Keep the product read model cache in sync with product changes"""
+        cache = product_cache if cache is None else cache
+        if isinstance(event, events.ProductCreated):
+            fields = ProductSchema(**event.dict()).dict()
+            cache.set(event.sku, cached_product(fields, 1, event.updated_at))
+        else:
+            invalidate_product(cache, event.sku)
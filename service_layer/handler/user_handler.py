@@ -1,27 +1,30 @@
-from typing import Union
+from collections import defaultdict
+from typing import List, Union
 
 from fastapi import HTTPException
-from passlib.context import CryptContext
-from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
 
 from adapters.notification_system.message_notification import (
     AbstractMessageStrategy,
     FACTORY_MESSAGE,
-)
-from adapters.notification_system.notification_strategies import (
-    EmailNotification,
-    AbstractNotification,
+    ProductChangesDigestStrategy,
 )
 from domain import events
 from domain.commands import user_commands
-from domain.models import User, ProductSeen
-from logger import logger
+from domain.models import User, Notification
+from logger import get_logger
 from schemas.enums import Roles
-from schemas.user import UserRegisterIn
+from schemas.user import UserRegisterIn, normalize_email
+from service_layer.notification_dispatcher import (
+    NotificationDispatcher,
+    notification_dispatcher,
+)
+from service_layer.handler import batch_handler, check_version
+from service_layer.password_hasher import password_hasher
 from service_layer.unit_of_work import AbstractUnitOfWork
+from service_layer.view_recorder import ProductViewRecorder, view_recorder
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = get_logger(__name__)
 
 
 class UserHandler:
@@ -33,9 +36,9 @@ class UserHandler:
         with uow:
             logger.info("Creating user")
             user = User(
-                email=cmd.email,
+                email=normalize_email(cmd.email),
                 username=cmd.username,
-                password=pwd_context.hash(cmd.password),
+                password=password_hasher.hash(cmd.password),
                 role=cmd.role,
             )
             try:
@@ -51,8 +54,15 @@ class UserHandler:
         """Change user role to super admin"""
         with uow:
             logger.info("Changing user role")
-            user = uow.repository.get(User, dict_to_filter={"email": cmd.email})
-            user.role = Roles.super_admin
+            updated = uow.repository.update_where(
+                User,
+                {"email": cmd.email},
+                values={"role": Roles.super_admin},
+                version_column="version",
+            )
+            if not updated:
+                logger.error("User not found")
+                raise HTTPException(status_code=404, detail="User not found")
 
     @staticmethod
     def update_user(cmd: user_commands.UpdateUser, uow: AbstractUnitOfWork):
@@ -61,7 +71,10 @@ class UserHandler:
             logger.info("Updating user")
             try:
                 user = uow.repository.get(User, dict_to_filter={"email": cmd.email})
+                check_version(user, cmd.version)
                 UserHandler._update_user_inplace(user, cmd.new_user)
+                # the password is hashed again with a new salt, so the user always changes
+                user.version += 1
                 uow.commit()
             except IntegrityError:
                 logger.error(
@@ -77,8 +90,8 @@ class UserHandler:
     def _update_user_inplace(user: User, updated_user: UserRegisterIn):
         user.username = updated_user.username
         user.role = updated_user.role
-        user.email = updated_user.email
-        user.password = pwd_context.hash(updated_user.password)
+        user.email = normalize_email(updated_user.email)
+        user.password = password_hasher.hash(updated_user.password)
 
     @staticmethod
     def delete_user(cmd: user_commands.DeleteUser, uow: AbstractUnitOfWork):
@@ -91,35 +104,72 @@ class UserHandler:
                 raise HTTPException(status_code=404, detail="User not found")
 
     @staticmethod
-    def register_view(event: events.ProductViewed, uow: AbstractUnitOfWork):
-        """Create view"""
-        with uow:
-            if not event.user_email:
-                user = User(email="anonymous", role=Roles.anonymous)
-            else:
-                user = uow.repository.get(
-                    User, dict_to_filter={"email": event.user_email}
-                )
-            logger.info("Creating view")
-            product_seen = ProductSeen(
-                product_sku=event.sku, user_email=user.email, role=user.role
+    @batch_handler
+    def register_views(
+        batch: List[Union[events.ProductViewed, events.ProductsViewed]],
+        uow: AbstractUnitOfWork,
+        recorder: ProductViewRecorder = None,
+    ):
+        """
+        Queue the views in the write-behind recorder, they are written in batches. Every
+        viewer is read once for the whole batch and its views are queued together
+        """
+        recorder = recorder or view_recorder
+        viewers = {}
+        skus_by_viewer = defaultdict(list)
+        for event in batch:
+            key = (event.user_email, event.role)
+            if key not in viewers:
+                viewers[key] = UserHandler._get_viewer(event, uow)
+            skus = (
+                event.skus if isinstance(event, events.ProductsViewed) else [event.sku]
             )
-            uow.repository.add(product_seen)
+            skus_by_viewer[viewers[key]].extend(skus)
+        logger.info("Creating views of %d reads", len(batch))
+        for (user_email, role), skus in skus_by_viewer.items():
+            recorder.record_many(skus, user_email=user_email, role=role)
 
     @staticmethod
+    def _get_viewer(
+        event: Union[events.ProductViewed, events.ProductsViewed],
+        uow: AbstractUnitOfWork,
+    ):
+        if not event.user_email:
+            return "anonymous", Roles.anonymous
+        if event.role:
+            return event.user_email, event.role
+        with uow:
+            user = uow.repository.get(User, dict_to_filter={"email": event.user_email})
+        return user.email, user.role
+
+    @staticmethod
+    @batch_handler
     def notify_product_change_to_all_users(
-        event: Union[
-            events.ProductModified, events.ProductCreated, events.ProductDeleted
+        batch: List[
+            Union[
+                events.ProductModified,
+                events.ProductCreated,
+                events.ProductDeleted,
+                events.ProductsBulkCreated,
+            ]
         ],
         uow: AbstractUnitOfWork,
         message_strategy: AbstractMessageStrategy = None,
-        sender_strategy: AbstractNotification = None,
+        dispatcher: NotificationDispatcher = None,
     ):
-        """Notify users about product change"""
-        message_strategy = message_strategy or FACTORY_MESSAGE[type(event)]
-        sender_strategy = sender_strategy or EmailNotification
+        """
+        Notify users about product changes, the message is stored in the notification
+        outbox and sent to every user by the dispatcher in the background. The changes
+        handled together are sent as a single digest
+        """
+        dispatcher = dispatcher or notification_dispatcher
+        if len(batch) == 1:
+            message_strategy = message_strategy or FACTORY_MESSAGE[type(batch[0])]
+            subject, body = message_strategy.create_message_and_subject(batch[0])
+        else:
+            subject, body = ProductChangesDigestStrategy.create_message_and_subject(
+                batch
+            )
         with uow:
-            addressees = list(uow.session.execute(text("SELECT email FROM users")))
-            addressees = [row[0] for row in addressees]
-            subject, body = message_strategy.create_message_and_subject(event)
-            sender_strategy.send(addressees, subject, body)
+            uow.repository.add(Notification(subject=subject, body=body))
+        dispatcher.wake()
@@ -1,74 +1,220 @@
 from __future__ import annotations
 
-import logging
-from typing import List, Dict, Callable, Type, Union
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Callable, Iterable, List, Type, Union
+
+from decouple import config
 
 from domain import commands
 from domain import events
 from domain.commands import product_commands, user_commands
+from logger import get_logger
+from service_layer import metrics
+from service_layer.auth import AuthManager
 from service_layer.handler.product_handler import ProductHandler
 from service_layer.handler.user_handler import UserHandler
-from service_layer.unit_of_work import AbstractUnitOfWork
+from service_layer.product_cache import invalidate_product, product_cache
+from service_layer.unit_of_work import (
+    AbstractUnitOfWork,
+    AbstractAsyncUnitOfWork,
+    ConcurrencyConflict,
+)
 
-logger = logging.getLogger(__name__)
+logger = get_logger(__name__)
 
 Message = Union[commands.Command, events.Event]
 
+# a command whose commit conflicts with another transaction is handled again, it reads
+# the rows again, at most this number of times in total
+COMMAND_MAX_ATTEMPTS = config("COMMAND_MAX_ATTEMPTS", default=3, cast=int)
+
 
 def handle(
     message: Message,
     uow: AbstractUnitOfWork,
 ):
-    queue = [message]
+    """Handle a message and the events it raises, returns the result of the command"""
+    return handle_many([message], uow)
+
+
+def handle_many(
+    messages: Iterable[Message],
+    uow: AbstractUnitOfWork,
+    failed: List[events.Event] = None,
+):
+    """
+    Handle several messages and the events they raise, returns the result of the last
+    command. The events of the same type waiting in the queue are coalesced, so the
+    batch-capable handlers are called once for all of them. The exceptions of the event
+    handlers are logged and don't stop the other handlers, the events whose handlers
+    raised are added to failed when it is given
+    """
+    result = None
+    queue = deque(messages)  # type: Deque[Message]
     while queue:
-        message = queue.pop(0)
+        message = queue.popleft()
+        metrics.QUEUE_DEPTH.observe(len(queue))
         if isinstance(message, events.Event):
-            handle_event(message, queue, uow)
+            handle_events(_coalesce(message, queue), queue, uow, failed)
         elif isinstance(message, commands.Command):
-            handle_command(message, queue, uow)
+            result = handle_command(message, queue, uow)
         else:
             raise Exception(f"{message} was not an Event or Command")
+    return result
+
 
+async def handle_async(
+    message: Message,
+    uow: AbstractAsyncUnitOfWork,
+):
+    """
+    Handle a message without blocking the event loop, the handlers run on the
+    async session of the unit of work
+    """
+    return await uow.run_sync(handle, message)
 
-def handle_event(
-    event: events.Event,
-    queue: List[Message],
+
+def _coalesce(event: events.Event, queue: Deque[Message]) -> List[events.Event]:
+    """
+    Take the queued events of the type of `event`, the events are not moved across a
+    command so it still sees the events that were raised before it
+    """
+    batch = [event]
+    rest = deque()
+    while queue and isinstance(queue[0], events.Event):
+        message = queue.popleft()
+        if type(message) is type(event):
+            batch.append(message)
+        else:
+            rest.append(message)
+    queue.extendleft(reversed(rest))
+    return batch
+
+
+def handle_events(
+    batch: List[events.Event],
+    queue: Deque[Message],
     uow: AbstractUnitOfWork,
+    failed: List[events.Event] = None,
 ):
-    for handler in EVENT_HANDLERS[type(event)]:
-        try:
-            logger.debug("handling event %s with handler %s", event, handler)
+    """Handle events of the same type, the handlers run in order of registration"""
+    event_type = type(batch[0])
+    for handler in EVENT_HANDLERS[event_type]:
+        if getattr(handler, "handles_batches", False):
+            _run_event_handler(handler, event_type, batch, queue, uow, failed)
+        else:
+            for event in batch:
+                _run_event_handler(handler, event_type, event, queue, uow, failed)
+
+
+def _run_event_handler(
+    handler: Callable,
+    event_type: Type[events.Event],
+    event: Union[events.Event, List[events.Event]],
+    queue: Deque[Message],
+    uow: AbstractUnitOfWork,
+    failed: List[events.Event] = None,
+):
+    try:
+        logger.debug("handling event %s with handler %s", event, handler)
+        with _instrumented("event", event_type, handler):
             handler(event, uow=uow)
-            queue.extend(uow.collect_new_events())
-        except Exception:
-            logger.exception("Exception handling event %s", event)
-            continue
+        queue.extend(uow.collect_new_events())
+    except Exception:
+        logger.exception("Exception handling event %s", event)
+        if failed is not None:
+            failed.extend(event if isinstance(event, list) else [event])
 
 
 def handle_command(
     command: commands.Command,
-    queue: List[Message],
+    queue: Deque[Message],
     uow: AbstractUnitOfWork,
 ):
     logger.debug("handling command %s", command)
     try:
         handler = COMMAND_HANDLERS[type(command)]
-        handler(command, uow=uow)
+        result = _run_command_handler(handler, command, uow)
         queue.extend(uow.collect_new_events())
     except Exception:
         logger.exception("Exception handling command %s", command)
         raise
+    if isinstance(command, USER_CACHE_INVALIDATING_COMMANDS):
+        AuthManager.invalidate_user(command.email)
+    if isinstance(command, user_commands.UpdateUser):
+        AuthManager.invalidate_user(command.new_user.email)
+    # the event handlers refresh the cache too, but they run in the relay process when
+    # the outbox is enabled, so the cache of this process is invalidated here
+    if isinstance(command, PRODUCT_CACHE_INVALIDATING_COMMANDS):
+        invalidate_product(product_cache, command.sku)
+    if isinstance(command, product_commands.UpdateProduct):
+        invalidate_product(product_cache, command.product.sku)
+    return result
+
+
+def _run_command_handler(
+    handler: Callable, command: commands.Command, uow: AbstractUnitOfWork
+):
+    """Run the handler again when its commit conflicts, up to COMMAND_MAX_ATTEMPTS"""
+    for attempt in range(1, COMMAND_MAX_ATTEMPTS + 1):
+        try:
+            with _instrumented("command", type(command), handler):
+                return handler(command, uow=uow)
+        except ConcurrencyConflict:
+            if attempt == COMMAND_MAX_ATTEMPTS:
+                raise
+            # the events of the rolled back attempt are raised again by the next one
+            list(uow.collect_new_events())
+            logger.warning(
+                "Conflict handling command %s, attempt %d of %d",
+                command,
+                attempt,
+                COMMAND_MAX_ATTEMPTS,
+            )
+            metrics.COMMAND_RETRIES.labels(command=type(command).__name__).inc()
+
+
+@contextmanager
+def _instrumented(kind: str, message_type: type, handler: Callable):
+    """Record the latency of a handler, and the exception it raises if any"""
+    labels = {
+        "kind": kind,
+        "message": message_type.__name__,
+        "handler": handler.__qualname__,
+    }
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        metrics.HANDLER_ERRORS.labels(**labels).inc()
+        raise
+    finally:
+        metrics.HANDLER_SECONDS.labels(**labels).observe(time.perf_counter() - start)
 
 
 EVENT_HANDLERS = {
-    events.ProductViewed: [UserHandler.register_view],
-    events.ProductModified: [UserHandler.notify_product_change_to_all_users],
-    events.ProductDeleted: [UserHandler.notify_product_change_to_all_users],
-    events.ProductCreated: [UserHandler.notify_product_change_to_all_users],
+    events.ProductViewed: [UserHandler.register_views],
+    events.ProductsViewed: [UserHandler.register_views],
+    events.ProductModified: [
+        ProductHandler.refresh_cached_product,
+        UserHandler.notify_product_change_to_all_users,
+    ],
+    events.ProductDeleted: [
+        ProductHandler.refresh_cached_product,
+        UserHandler.notify_product_change_to_all_users,
+    ],
+    events.ProductCreated: [
+        ProductHandler.refresh_cached_product,
+        UserHandler.notify_product_change_to_all_users,
+    ],
+    events.ProductsBulkCreated: [UserHandler.notify_product_change_to_all_users],
 }  # type: Dict[Type[events.Event], List[Callable]]
 
 COMMAND_HANDLERS = {
     product_commands.CreateProduct: ProductHandler.create_product,
+    product_commands.BulkCreateProducts: ProductHandler.bulk_create_products,
     product_commands.UpdateProduct: ProductHandler.update_product,
     product_commands.DeleteProduct: ProductHandler.delete_product,
     # user commands
@@ -77,3 +223,16 @@ COMMAND_HANDLERS = {
     user_commands.DeleteUser: UserHandler.delete_user,
     user_commands.UpdateUser: UserHandler.update_user,
 }  # type: Dict[Type[commands.Command], Callable]
+
+# commands that change a user, the cached user of their tokens must be dropped
+USER_CACHE_INVALIDATING_COMMANDS = (
+    user_commands.RegisterUser,
+    user_commands.UpdateUser,
+    user_commands.DeleteUser,
+    user_commands.MakeUserSuperAdmin,
+)
+
+PRODUCT_CACHE_INVALIDATING_COMMANDS = (
+    product_commands.UpdateProduct,
+    product_commands.DeleteProduct,
+)
@@ -0,0 +1,313 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+# the default buckets of the prometheus clients, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class Sample(NamedTuple):
+    name: str
+    labels: Dict[str, str]
+    value: float
+
+
+class MetricData(NamedTuple):
+    name: str
+    kind: str
+    help: str
+    samples: List[Sample]
+
+
+class _Metric:
+    """A metric and its children, one child per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}  # type: Dict[Tuple[str, ...], list]
+
+    def labels(self, **labels) -> "_Child":
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        return _Child(self, key)
+
+    def _child_value(self, key: Tuple[str, ...]) -> list:
+        """The mutable value of a child, the caller holds the lock"""
+        value = self._children.get(key)
+        if value is None:
+            value = self._children[key] = self._initial_value()
+        return value
+
+    def _initial_value(self) -> list:
+        return [0.0]
+
+    def collect(self) -> MetricData:
+        with self._lock:
+            children = [(key, list(value)) for key, value in self._children.items()]
+        samples = []
+        for key, value in children:
+            samples.extend(self._samples(dict(zip(self.labelnames, key)), value))
+        return MetricData(self.name, self.kind, self.help, samples)
+
+    def _samples(self, labels: Dict[str, str], value: list) -> List[Sample]:
+        return [Sample(self.name, labels, value[0])]
+
+    # the metrics without labels are used directly
+    def inc(self, amount: float = 1.0):
+        _Child(self, ()).inc(amount)
+
+    def set(self, value: float):
+        _Child(self, ()).set(value)
+
+    def observe(self, value: float):
+        _Child(self, ()).observe(value)
+
+
+class _Child:
+    def __init__(self, metric: _Metric, key: Tuple[str, ...]):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount: float = 1.0):
+        with self._metric._lock:
+            self._metric._child_value(self._key)[0] += amount
+
+    def set(self, value: float):
+        with self._metric._lock:
+            self._metric._child_value(self._key)[0] = value
+
+    def observe(self, value: float):
+        self._metric._observe(self._key, value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+
+class Histogram(_Metric):
+    """Cumulative histogram, the value of a child is [sum, count, *bucket counts]"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _initial_value(self) -> list:
+        return [0.0, 0] + [0] * len(self.buckets)
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        # the observation is counted in its bucket, the buckets are added up on collect
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._child_value(key)
+            child[0] += value
+            child[1] += 1
+            if index < len(self.buckets):
+                child[2 + index] += 1
+
+    def _samples(self, labels: Dict[str, str], value: list) -> List[Sample]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, value[2:]):
+            cumulative += count
+            samples.append(
+                Sample(f"{self.name}_bucket", {**labels, "le": str(bound)}, cumulative)
+            )
+        samples.append(
+            Sample(f"{self.name}_bucket", {**labels, "le": "+Inf"}, value[1])
+        )
+        samples.append(Sample(f"{self.name}_sum", labels, value[0]))
+        samples.append(Sample(f"{self.name}_count", labels, value[1]))
+        return samples
+
+
+class AbstractMetricsExporter(ABC):
+    @abstractmethod
+    def export(self, metrics: List[MetricData]):
+        raise NotImplementedError
+
+
+class PrometheusExporter(AbstractMetricsExporter):
+    """Renders the metrics in the Prometheus text exposition format"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4"
+
+    def export(self, metrics: List[MetricData]) -> str:
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample in metric.samples:
+                lines.append(
+                    f"{sample.name}{self._labels(sample.labels)} "
+                    f"{self._value(sample.value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> str:
+        if not labels:
+            return ""
+        escaped = (
+            f'{name}="{PrometheusExporter._escape(value)}"'
+            for name, value in labels.items()
+        )
+        return "{" + ",".join(escaped) + "}"
+
+    @staticmethod
+    def _escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @staticmethod
+    def _value(value: float) -> str:
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class InMemoryMetricsExporter(AbstractMetricsExporter):
+    """Keeps the exported metrics in memory, like the in-memory readers of OpenTelemetry"""
+
+    def __init__(self):
+        self.exported = []  # type: List[List[MetricData]]
+
+    def export(self, metrics: List[MetricData]):
+        self.exported.append(metrics)
+
+    def get_samples(self, name: str, **labels) -> List[Sample]:
+        """Samples of the last export with the given name and labels"""
+        if not self.exported:
+            return []
+        return [
+            sample
+            for metric in self.exported[-1]
+            for sample in metric.samples
+            if sample.name == name
+            and all(sample.labels.get(key) == value for key, value in labels.items())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}  # type: Dict[str, _Metric]
+        self._exporters = []  # type: List[AbstractMetricsExporter]
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        return self._register(Counter(name, help_, labelnames))
+
+    def gauge(self, name: str, help_: str, labelnames: Sequence[str] = ()):
+        return self._register(Gauge(name, help_, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        return self._register(Histogram(name, help_, labelnames, buckets))
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def collect(self) -> List[MetricData]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return [metric.collect() for metric in metrics]
+
+    def add_exporter(self, exporter: AbstractMetricsExporter):
+        with self._lock:
+            self._exporters.append(exporter)
+
+    def remove_exporter(self, exporter: AbstractMetricsExporter):
+        with self._lock:
+            self._exporters.remove(exporter)
+
+    def export(self):
+        """Push the current metrics to every exporter added to the registry"""
+        metrics = self.collect()
+        with self._lock:
+            exporters = list(self._exporters)
+        for exporter in exporters:
+            exporter.export(metrics)
+
+
+metrics_registry = MetricsRegistry()
+
+HANDLER_SECONDS = metrics_registry.histogram(
+    "messagebus_handler_seconds",
+    "Latency of the command and event handlers",
+    ("kind", "message", "handler"),
+)
+HANDLER_ERRORS = metrics_registry.counter(
+    "messagebus_handler_errors_total",
+    "Exceptions raised by the command and event handlers",
+    ("kind", "message", "handler"),
+)
+COMMAND_RETRIES = metrics_registry.counter(
+    "messagebus_command_retries_total",
+    "Commands handled again because their commit conflicted with another transaction",
+    ("command",),
+)
+QUEUE_DEPTH = metrics_registry.histogram(
+    "messagebus_queue_depth",
+    "Messages waiting in the queue of the bus when a message is dispatched",
+    buckets=DEPTH_BUCKETS,
+)
+COMMIT_SECONDS = metrics_registry.histogram(
+    "uow_commit_seconds",
+    "Duration of the commits of the units of work",
+    ("uow",),
+)
+QUERY_SECONDS = metrics_registry.histogram(
+    "db_query_seconds", "Duration of the database queries"
+)
+SLOW_QUERIES = metrics_registry.counter(
+    "db_slow_queries_total", "Queries slower than the slow query threshold"
+)
+QUERIES_PER_REQUEST = metrics_registry.histogram(
+    "db_queries_per_request",
+    "Database queries made by a request",
+    buckets=DEPTH_BUCKETS,
+)
+QUERY_SECONDS_PER_REQUEST = metrics_registry.histogram(
+    "db_query_seconds_per_request", "Database time spent by a request"
+)
+REPEATED_QUERIES = metrics_registry.counter(
+    "db_repeated_queries_total",
+    "Requests that ran the same statement more than the repeated query threshold",
+)
+PRODUCT_VIEWS_DROPPED = metrics_registry.counter(
+    "product_views_dropped_total",
+    "Product views dropped because the buffer of the view recorder was full",
+)
+PRODUCT_VIEWS_FAILED = metrics_registry.counter(
+    "product_views_failed_total",
+    "Product views of the batches the view recorder failed to write",
+)
+PRODUCT_VIEWS_PENDING = metrics_registry.gauge(
+    "product_views_pending",
+    "Product views waiting in the buffer of the view recorder",
+)
@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from decouple import config
+from sqlalchemy import select, text, update
+
+from adapters.notification_system.notification_strategies import (
+    AbstractNotification,
+    PersistentEmailNotification,
+)
+from adapters.orm import notification_outbox
+from logger import get_logger
+from schemas.enums import NotificationStatus
+from service_layer.background import PeriodicWorker
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+
+logger = get_logger(__name__)
+
+NOTIFICATION_BATCH_SIZE = config("NOTIFICATION_BATCH_SIZE", default=50, cast=int)
+NOTIFICATION_MAX_ATTEMPTS = config("NOTIFICATION_MAX_ATTEMPTS", default=5, cast=int)
+NOTIFICATION_BACKOFF = config("NOTIFICATION_BACKOFF", default=2.0, cast=float)
+NOTIFICATION_POLL_INTERVAL = config(
+    "NOTIFICATION_POLL_INTERVAL", default=5.0, cast=float
+)
+# a claimed notification is not picked up by other dispatchers during this time
+NOTIFICATION_LEASE = config("NOTIFICATION_LEASE", default=60.0, cast=float)
+
+
+class NotificationDispatcher:
+    """
+    Drains the notification outbox in a background thread. Every pending notification
+    is sent to all the users, failed sends are retried with exponential backoff until
+    the max number of attempts is reached.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], SqlalchemyUnitOfWork] = SqlalchemyUnitOfWork,
+        sender: AbstractNotification = None,
+        batch_size: int = NOTIFICATION_BATCH_SIZE,
+        max_attempts: int = NOTIFICATION_MAX_ATTEMPTS,
+        backoff: float = NOTIFICATION_BACKOFF,
+        poll_interval: float = NOTIFICATION_POLL_INTERVAL,
+    ):
+        self.uow_factory = uow_factory
+        self.sender = sender or PersistentEmailNotification()
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.worker = PeriodicWorker(
+            "notification-dispatcher", self.dispatch_pending, interval=poll_interval
+        )
+
+    def wake(self):
+        """Dispatch as soon as possible instead of waiting for the next poll"""
+        self.worker.wake()
+
+    def stop(self):
+        self.worker.stop()
+        if hasattr(self.sender, "close"):
+            self.sender.close()
+
+    def dispatch_pending(self) -> int:
+        """Send the due notifications, returns the number of notifications sent"""
+        sent = 0
+        while True:
+            notifications = self._claim_due_notifications()
+            if not notifications:
+                return sent
+            addressees = self._get_addressees()
+            for notification in notifications:
+                sent += self._send(notification, addressees)
+            if len(notifications) < self.batch_size:
+                return sent
+
+    def _claim_due_notifications(self) -> List:
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=NOTIFICATION_LEASE)
+        claimed = []
+        uow = self.uow_factory()
+        with uow:
+            due = uow.session.execute(
+                select(notification_outbox)
+                .where(notification_outbox.c.status == NotificationStatus.pending)
+                .where(notification_outbox.c.next_attempt_at <= now)
+                .order_by(notification_outbox.c.id)
+                .limit(self.batch_size)
+            ).all()
+            for notification in due:
+                # the lease only moves forward for the dispatcher that wins the update
+                response = uow.session.execute(
+                    update(notification_outbox)
+                    .where(notification_outbox.c.id == notification.id)
+                    .where(
+                        notification_outbox.c.next_attempt_at
+                        == notification.next_attempt_at
+                    )
+                    .values(next_attempt_at=lease_until)
+                )
+                if response.rowcount == 1:
+                    claimed.append(notification)
+        return claimed
+
+    def _get_addressees(self) -> List[str]:
+        uow = self.uow_factory()
+        with uow:
+            return [
+                row[0] for row in uow.session.execute(text("SELECT email FROM users"))
+            ]
+
+    def _send(self, notification, addressees: List[str]) -> int:
+        try:
+            self.sender.send(addressees, notification.subject, notification.body)
+        except Exception as ex:
+            self._register_failure(notification, ex)
+            return 0
+        self._update(
+            notification.id, status=NotificationStatus.sent, sent_at=datetime.utcnow()
+        )
+        return 1
+
+    def _register_failure(self, notification, ex: Exception):
+        attempts = notification.attempts + 1
+        if attempts >= self.max_attempts:
+            logger.error(
+                "Notification %s failed after %d attempts: %s",
+                notification.id,
+                attempts,
+                ex,
+            )
+            self._update(
+                notification.id,
+                status=NotificationStatus.failed,
+                attempts=attempts,
+                last_error=str(ex),
+            )
+            return
+        delay = self.backoff * 2 ** (attempts - 1)
+        logger.warning(
+            "Notification %s failed, retrying in %ss: %s", notification.id, delay, ex
+        )
+        self._update(
+            notification.id,
+            attempts=attempts,
+            next_attempt_at=datetime.utcnow() + timedelta(seconds=delay),
+            last_error=str(ex),
+        )
+
+    def _update(self, notification_id: int, **values):
+        uow = self.uow_factory()
+        with uow:
+            uow.session.execute(
+                update(notification_outbox)
+                .where(notification_outbox.c.id == notification_id)
+                .values(**values)
+            )
+
+
+notification_dispatcher = NotificationDispatcher()
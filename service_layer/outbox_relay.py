@@ -0,0 +1,119 @@
+import time
+from datetime import datetime
+from typing import Callable, List
+
+from decouple import config
+from sqlalchemy import select, update
+
+from adapters.orm import outbox, start_mappers
+from logger import get_logger
+from service_layer import messagebus
+from service_layer.background import PeriodicWorker
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+
+logger = get_logger(__name__)
+
+OUTBOX_BATCH_SIZE = config("OUTBOX_BATCH_SIZE", default=100, cast=int)
+OUTBOX_POLL_INTERVAL = config("OUTBOX_POLL_INTERVAL", default=1.0, cast=float)
+
+
+class OutboxRelay:
+    """
+    Polls the outbox table in batches and dispatches the stored events to the event
+    handlers of the message bus. Events are delivered at least once: if the relay dies
+    in the middle of a batch, the batch is dispatched again, and an event one of whose
+    handlers raised stays pending and is dispatched again by the next poll, to all of
+    its handlers.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], SqlalchemyUnitOfWork] = SqlalchemyUnitOfWork,
+        batch_size: int = OUTBOX_BATCH_SIZE,
+        poll_interval: float = OUTBOX_POLL_INTERVAL,
+    ):
+        self.uow_factory = uow_factory
+        self.batch_size = batch_size
+        self.event_types = {
+            event_type.__name__: event_type for event_type in messagebus.EVENT_HANDLERS
+        }
+        self.worker = PeriodicWorker(
+            "outbox-relay", self.relay_pending, interval=poll_interval
+        )
+
+    def relay_pending(self) -> int:
+        """
+        Dispatch every pending event, returns the number of events dispatched. It stops
+        at a batch with failed events, they are dispatched again by the next poll
+        """
+        dispatched = 0
+        while True:
+            relayed = self.relay_batch()
+            dispatched += relayed
+            if relayed < self.batch_size:
+                return dispatched
+
+    def relay_batch(self) -> int:
+        uow = self.uow_factory()
+        with uow:
+            # other relays skip the locked rows on databases that support it
+            rows = uow.session.execute(
+                select(outbox.c.id, outbox.c.event_type, outbox.c.payload)
+                .where(outbox.c.dispatched_at.is_(None))
+                .order_by(outbox.c.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            done = self._dispatch(rows) if rows else []
+            if done:
+                uow.session.execute(
+                    update(outbox)
+                    .where(outbox.c.id.in_(done))
+                    .values(dispatched_at=datetime.utcnow())
+                )
+        return len(done)
+
+    def _dispatch(self, rows) -> List[int]:
+        """
+        The events of a batch are handled together, so they can be coalesced. Returns
+        the ids of the rows that are done, the ones whose handlers didn't raise and the
+        ones whose event type is unknown
+        """
+        done = []
+        events_of_rows = {}
+        for row in rows:
+            event_type = self.event_types.get(row.event_type)
+            if event_type is None:
+                logger.error(
+                    "Unknown event type %s in outbox row %s", row.event_type, row.id
+                )
+                done.append(row.id)
+                continue
+            events_of_rows[row.id] = event_type.parse_raw(row.payload)
+        failed = []
+        messagebus.handle_many(
+            list(events_of_rows.values()), self.uow_factory(), failed=failed
+        )
+        failed_events = {id(event) for event in failed}
+        for row_id, event in events_of_rows.items():
+            if id(event) in failed_events:
+                logger.warning(
+                    "Event of outbox row %s failed, it stays pending", row_id
+                )
+            else:
+                done.append(row_id)
+        return done
+
+
+def run_forever(relay: OutboxRelay):
+    start_mappers()
+    logger.info("Outbox relay started")
+    while True:
+        if relay.relay_pending() == 0:
+            time.sleep(OUTBOX_POLL_INTERVAL)
+
+
+outbox_relay = OutboxRelay()
+
+if __name__ == "__main__":
+    run_forever(outbox_relay)
@@ -0,0 +1,234 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import greenlet
+from decouple import config
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from sqlalchemy.util import await_only
+
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", default=12, cast=int)
+PASSWORD_HASH_WORKERS = config(
+    "PASSWORD_HASH_WORKERS", default=os.cpu_count() or 1, cast=int
+)
+# operations queued or running in the pool, the callers wait for a free slot
+PASSWORD_HASH_MAX_PENDING = config("PASSWORD_HASH_MAX_PENDING", default=64, cast=int)
+PASSWORD_HASH_WAIT_TIMEOUT = config(
+    "PASSWORD_HASH_WAIT_TIMEOUT", default=5.0, cast=float
+)
+
+# one context per cost in each worker process
+_crypt_contexts = {}
+
+
+def _crypt_context(rounds: int) -> CryptContext:
+    if rounds not in _crypt_contexts:
+        _crypt_contexts[rounds] = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds
+        )
+    return _crypt_contexts[rounds]
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _crypt_context(rounds).hash(password)
+
+
+def _verify_and_update(
+    password: str, hashed_password: str, rounds: int
+) -> Tuple[bool, Optional[str]]:
+    return _crypt_context(rounds).verify_and_update(password, hashed_password)
+
+
+class Slots:
+    """
+    A bounded number of slots taken by threads and by coroutines. The coroutines wait
+    for a slot in their event loop instead of holding a thread, a released slot is
+    handed to the oldest waiter
+    """
+
+    def __init__(self, size: int):
+        self._free = size
+        self._lock = threading.Lock()
+        self._waiters = deque()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                return True
+            return False
+
+    def acquire(self, timeout: float) -> bool:
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                return True
+            handed_over = threading.Event()
+            self._waiters.append(handed_over.set)
+        return handed_over.wait(timeout) or not self._give_up(handed_over.set)
+
+    async def acquire_async(self, timeout: float) -> bool:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free:
+                self._free -= 1
+                return True
+            handed_over = loop.create_future()
+
+            def wake():
+                loop.call_soon_threadsafe(
+                    lambda: handed_over.done() or handed_over.set_result(True)
+                )
+
+            self._waiters.append(wake)
+        try:
+            return await asyncio.wait_for(asyncio.shield(handed_over), timeout)
+        except asyncio.TimeoutError:
+            return not self._give_up(wake)
+        except asyncio.CancelledError:
+            if not self._give_up(wake):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                try:
+                    self._waiters.popleft()()
+                    return
+                except RuntimeError:
+                    # the event loop of the waiter is closed
+                    continue
+            self._free += 1
+
+    def _give_up(self, waiter) -> bool:
+        """False when the slot was handed to the waiter while it gave up"""
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return True
+            return False
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords with bcrypt in a pool of processes, so the CPU time
+    of bcrypt doesn't hold the GIL of the API worker. The number of pending operations
+    is bounded, when the pool is saturated the callers wait for a free slot and get a
+    503 after PASSWORD_HASH_WAIT_TIMEOUT seconds.
+    """
+
+    def __init__(
+        self,
+        rounds: int = BCRYPT_ROUNDS,
+        max_workers: int = PASSWORD_HASH_WORKERS,
+        max_pending: int = PASSWORD_HASH_MAX_PENDING,
+        wait_timeout: float = PASSWORD_HASH_WAIT_TIMEOUT,
+        executor: Executor = None,
+    ):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.wait_timeout = wait_timeout
+        self._executor = executor
+        self._executor_lock = threading.Lock()
+        self._slots = Slots(max_pending)
+
+    def hash(self, password: str) -> str:
+        return self._wait(self._submit(_hash, password, self.rounds))
+
+    def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password, the second value is a new hash when the stored one was made
+        with another cost and must be replaced, None otherwise
+        """
+        return self._wait(
+            self._submit(_verify_and_update, password, hashed_password, self.rounds)
+        )
+
+    async def hash_async(self, password: str) -> str:
+        future = await self._submit_async(_hash, password, self.rounds)
+        return await asyncio.wrap_future(future)
+
+    async def verify_and_update_async(
+        self, password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        future = await self._submit_async(
+            _verify_and_update, password, hashed_password, self.rounds
+        )
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _submit(self, fn, *args) -> Future:
+        if not self._slots.try_acquire():
+            if _in_async_session():
+                acquired = await_only(self._slots.acquire_async(self.wait_timeout))
+            else:
+                acquired = self._slots.acquire(self.wait_timeout)
+            if not acquired:
+                raise _busy()
+        return self._submit_with_slot(fn, *args)
+
+    async def _submit_async(self, fn, *args) -> Future:
+        if not await self._slots.acquire_async(self.wait_timeout):
+            raise _busy()
+        return self._submit_with_slot(fn, *args)
+
+    def _submit_with_slot(self, fn, *args) -> Future:
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _wait(future: Future):
+        if _in_async_session():
+            return await_only(asyncio.wrap_future(future))
+        return future.result()
+
+    def _get_executor(self) -> Executor:
+        with self._executor_lock:
+            if self._executor is None:
+                # spawned workers don't inherit the threads and connections of the API
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+
+def _in_async_session() -> bool:
+    """
+    The sync handlers run in a greenlet of the event loop thread through
+    AsyncSession.run_sync, there the waits are handed to the loop instead of blocking it
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return greenlet.getcurrent().parent is not None
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many password operations in progress, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+
+password_hasher = PasswordHasher()
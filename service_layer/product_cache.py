@@ -0,0 +1,70 @@
+import time
+from datetime import datetime
+from typing import Optional
+
+from decouple import config
+
+from adapters.cache import AbstractCache, LRUCache, SharedCacheStandIn, TieredCache
+
+PRODUCT_CACHE_SIZE = config("PRODUCT_CACHE_SIZE", default=10000, cast=int)
+PRODUCT_CACHE_TTL = config("PRODUCT_CACHE_TTL", default=300, cast=float)
+# local: in-process LRU only, shared: in-process LRU in front of a shared cache
+PRODUCT_CACHE_BACKEND = config("PRODUCT_CACHE_BACKEND", default="local")
+# seconds the reads that started before a change of a product don't cache it, longer
+# than a read of the product takes, replica lag included
+PRODUCT_CACHE_INVALIDATION_TTL = config(
+    "PRODUCT_CACHE_INVALIDATION_TTL", default=10, cast=float
+)
+
+
+def build_product_cache(backend: str = PRODUCT_CACHE_BACKEND) -> AbstractCache:
+    """
+    Build the read model cache of products, the values are the product fields as a dict
+    keyed by sku
+    """
+    local = LRUCache(max_size=PRODUCT_CACHE_SIZE, ttl=PRODUCT_CACHE_TTL)
+    if backend == "local":
+        return local
+    if backend == "shared":
+        return TieredCache(local, SharedCacheStandIn(ttl=PRODUCT_CACHE_TTL))
+    raise ValueError(f"Unknown product cache backend: {backend}")
+
+
+def cached_product(fields: dict, version: int, updated_at: Optional[datetime]) -> dict:
+    """
+    The value cached for a product, its fields and the validators of the HTTP caches.
+    The time of the last change is an ISO string so the shared cache can serialize it
+    """
+    return {
+        **fields,
+        "version": version,
+        "updated_at": updated_at and updated_at.isoformat(),
+    }
+
+
+def cache_product(cache: AbstractCache, sku: str, product: dict, read_at: float):
+    """
+    Cache a product read from the database, read_at is the time the read started. It
+    is not cached when the product changed since then, the read may have returned the
+    old row, nor over a newer version of the product
+    """
+    invalidated_at = cache.peek(_invalidated(sku))
+    if invalidated_at is not None and invalidated_at >= read_at:
+        return
+    cached = cache.peek(sku)
+    if cached is not None and cached["version"] > product["version"]:
+        return
+    cache.set(sku, product)
+
+
+def invalidate_product(cache: AbstractCache, sku: str):
+    """Drop a changed product, the reads that started before don't cache it again"""
+    cache.delete(sku)
+    cache.set(_invalidated(sku), time.time(), ttl=PRODUCT_CACHE_INVALIDATION_TTL)
+
+
+def _invalidated(sku: str) -> tuple:
+    return "invalidated", sku
+
+
+product_cache = build_product_cache()
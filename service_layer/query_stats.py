@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from logger import get_logger
+from service_layer import metrics
+
+logger = get_logger(__name__)
+
+# queries slower than this are logged with their statement
+SLOW_QUERY_THRESHOLD = config("SLOW_QUERY_THRESHOLD", default=0.2, cast=float)
+# a request that runs the same statement this number of times is reported as N+1
+REPEATED_QUERY_THRESHOLD = config("REPEATED_QUERY_THRESHOLD", default=5, cast=int)
+
+
+class QueryStats:
+    """Queries and database time of a request, the statements are counted by text"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+            self.statements[statement] += 1
+
+    def repeated_statements(self, threshold: int = None) -> dict:
+        """The statements that ran at least `threshold` times, with their count"""
+        threshold = threshold or REPEATED_QUERY_THRESHOLD
+        with self._lock:
+            return {
+                statement: count
+                for statement, count in self.statements.items()
+                if count >= threshold
+            }
+
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def start_request() -> QueryStats:
+    """Start counting the queries of the current request"""
+    stats = QueryStats()
+    _query_stats.set(stats)
+    return stats
+
+
+def finish_request(stats: QueryStats, path: str):
+    """Record the totals of a request, and warn about the statements that repeat"""
+    _query_stats.set(None)
+    metrics.QUERIES_PER_REQUEST.observe(stats.queries)
+    metrics.QUERY_SECONDS_PER_REQUEST.observe(stats.seconds)
+    repeated = stats.repeated_statements()
+    if repeated:
+        metrics.REPEATED_QUERIES.inc()
+    for statement, count in repeated.items():
+        logger.warning(
+            "Possible N+1 queries, %s ran the same statement %d times: %s",
+            path,
+            count,
+            statement,
+        )
+
+
+def current_request_stats() -> Optional[QueryStats]:
+    return _query_stats.get()
+
+
+def instrument_engine(engine: Engine):
+    """Time the queries of an engine, use `engine.sync_engine` for async engines"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    metrics.QUERY_SECONDS.observe(elapsed)
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        metrics.SLOW_QUERIES.inc()
+        logger.warning("Slow query took %.3fs: %s", elapsed, statement)
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+def _handle_error(exception_context):
+    """A failed query has no after_cursor_execute, its start is dropped here"""
+    connection = exception_context.connection
+    if exception_context.execution_context is None or connection is None:
+        return
+    started = connection.info.get("query_start")
+    if started:
+        started.pop()
@@ -0,0 +1,119 @@
+import math
+import threading
+import time
+
+from decouple import config
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from adapters.cache import AbstractCache, LRUCache, SharedCacheStandIn
+from logger import get_logger
+from schemas.user import UserLogin, normalize_email
+
+logger = get_logger(__name__)
+
+RATE_LIMIT_STORE_SIZE = config("RATE_LIMIT_STORE_SIZE", default=100000, cast=int)
+# local: buckets of this process only, shared: buckets shared by all the API workers
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="local")
+LOGIN_RATE_LIMIT_IP_CAPACITY = config(
+    "LOGIN_RATE_LIMIT_IP_CAPACITY", default=20, cast=int
+)
+LOGIN_RATE_LIMIT_IP_PER_MINUTE = config(
+    "LOGIN_RATE_LIMIT_IP_PER_MINUTE", default=20, cast=float
+)
+LOGIN_RATE_LIMIT_EMAIL_CAPACITY = config(
+    "LOGIN_RATE_LIMIT_EMAIL_CAPACITY", default=5, cast=int
+)
+LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE = config(
+    "LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE", default=5, cast=float
+)
+
+
+class TokenBucketRateLimiter:
+    """
+    Token bucket per key, every attempt takes a token and the tokens are refilled at a
+    constant rate up to the capacity. The buckets are stored in a cache as
+    [tokens, updated_at], a bucket that is not in the cache is full, so the entries
+    expire once they would have been refilled.
+    """
+
+    def __init__(
+        self, name: str, capacity: int, refill_per_second: float, store: AbstractCache
+    ):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.store = store
+        self._lock = threading.Lock()
+
+    def consume(self, key: str) -> float:
+        """
+        Take a token of the bucket of a key, returns 0 when the attempt is allowed or
+        the seconds until the next token otherwise
+        """
+        store_key = f"{self.name}:{key}"
+        now = time.time()
+        # a shared backend would run this read-modify-write as a server side script
+        with self._lock:
+            bucket = self.store.get(store_key)
+            tokens = float(self.capacity)
+            if bucket is not None:
+                stored_tokens, updated_at = bucket
+                tokens = min(
+                    tokens,
+                    stored_tokens + (now - updated_at) * self.refill_per_second,
+                )
+            if tokens < 1:
+                return (1 - tokens) / self.refill_per_second
+            tokens -= 1
+            self.store.set(
+                store_key,
+                [tokens, now],
+                ttl=(self.capacity - tokens) / self.refill_per_second,
+            )
+        return 0.0
+
+
+def build_rate_limit_store(backend: str = RATE_LIMIT_BACKEND) -> AbstractCache:
+    # the entries expire with the ttl of each bucket, the store ttl only bounds it
+    ttl = 24 * 60 * 60
+    if backend == "local":
+        return LRUCache(max_size=RATE_LIMIT_STORE_SIZE, ttl=ttl)
+    if backend == "shared":
+        return SharedCacheStandIn(ttl=ttl)
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+rate_limit_store = build_rate_limit_store()
+login_ip_limiter = TokenBucketRateLimiter(
+    "login-ip",
+    capacity=LOGIN_RATE_LIMIT_IP_CAPACITY,
+    refill_per_second=LOGIN_RATE_LIMIT_IP_PER_MINUTE / 60,
+    store=rate_limit_store,
+)
+login_email_limiter = TokenBucketRateLimiter(
+    "login-email",
+    capacity=LOGIN_RATE_LIMIT_EMAIL_CAPACITY,
+    refill_per_second=LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE / 60,
+    store=rate_limit_store,
+)
+
+
+async def limit_login_attempts(request: Request, user: UserLogin):
+    """
+    Dependency of the login endpoint, rejects the attempts over the limits of the
+    client address and of the e-mail before the database and bcrypt are reached
+    """
+    client = request.client.host if request.client else "unknown"
+    for limiter, key in (
+        (login_ip_limiter, client),
+        (login_email_limiter, normalize_email(user.email)),
+    ):
+        retry_after = limiter.consume(key)
+        if retry_after:
+            logger.warning("Too many login attempts for %s %s", limiter.name, key)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
@@ -0,0 +1,114 @@
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from decouple import config
+from sqlalchemy import delete, func, select
+
+from adapters.orm import product_seen, product_views_hourly
+from logger import get_logger
+from service_layer.background import PeriodicWorker
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+
+logger = get_logger(__name__)
+
+# raw views older than this are deleted, their counts stay in the rollups
+VIEW_RETENTION_DAYS = config("VIEW_RETENTION_DAYS", default=30, cast=int)
+HOURLY_ROLLUP_RETENTION_DAYS = config(
+    "HOURLY_ROLLUP_RETENTION_DAYS", default=7, cast=int
+)
+RETENTION_BATCH_SIZE = config("RETENTION_BATCH_SIZE", default=5000, cast=int)
+# pause between batches, so the writers get the database between deletes
+RETENTION_BATCH_PAUSE = config("RETENTION_BATCH_PAUSE", default=0.05, cast=float)
+RETENTION_INTERVAL = config("RETENTION_INTERVAL", default=3600.0, cast=float)
+
+
+class ViewRetention:
+    """
+    Compacts the view analytics. The hourly and daily rollups are incremented when
+    the raw views are written, so the raw rows older than the retention are already
+    aggregated and are only deleted, and the hourly rollups are pruned after a shorter
+    retention since the daily rollup keeps their counts. Every batch is deleted in its
+    own transaction, so the locks are held for one batch at most.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], SqlalchemyUnitOfWork] = SqlalchemyUnitOfWork,
+        retention_days: int = VIEW_RETENTION_DAYS,
+        hourly_retention_days: int = HOURLY_ROLLUP_RETENTION_DAYS,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        batch_pause: float = RETENTION_BATCH_PAUSE,
+        interval: float = RETENTION_INTERVAL,
+    ):
+        self.uow_factory = uow_factory
+        self.retention_days = retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        # a compaction can be long, it is not run again when the API stops
+        self.worker = PeriodicWorker(
+            "view-retention", self.compact, interval=interval, run_on_stop=False
+        )
+
+    def compact(self, now: datetime = None) -> dict:
+        """Delete the expired views and hourly rollups, returns the compaction report"""
+        now = now or datetime.now()
+        start = time.perf_counter()
+        raw_rows = self._delete_raw_views(now - timedelta(days=self.retention_days))
+        hourly_rows = self._delete_hourly_rollups(
+            now - timedelta(days=self.hourly_retention_days)
+        )
+        elapsed = time.perf_counter() - start
+        compacted = raw_rows + hourly_rows
+        report = {
+            "raw_rows_deleted": raw_rows,
+            "hourly_rows_deleted": hourly_rows,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(compacted / elapsed, 1) if compacted else 0.0,
+        }
+        logger.info("View retention compacted %d rows: %s", compacted, report)
+        return report
+
+    def _delete_raw_views(self, cutoff: datetime) -> int:
+        deleted = 0
+        while True:
+            # the ids grow with the date, the oldest rows are the first ones
+            expired_ids = (
+                select(product_seen.c.id)
+                .where(product_seen.c.date < cutoff)
+                .order_by(product_seen.c.id)
+                .limit(self.batch_size)
+                .scalar_subquery()
+            )
+            uow = self.uow_factory()
+            with uow:
+                response = uow.session.execute(
+                    delete(product_seen).where(product_seen.c.id.in_(expired_ids))
+                )
+            deleted += response.rowcount
+            if response.rowcount < self.batch_size:
+                return deleted
+            time.sleep(self.batch_pause)
+
+    def _delete_hourly_rollups(self, cutoff: datetime) -> int:
+        """The hourly rollups are deleted one hour per batch"""
+        deleted = 0
+        while True:
+            uow = self.uow_factory()
+            with uow:
+                oldest_hour = uow.session.execute(
+                    select(func.min(product_views_hourly.c.hour))
+                ).scalar()
+                if oldest_hour is None or oldest_hour >= cutoff:
+                    return deleted
+                response = uow.session.execute(
+                    delete(product_views_hourly).where(
+                        product_views_hourly.c.hour == oldest_hour
+                    )
+                )
+            deleted += response.rowcount
+            time.sleep(self.batch_pause)
+
+
+view_retention = ViewRetention()
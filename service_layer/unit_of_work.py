@@ -1,19 +1,62 @@
 from __future__ import annotations
 
+import itertools
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Deque, List, Optional, Sequence
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from fastapi import HTTPException
+from sqlalchemy import TextClause, event, insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from sqlalchemy.orm import ORMExecuteState, Session, SessionTransaction, sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.requests import Request
 
 import config
+from adapters.database import (
+    begin_before_savepoint,
+    build_async_engine,
+    build_engine,
+)
+from adapters.orm import outbox
 from adapters.repositories import repository
-from adapters.repositories.repository import SQLAlchemyRepository
-from logger import logger
+from domain import events
+from adapters.repositories.repository import (
+    SQLAlchemyRepository,
+    AsyncSQLAlchemyRepository,
+)
+from logger import get_logger
+from service_layer import metrics
+from service_layer.query_stats import instrument_engine
+
+logger = get_logger(__name__)
+
+
+class ConcurrencyConflict(HTTPException):
+    """
+    A row written by the unit of work was changed by another transaction since it was
+    read, the changes of the unit of work were rolled back
+    """
+
+    def __init__(self):
+        super().__init__(
+            status_code=409,
+            detail="The resource was changed by another request, read it again",
+        )
 
 
 class AbstractUnitOfWork(ABC):
     repository: repository.AbstractRepository
 
+    def __init__(self):
+        # events that don't belong to a single aggregate, like the ones of bulk operations
+        # and of the statements that change rows without loading them
+        self.events = deque()  # type: Deque[events.Event]
+
     def __enter__(self) -> AbstractUnitOfWork:
         return self
 
@@ -24,9 +67,14 @@ class AbstractUnitOfWork(ABC):
             self.commit()
 
     def collect_new_events(self):
+        while self.events:
+            yield self.events.popleft()
+        # handlers that don't need the database never enter the unit of work
+        if getattr(self, "repository", None) is None:
+            return
         for object_seen in self.repository.seen:
             while object_seen.events:
-                yield object_seen.events.pop(0)
+                yield object_seen.events.popleft()
 
     def commit(self):
         self._commit()
@@ -40,29 +88,485 @@ class AbstractUnitOfWork(ABC):
         raise NotImplementedError
 
 
-SESSION_FACTORY = sessionmaker(bind=create_engine(config.get_db_connection_string()))
+class RoundRobinSessionFactory:
+    """Spreads the sessions of the read-only units of work over the read replicas"""
+
+    def __init__(self, session_factories: Sequence[Callable]):
+        self._session_factories = itertools.cycle(session_factories)
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            session_factory = next(self._session_factories)
+        return session_factory()
+
+
+# set by the commits on the primary database, every request runs in its own context
+_wrote_to_primary: ContextVar[bool] = ContextVar("wrote_to_primary", default=False)
+
+
+def _remember_write():
+    _wrote_to_primary.set(True)
+
+
+def _read_from_primary() -> bool:
+    return _wrote_to_primary.get() and config.is_read_your_writes_enabled()
+
+
+# key of the session info set by the flushes and the statements that write, a commit
+# without writes is not recorded and doesn't send the next reads to the primary
+WROTE = "wrote"
+
+
+@event.listens_for(Session, "after_flush")
+def _remember_flush(session: Session, flush_context):
+    session.info[WROTE] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _remember_statement(state: ORMExecuteState):
+    statement = state.statement
+    if isinstance(statement, TextClause):
+        # a textual statement is taken as a write unless it is a query
+        writes = not statement.text.lstrip().upper().startswith("SELECT")
+    else:
+        writes = statement.is_dml
+    if writes:
+        state.session.info[WROTE] = True
+
+
+class Database:
+    """
+    Engines and session factories of the primary database and its replicas, they are
+    built the first time they are used instead of on import. The app builds them on
+    startup and disposes them on shutdown
+    """
+
+    def __init__(self, url: str = None, async_url: str = None):
+        self.url = url
+        self.async_url = async_url
+        self._lock = threading.Lock()
+        self._state = None  # type: Optional[dict]
+
+    def configure(self, url: str = None, async_url: str = None):
+        """Use other connection strings, the engines of the previous are disposed"""
+        with self._lock:
+            if (url, async_url) == (self.url, self.async_url):
+                return
+            self._dispose()
+            self.url = url
+            self.async_url = async_url
+
+    def connect(self):
+        """Build the engines now, so the first request doesn't pay for it"""
+        self._get_state()
+
+    def dispose(self):
+        with self._lock:
+            self._dispose()
+
+    async def dispose_async(self):
+        """Same as dispose, the connections of the async engines are closed too"""
+        with self._lock:
+            state, self._state = self._state, None
+        if state is None:
+            return
+        for engine in (state["engine"], *state["read_engines"]):
+            engine.dispose()
+        for engine in (state["async_engine"], *state["async_read_engines"]):
+            await engine.dispose()
+
+    def _dispose(self):
+        if self._state is None:
+            return
+        for engine in (self._state["engine"], *self._state["read_engines"]):
+            engine.dispose()
+        # the connections of the async engines can only be closed by the event loop
+        for engine in (self._state["async_engine"], *self._state["async_read_engines"]):
+            engine.sync_engine.dispose(close=False)
+        self._state = None
+
+    def _get_state(self) -> dict:
+        with self._lock:
+            if self._state is None:
+                self._state = self._build()
+            return self._state
+
+    def _build(self) -> dict:
+        url = self.url or config.get_db_connection_string()
+        async_url = self.async_url or (
+            config.to_async_connection_string(url)
+            if self.url
+            else config.get_async_db_connection_string()
+        )
+        replica_urls = config.get_db_replica_connection_strings()
+        engine = build_engine(url)
+        read_engines = [build_engine(replica_url) for replica_url in replica_urls]
+        async_engine = build_async_engine(async_url)
+        async_read_engines = [
+            build_async_engine(config.to_async_connection_string(replica_url))
+            for replica_url in replica_urls
+        ]
+        for sync_engine in (engine, *read_engines):
+            instrument_engine(sync_engine)
+        for async_engine_ in (async_engine, *async_read_engines):
+            instrument_engine(async_engine_.sync_engine)
+        session_factory = sessionmaker(bind=engine)
+        # objects are used after the commit in async code, where lazy loads are not
+        # possible
+        async_session_factory = async_sessionmaker(
+            bind=async_engine, expire_on_commit=False
+        )
+        return {
+            "engine": engine,
+            "session_factory": session_factory,
+            "read_engines": read_engines,
+            "read_session_factory": (
+                RoundRobinSessionFactory(
+                    [sessionmaker(bind=read_engine) for read_engine in read_engines]
+                )
+                if read_engines
+                else session_factory
+            ),
+            "async_engine": async_engine,
+            "async_session_factory": async_session_factory,
+            "async_read_engines": async_read_engines,
+            "async_read_session_factory": (
+                RoundRobinSessionFactory(
+                    [
+                        async_sessionmaker(bind=read_engine, expire_on_commit=False)
+                        for read_engine in async_read_engines
+                    ]
+                )
+                if async_read_engines
+                else async_session_factory
+            ),
+        }
+
+    @property
+    def engine(self) -> Engine:
+        return self._get_state()["engine"]
+
+    @property
+    def session_factory(self) -> Callable[[], Session]:
+        return self._get_state()["session_factory"]
+
+    @property
+    def read_engines(self) -> List[Engine]:
+        return self._get_state()["read_engines"]
+
+    @property
+    def read_session_factory(self) -> Callable[[], Session]:
+        return self._get_state()["read_session_factory"]
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        return self._get_state()["async_engine"]
+
+    @property
+    def async_session_factory(self) -> Callable[[], AsyncSession]:
+        return self._get_state()["async_session_factory"]
+
+    @property
+    def async_read_engines(self) -> List[AsyncEngine]:
+        return self._get_state()["async_read_engines"]
+
+    @property
+    def async_read_session_factory(self) -> Callable[[], AsyncSession]:
+        return self._get_state()["async_read_session_factory"]
+
+
+database = Database()
 
 
 class SqlalchemyUnitOfWork(AbstractUnitOfWork):
-    def __init__(self, session_factory=SESSION_FACTORY):
+    """
+    The read-only units of work are used by the views, they query the read replicas and
+    never write, the rest go to the primary database. A `with uow:` inside another one
+    is a savepoint of the transaction of the outer block, not a new session. The
+    session is closed when the outer block ends, unless close_on_exit is False or the
+    session was given, like the one of an AsyncSqlalchemyUnitOfWork
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        use_outbox: bool = None,
+        read_only: bool = False,
+        read_session_factory=None,
+        close_on_exit: bool = True,
+        session: Session = None,
+    ):
         super().__init__()
-        self.session_factory = session_factory
+        self.session = session
+        self.close_on_exit = close_on_exit and session is None
+        if session is not None:
+            self.repository = SQLAlchemyRepository(session)
+            session_factory = lambda: session
+        # savepoints of the nested blocks, the innermost last
+        self._savepoints = []  # type: List[SessionTransaction]
+        self._depth = 0
+        self.session_factory = session_factory or database.session_factory
+        self.read_session_factory = read_session_factory or (
+            database.read_session_factory
+            if session_factory is None
+            else session_factory
+        )
+        self.read_only = read_only
+        self.use_outbox = (
+            config.is_outbox_enabled() if use_outbox is None else use_outbox
+        )
 
     def __enter__(self):
-        self.session = self.session_factory()
-        logger.info("Database Session was created")
-        self.repository = SQLAlchemyRepository(self.session)
+        if self._depth:
+            begin_before_savepoint(self.session.connection())
+            self._savepoints.append(self.session.begin_nested())
+        elif self.session is None:
+            if self.read_only and not _read_from_primary():
+                self.session = self.read_session_factory()
+            else:
+                self.session = self.session_factory()
+            logger.info("Database Session was created")
+            self.repository = SQLAlchemyRepository(self.session)
+        self._depth += 1
         return super().__enter__()
 
-    def __exit__(self, *args):
-        super().__exit__(*args)
-        logger.info("Database Session closed")
-        self.session.close()
+    def __exit__(self, exn_type, exn_value, traceback):
+        try:
+            super().__exit__(exn_type, exn_value, traceback)
+        finally:
+            self._depth -= 1
+            if self._depth:
+                self._savepoints.pop()
+            elif self.close_on_exit:
+                self.close()
+        if exn_type is not None and issubclass(exn_type, StaleDataError):
+            # a statement of the handler found a row changed by another transaction
+            raise ConcurrencyConflict() from exn_value
+
+    def close(self):
+        """Close the session, the next block opens a new one"""
+        if self.session is not None:
+            logger.info("Database Session closed")
+            self.session.close()
+            self.session = None
 
     def _commit(self):
+        if self._savepoints:
+            if self._savepoints[-1].is_active:
+                self._savepoints[-1].commit()
+            return
+        if self.read_only:
+            # the read transaction of a shared session is ended when it is closed, a
+            # rollback would expire the objects it loaded
+            if self.close_on_exit:
+                self.session.rollback()
+            return
         logger.info("Committing changes to database")
-        self.session.commit()
+        start = time.perf_counter()
+        if self.use_outbox:
+            self._write_events_to_outbox()
+        try:
+            self.session.commit()
+        except StaleDataError:
+            self.session.rollback()
+            raise ConcurrencyConflict()
+        if self.session.info.pop(WROTE, False):
+            metrics.COMMIT_SECONDS.labels(uow="sync").observe(
+                time.perf_counter() - start
+            )
+            _remember_write()
+
+    def _write_events_to_outbox(self):
+        """The events leave the objects here, so they are only handled by the relay"""
+        rows = [
+            {"event_type": type(event).__name__, "payload": event.json()}
+            for event in self.collect_new_events()
+        ]
+        if rows:
+            self.session.execute(insert(outbox), rows)
 
     def rollback(self):
+        if self._savepoints:
+            if self._savepoints[-1].is_active:
+                logger.info("Rolling back to savepoint")
+                self._savepoints[-1].rollback()
+            return
         logger.info("Rolling back changes to database")
         self.session.rollback()
+        self.session.info.pop(WROTE, None)
+
+
+class AbstractAsyncUnitOfWork(ABC):
+    repository: repository.AbstractAsyncRepository
+
+    async def __aenter__(self) -> AbstractAsyncUnitOfWork:
+        return self
+
+    async def __aexit__(self, exn_type, exn_value, traceback):
+        if exn_type:
+            await self.rollback()
+        else:
+            await self.commit()
+
+    def collect_new_events(self):
+        for object_seen in self.repository.seen:
+            while object_seen.events:
+                yield object_seen.events.popleft()
+
+    async def commit(self):
+        await self._commit()
+
+    @abstractmethod
+    async def run_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run sync code that expects an AbstractUnitOfWork as the `uow` argument"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def _commit(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def rollback(self):
+        raise NotImplementedError
+
+
+class AsyncSqlalchemyUnitOfWork(AbstractAsyncUnitOfWork):
+    """
+    Same as SqlalchemyUnitOfWork over an AsyncSession, the session is opened on first
+    use and shared by the blocks and the sync code run by run_sync, nested blocks are
+    savepoints
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        read_only: bool = False,
+        read_session_factory=None,
+        close_on_exit: bool = True,
+    ):
+        super().__init__()
+        self.session = None  # type: Optional[AsyncSession]
+        self.close_on_exit = close_on_exit
+        self._savepoints = []
+        self._depth = 0
+        self.session_factory = session_factory or database.async_session_factory
+        self.read_session_factory = read_session_factory or (
+            database.async_read_session_factory
+            if session_factory is None
+            else session_factory
+        )
+        self.read_only = read_only
+
+    def _session_factory(self):
+        if self.read_only and not _read_from_primary():
+            return self.read_session_factory
+        return self.session_factory
+
+    def _get_session(self) -> AsyncSession:
+        if self.session is None:
+            self.session = self._session_factory()()
+            logger.info("Async database Session was created")
+            self.repository = AsyncSQLAlchemyRepository(self.session)
+        return self.session
+
+    async def __aenter__(self):
+        session = self._get_session()
+        if self._depth:
+            await session.run_sync(
+                lambda sync_session: begin_before_savepoint(sync_session.connection())
+            )
+            self._savepoints.append(await session.begin_nested())
+        self._depth += 1
+        return await super().__aenter__()
+
+    async def __aexit__(self, *args):
+        try:
+            await super().__aexit__(*args)
+        finally:
+            self._depth -= 1
+            if self._depth:
+                self._savepoints.pop()
+            elif self.close_on_exit:
+                await self.close()
+
+    async def close(self):
+        """Close the session, the next block opens a new one"""
+        if self.session is not None:
+            logger.info("Async database Session closed")
+            await self.session.close()
+            self.session = None
+
+    async def run_sync(self, fn, *args, **kwargs):
+        """
+        The sync handlers and views run with a SqlalchemyUnitOfWork bound to the sync
+        facade of the AsyncSession, so their queries are awaited by the event loop
+        instead of blocking it, and they share its identity map.
+        """
+        session = self._get_session()
+        try:
+            return await session.run_sync(
+                lambda sync_session: fn(
+                    *args,
+                    uow=SqlalchemyUnitOfWork(
+                        read_only=self.read_only, session=sync_session
+                    ),
+                    **kwargs,
+                )
+            )
+        finally:
+            if not self._depth and self.close_on_exit:
+                await self.close()
+
+    async def _commit(self):
+        if self._savepoints:
+            if self._savepoints[-1].is_active:
+                await self._savepoints[-1].commit()
+            return
+        if self.read_only:
+            if self.close_on_exit:
+                await self.session.rollback()
+            return
+        logger.info("Committing changes to database")
+        start = time.perf_counter()
+        try:
+            await self.session.commit()
+        except StaleDataError:
+            await self.session.rollback()
+            raise ConcurrencyConflict()
+        if self.session.sync_session.info.pop(WROTE, False):
+            metrics.COMMIT_SECONDS.labels(uow="async").observe(
+                time.perf_counter() - start
+            )
+            _remember_write()
+
+    async def rollback(self):
+        if self._savepoints:
+            if self._savepoints[-1].is_active:
+                logger.info("Rolling back to savepoint")
+                await self._savepoints[-1].rollback()
+            return
+        logger.info("Rolling back changes to database")
+        await self.session.rollback()
+        self.session.sync_session.info.pop(WROTE, None)
+
+
+# the requests with these methods only read, their unit of work uses the read replicas
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+async def request_unit_of_work(
+    request: Request,
+) -> AsyncIterator[AsyncSqlalchemyUnitOfWork]:
+    """
+    FastAPI dependency, the unit of work of a request. The authentication, the endpoint
+    and the events handled while the request runs share its session and identity map,
+    so a row is read once per request. The session is closed after the response
+    """
+    uow = AsyncSqlalchemyUnitOfWork(
+        read_only=request.method in READ_ONLY_METHODS, close_on_exit=False
+    )
+    try:
+        yield uow
+    finally:
+        await uow.close()
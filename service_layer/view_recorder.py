@@ -0,0 +1,158 @@
+import queue
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Callable, List
+
+from decouple import config
+
+from adapters.orm import product_views_daily, product_views_hourly
+from domain.models import ProductSeen
+from logger import get_logger
+from schemas.enums import Roles
+from service_layer import metrics
+from service_layer.background import PeriodicWorker
+from service_layer.unit_of_work import AbstractUnitOfWork, SqlalchemyUnitOfWork
+
+logger = get_logger(__name__)
+
+VIEW_BUFFER_SIZE = config("VIEW_BUFFER_SIZE", default=10000, cast=int)
+VIEW_BATCH_SIZE = config("VIEW_BATCH_SIZE", default=500, cast=int)
+VIEW_FLUSH_INTERVAL = config("VIEW_FLUSH_INTERVAL", default=1.0, cast=float)
+
+
+class ProductViewRecorder:
+    """
+    Write-behind buffer for the `product_seen` table. Views are queued in memory and
+    written with one multi-row insert per batch when the batch is full or when the
+    flush interval expires, whatever happens first. When the queue is full the view
+    is dropped and counted instead of blocking the request.
+    """
+
+    def __init__(
+        self,
+        uow_factory: Callable[[], AbstractUnitOfWork] = SqlalchemyUnitOfWork,
+        max_size: int = VIEW_BUFFER_SIZE,
+        batch_size: int = VIEW_BATCH_SIZE,
+        flush_interval: float = VIEW_FLUSH_INTERVAL,
+    ):
+        self.uow_factory = uow_factory
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_size)
+        self._flush_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.worker = PeriodicWorker(
+            "product-view-recorder", self.flush, interval=flush_interval
+        )
+
+    def record(self, product_sku: str, user_email: str, role: Roles) -> bool:
+        """Queue a view, returns False when the view was dropped"""
+        return self.record_many([product_sku], user_email, role) == 1
+
+    def record_many(self, product_skus: List[str], user_email: str, role: Roles) -> int:
+        """
+        Queue the views of several products by the same user, they are written with the
+        next batch. Returns the number of views queued, the rest were dropped
+        """
+        date = datetime.now()
+        queued = 0
+        for product_sku in product_skus:
+            row = {
+                "product_sku": product_sku,
+                "user_email": user_email,
+                "role": role,
+                "date": date,
+            }
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                dropped = len(product_skus) - queued
+                with self._counters_lock:
+                    self.dropped += dropped
+                metrics.PRODUCT_VIEWS_DROPPED.inc(dropped)
+                logger.warning("View buffer is full, %d views dropped", dropped)
+                break
+            queued += 1
+        pending = self._queue.qsize()
+        metrics.PRODUCT_VIEWS_PENDING.set(pending)
+        if pending >= self.batch_size:
+            self.worker.wake()
+        return queued
+
+    def flush(self, uow: AbstractUnitOfWork = None) -> int:
+        """Write every pending view, returns the number of rows written"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                try:
+                    batch_uow = uow or self.uow_factory()
+                    with batch_uow:
+                        batch_uow.repository.bulk_insert(ProductSeen, batch)
+                        self._update_rollups(batch_uow, batch)
+                except Exception:
+                    logger.exception("Error writing %d product views", len(batch))
+                    with self._counters_lock:
+                        self.failed += len(batch)
+                    metrics.PRODUCT_VIEWS_FAILED.inc(len(batch))
+                    break
+                written += len(batch)
+        with self._counters_lock:
+            self.flushed += written
+        metrics.PRODUCT_VIEWS_PENDING.set(self._queue.qsize())
+        return written
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            return {
+                "pending": self._queue.qsize(),
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    @staticmethod
+    def _update_rollups(uow: AbstractUnitOfWork, batch: List[dict]):
+        """
+        The hourly and daily view counts are incremented in the transaction of the raw
+        views, the keys are sorted so concurrent flushes lock the rows in the same order
+        """
+        hourly = Counter()
+        daily = Counter()
+        for row in batch:
+            hour = row["date"].replace(minute=0, second=0, microsecond=0)
+            hourly[(row["product_sku"], row["role"], hour)] += 1
+            daily[(row["product_sku"], row["role"], hour.date())] += 1
+        uow.repository.bulk_increment(
+            product_views_hourly,
+            [
+                {"product_sku": sku, "role": role, "hour": hour, "views": views}
+                for (sku, role, hour), views in sorted(hourly.items())
+            ],
+            "views",
+        )
+        uow.repository.bulk_increment(
+            product_views_daily,
+            [
+                {"product_sku": sku, "role": role, "day": day, "views": views}
+                for (sku, role, day), views in sorted(daily.items())
+            ],
+            "views",
+        )
+
+    def _take_batch(self) -> List[dict]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+
+view_recorder = ProductViewRecorder()
@@ -1,8 +1,22 @@
+from collections import deque
+
 from fastapi import HTTPException
 from starlette import status
 
-from adapters.repositories.repository import AbstractRepository
-from service_layer.unit_of_work import AbstractUnitOfWork
+from adapters.repositories.repository import (
+    AbstractRepository,
+    AbstractAsyncRepository,
+    apply_update,
+)
+from service_layer.unit_of_work import AbstractUnitOfWork, AbstractAsyncUnitOfWork
+
+
+def _columns(row) -> dict:
+    return {
+        key: value
+        for key, value in vars(row).items()
+        if not key.startswith("_") and key != "events"
+    }
 
 
 class FakeRepository(AbstractRepository):
@@ -12,13 +26,16 @@ class FakeRepository(AbstractRepository):
             "products": set(),
             "users": set(),
             "product_seen": set(),
+            "notification_outbox": set(),
         }
+        # table name -> primary key -> counter
+        self._fake_counters = {}
 
     def _add(self, table):
         table_name = table.__tablename__
-        evaluation = "email" if table_name == "users" else "sku"
+        evaluation = {"users": "email", "products": "sku"}.get(table_name)
         for row in self._fake_db_dict[table_name]:
-            if getattr(row, evaluation) == getattr(table, evaluation):
+            if evaluation and getattr(row, evaluation) == getattr(table, evaluation):
                 raise HTTPException(status_code=400, detail="User already exists")
         self._fake_db_dict[table_name].add(table)
 
@@ -45,6 +62,48 @@ class FakeRepository(AbstractRepository):
             self._fake_db_dict[table_name].remove(row)
         return rowcount
 
+    def update_where(
+        self, table, dict_to_filter, values, on_change=None, version_column=None
+    ):
+        updated = []
+        for row in self._fake_db_dict[table.__tablename__]:
+            if all(getattr(row, key) == value for key, value in dict_to_filter.items()):
+                old = _columns(row)
+                new = apply_update(old, values, on_change, version_column)
+                for column, value in new.items():
+                    setattr(row, column, value)
+                updated.append((old, new))
+        return updated
+
+    def delete_returning(self, table, dict_to_filter):
+        to_remove = [
+            row
+            for row in self._fake_db_dict[table.__tablename__]
+            if all(getattr(row, key) == value for key, value in dict_to_filter.items())
+        ]
+        for row in to_remove:
+            self._fake_db_dict[table.__tablename__].remove(row)
+        return [_columns(row) for row in to_remove]
+
+    def bulk_insert(self, table, rows):
+        for row in rows:
+            instance = table.__new__(table)
+            instance.__dict__.update(row)
+            instance.events = deque()
+            self._fake_db_dict[table.__tablename__].add(instance)
+
+    def bulk_increment(self, table, rows, counter):
+        counters = self._fake_counters.setdefault(table.name, {})
+        for row in rows:
+            key = tuple(row[column.name] for column in table.primary_key)
+            counters[key] = counters.get(key, 0) + row[counter]
+
+    def filter_existing(self, table, column_name, values):
+        stored = {
+            getattr(row, column_name) for row in self._fake_db_dict[table.__tablename__]
+        }
+        return stored.intersection(values)
+
 
 class FakeUnitOfWork(AbstractUnitOfWork):
     def __init__(self):
@@ -58,3 +117,59 @@ class FakeUnitOfWork(AbstractUnitOfWork):
 
     def rollback(self):
         self.roll_backed = True
+
+
+class FakeAsyncRepository(AbstractAsyncRepository):
+    """Async facade of a FakeRepository, so sync and async fakes share the same rows"""
+
+    def __init__(self, repository: FakeRepository):
+        super().__init__()
+        self._repository = repository
+
+    async def _add(self, table):
+        self._repository.add(table)
+
+    async def _get(self, table, dict_to_filter):
+        return self._repository.get(table, dict_to_filter)
+
+    async def delete(self, table, column_name, column_value):
+        return self._repository.delete(table, column_name, column_value)
+
+    async def bulk_insert(self, table, rows):
+        self._repository.bulk_insert(table, rows)
+
+
+class FakeAsyncUnitOfWork(AbstractAsyncUnitOfWork):
+    def __init__(self, sync_uow: FakeUnitOfWork = None):
+        super().__init__()
+        self.sync_uow = sync_uow or FakeUnitOfWork()
+        self.repository = FakeAsyncRepository(self.sync_uow.repository)
+        self.committed = False
+        self.roll_backed = None
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return fn(*args, uow=self.sync_uow, **kwargs)
+
+    async def _commit(self):
+        self.committed = True
+
+    async def rollback(self):
+        self.roll_backed = True
+
+
+class FakeSMTP:
+    """Local SMTP sink, it keeps the messages instead of sending them"""
+
+    def __init__(self):
+        self.messages = []
+        self.logins = 0
+        self.closed = False
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def send_message(self, msg):
+        self.messages.append(msg)
+
+    def quit(self):
+        self.closed = True
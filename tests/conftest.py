@@ -1,6 +1,8 @@
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, clear_mappers
+from sqlalchemy.pool import NullPool
 
 from adapters.orm import mapper_registry, start_mappers
 
@@ -23,3 +25,17 @@ def session_factory(in_memory_db):
 @pytest.fixture
 def sqlite_session(session_factory):
     return session_factory()
+
+
+@pytest.fixture
+def async_session_factory(tmp_path):
+    # aiosqlite connections can't be shared between event loops, every test opens
+    # its own loop, so the database is a file and the connections are not pooled
+    db_path = tmp_path / "test.db"
+    start_mappers()
+    mapper_registry.metadata.create_all(create_engine(f"sqlite:///{db_path}"))
+    yield async_sessionmaker(
+        bind=create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool),
+        expire_on_commit=False,
+    )
+    clear_mappers()
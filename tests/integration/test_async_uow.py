@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, text
+
+from adapters.cache import LRUCache
+from domain.commands import product_commands
+from domain.models import Product, User
+from service_layer import messagebus
+from service_layer.unit_of_work import AsyncSqlalchemyUnitOfWork
+from tests.integration.test_uow import insert_product
+from views import product_views
+
+
+def test_async_uow_can_retrieve_products(async_session_factory):
+    async def get_product():
+        uow = AsyncSqlalchemyUnitOfWork(async_session_factory)
+        async with uow:
+            await uow.session.run_sync(
+                insert_product,
+                Product(sku="123", name="name", price=10, brand="brand", quantity=1),
+            )
+        async with uow:
+            return await uow.repository.get(Product, {"sku": "123"})
+
+    product = asyncio.run(get_product())
+    assert product.name == "name"
+
+
+def test_async_uow_rolls_back_on_error(async_session_factory):
+    class MyException(Exception):
+        pass
+
+    async def insert_and_fail():
+        uow = AsyncSqlalchemyUnitOfWork(async_session_factory)
+        with pytest.raises(MyException):
+            async with uow:
+                await uow.session.run_sync(
+                    insert_product,
+                    Product(
+                        sku="123", name="name", price=10, brand="brand", quantity=1
+                    ),
+                )
+                raise MyException()
+        async with uow:
+            return list(await uow.session.execute(text("SELECT * FROM products")))
+
+    assert asyncio.run(insert_and_fail()) == []
+
+
+def test_handle_async_runs_sync_handlers_and_views(async_session_factory):
+    async def create_and_get():
+        uow = AsyncSqlalchemyUnitOfWork(async_session_factory)
+        await messagebus.handle_async(
+            product_commands.CreateProduct(
+                sku="async", name="name", price=10, brand="brand", quantity=1
+            ),
+            uow,
+        )
+        return await uow.run_sync(
+            product_views.get_product, "async", cache=LRUCache(max_size=1, ttl=1)
+        )
+
+    assert asyncio.run(create_and_get()).sku == "async"
+
+
+def test_the_blocks_and_the_sync_code_share_the_session(async_session_factory):
+    statements = []
+    event.listen(
+        async_session_factory.kw["bind"].sync_engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    def get_user(uow):
+        with uow:
+            return uow.repository.get(User, {"email": "admin@test.com"})
+
+    async def read_twice():
+        async with AsyncSqlalchemyUnitOfWork(async_session_factory) as uow:
+            await uow.session.execute(
+                text(
+                    "INSERT INTO users (email, username, password, role, version)"
+                    " VALUES ('admin@test.com', 'admin', 'password', 'admin', 1)"
+                )
+            )
+        # the unit of work of a request
+        uow = AsyncSqlalchemyUnitOfWork(
+            async_session_factory, read_only=True, close_on_exit=False
+        )
+        try:
+            async with uow:
+                user = await uow.repository.get(User, {"email": "admin@test.com"})
+            statements.clear()
+            return user, await uow.run_sync(get_user)
+        finally:
+            await uow.close()
+
+    user, user_of_the_view = asyncio.run(read_twice())
+    assert user_of_the_view is user
+    assert statements == []
+
+
+def test_nested_async_blocks_are_savepoints(async_session_factory):
+    async def insert_and_fail_inside():
+        uow = AsyncSqlalchemyUnitOfWork(async_session_factory)
+        async with uow:
+            await uow.session.execute(text("SELECT 1"))
+            with pytest.raises(ValueError):
+                async with uow:
+                    await uow.session.run_sync(
+                        insert_product, Product("failed", "name", 10, "b", 1)
+                    )
+                    raise ValueError()
+            async with uow:
+                await uow.session.run_sync(
+                    insert_product, Product("kept", "name", 10, "b", 1)
+                )
+        async with uow:
+            return list(await uow.session.execute(text("SELECT sku FROM products")))
+
+    assert asyncio.run(insert_and_fail_inside()) == [("kept",)]
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import config
+from adapters.database import build_async_engine, build_engine, pool_status
+from service_layer import query_stats
+from service_layer.unit_of_work import Database
+
+
+def test_sqlite_engine_sets_pragmas(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        # NORMAL
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    engine.dispose()
+
+
+def test_async_sqlite_engine_sets_pragmas(tmp_path):
+    engine = build_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'catalog.db'}")
+
+    async def journal_mode():
+        async with engine.connect() as connection:
+            mode = (await connection.execute(text("PRAGMA journal_mode"))).scalar()
+        await engine.dispose()
+        return mode
+
+    assert asyncio.run(journal_mode()) == "wal"
+
+
+def test_pool_status_reports_checked_out_connections_and_wait_time(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    with engine.connect():
+        with engine.connect():
+            status = pool_status(engine)
+    assert status["checked_out"] == 2
+    assert status["checkouts"] == 2
+    assert status["max_wait_seconds"] >= 0
+    assert pool_status(engine)["checked_out"] == 0
+    engine.dispose()
+
+
+def test_engine_settings_have_per_backend_defaults():
+    sqlite = config.get_engine_settings("sqlite:///product.db")
+    postgres = config.get_engine_settings("postgresql://user:pass@db/catalog")
+
+    assert sqlite["pool_pre_ping"] is False
+    assert postgres["pool_pre_ping"] is True
+    assert postgres["pool_recycle"] == 1800
+
+
+def test_async_connection_string_uses_the_asyncio_driver(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgresql://user:pass@db/catalog")
+    assert (
+        config.get_async_db_connection_string()
+        == "postgresql+asyncpg://user:pass@db/catalog"
+    )
+
+
+def test_repeated_queries_of_a_request_are_reported(tmp_path, caplog):
+    engine = build_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    query_stats.instrument_engine(engine)
+    stats = query_stats.start_request()
+    with engine.connect() as connection:
+        for sku in range(query_stats.REPEATED_QUERY_THRESHOLD):
+            connection.execute(text("SELECT :sku"), {"sku": sku})
+        connection.execute(text("SELECT 1"))
+    with caplog.at_level(logging.WARNING):
+        query_stats.finish_request(stats, "/product/get_product")
+    engine.dispose()
+
+    assert stats.queries == query_stats.REPEATED_QUERY_THRESHOLD + 1
+    assert stats.seconds > 0
+    assert stats.repeated_statements() == {
+        "SELECT ?": query_stats.REPEATED_QUERY_THRESHOLD
+    }
+    assert "Possible N+1 queries" in caplog.text
+
+
+def test_failed_queries_drop_their_start_time(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'catalog.db'}")
+    query_stats.instrument_engine(engine)
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+        assert connection.info["query_start"] == []
+    engine.dispose()
+
+
+def test_database_engines_are_built_on_first_use(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'catalog.db'}")
+    assert database._state is None
+
+    with database.session_factory() as session:
+        assert session.execute(text("SELECT 1")).scalar() == 1
+    assert database.async_engine.url.drivername == "sqlite+aiosqlite"
+
+    database.configure(f"sqlite:///{tmp_path / 'other.db'}")
+    assert database._state is None
+    assert database.engine.url.database.endswith("other.db")
+    asyncio.run(database.dispose_async())
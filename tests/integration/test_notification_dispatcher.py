@@ -0,0 +1,67 @@
+from sqlalchemy import text
+
+from adapters.notification_system.notification_strategies import (
+    PersistentEmailNotification,
+)
+from domain.commands import product_commands
+from schemas.enums import NotificationStatus
+from service_layer import messagebus
+from service_layer.notification_dispatcher import NotificationDispatcher
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+from tests.common import FakeSMTP
+
+
+def _create_product(session_factory, sku):
+    messagebus.handle(
+        product_commands.CreateProduct(
+            sku=sku, name="name", price=1, brand="brand", quantity=1
+        ),
+        SqlalchemyUnitOfWork(session_factory),
+    )
+
+
+def _statuses(session_factory):
+    return [
+        row[0]
+        for row in session_factory().execute(
+            text("SELECT status FROM notification_outbox ORDER BY id")
+        )
+    ]
+
+
+def test_dispatcher_sends_outbox_notifications_with_one_connection(session_factory):
+    smtp = FakeSMTP()
+    dispatcher = NotificationDispatcher(
+        uow_factory=lambda: SqlalchemyUnitOfWork(session_factory),
+        sender=PersistentEmailNotification(connection_factory=lambda: smtp),
+    )
+    _create_product(session_factory, "sku1")
+    _create_product(session_factory, "sku2")
+
+    assert dispatcher.dispatch_pending() == 2
+    assert [msg["Subject"] for msg in smtp.messages] == [
+        "Product sku1 has been created",
+        "Product sku2 has been created",
+    ]
+    assert smtp.logins == 1
+    assert _statuses(session_factory) == [NotificationStatus.sent.name] * 2
+
+
+def test_dispatcher_retries_with_backoff_until_max_attempts(session_factory):
+    class FailingSender:
+        @staticmethod
+        def send(addressees, subject, body):
+            raise ConnectionError("SMTP server down")
+
+    dispatcher = NotificationDispatcher(
+        uow_factory=lambda: SqlalchemyUnitOfWork(session_factory),
+        sender=FailingSender(),
+        max_attempts=2,
+        backoff=0,
+    )
+    _create_product(session_factory, "sku1")
+
+    assert dispatcher.dispatch_pending() == 0
+    assert _statuses(session_factory) == [NotificationStatus.pending.name]
+    assert dispatcher.dispatch_pending() == 0
+    assert _statuses(session_factory) == [NotificationStatus.failed.name]
@@ -0,0 +1,66 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from domain import events
+from domain.commands import product_commands
+from service_layer import messagebus
+from service_layer.outbox_relay import OutboxRelay
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+
+
+def _count(session_factory, table):
+    return session_factory().execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+
+def test_events_are_stored_in_the_outbox_and_relayed(session_factory):
+    uow_factory = lambda: SqlalchemyUnitOfWork(session_factory, use_outbox=True)
+    messagebus.handle(
+        product_commands.CreateProduct(
+            sku="sku1", name="name", price=1, brand="brand", quantity=1
+        ),
+        uow_factory(),
+    )
+
+    assert _count(session_factory, "outbox") == 1
+    assert _count(session_factory, "notification_outbox") == 0
+
+    assert OutboxRelay(uow_factory=uow_factory).relay_pending() == 1
+    assert _count(session_factory, "notification_outbox") == 1
+    assert OutboxRelay(uow_factory=uow_factory).relay_pending() == 0
+
+
+def test_outbox_is_not_written_when_the_command_fails(session_factory):
+    uow_factory = lambda: SqlalchemyUnitOfWork(session_factory, use_outbox=True)
+    with pytest.raises(HTTPException):
+        messagebus.handle(product_commands.DeleteProduct(sku="sku1"), uow_factory())
+
+    assert _count(session_factory, "outbox") == 0
+
+
+def test_events_whose_handlers_failed_stay_pending(session_factory, monkeypatch):
+    uow_factory = lambda: SqlalchemyUnitOfWork(session_factory, use_outbox=True)
+    for sku in ["sku1", "sku2"]:
+        messagebus.handle(
+            product_commands.CreateProduct(
+                sku=sku, name="name", price=1, brand="brand", quantity=1
+            ),
+            uow_factory(),
+        )
+
+    def fail_on_sku1(event, uow):
+        if event.sku == "sku1":
+            raise RuntimeError("handler failed")
+
+    monkeypatch.setitem(
+        messagebus.EVENT_HANDLERS, events.ProductCreated, [fail_on_sku1]
+    )
+    assert OutboxRelay(uow_factory=uow_factory).relay_pending() == 1
+    pending = session_factory().execute(
+        text("SELECT payload FROM outbox WHERE dispatched_at IS NULL")
+    )
+    assert ['"sku1"' in payload for payload, in pending] == [True]
+
+    monkeypatch.undo()
+    assert OutboxRelay(uow_factory=uow_factory).relay_pending() == 1
+    assert _count(session_factory, "outbox WHERE dispatched_at IS NULL") == 0
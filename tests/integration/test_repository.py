@@ -1,5 +1,11 @@
-from adapters.repositories.repository import SQLAlchemyRepository
-from domain.models import Product, User
+from sqlalchemy.dialects import postgresql
+
+from adapters.orm import products
+from adapters.repositories.repository import (
+    SQLAlchemyRepository,
+    update_returning_statement,
+)
+from domain.models import Product, User, ProductSeen
 from schemas.enums import Roles
 
 
@@ -16,3 +22,68 @@ def test_get_by_sku(sqlite_session):
     repo.add(user)
     assert repo.get(Product, {"sku": "123"}) == product
     assert repo.get(User, {"email": "admin@test.com"}) == user
+
+
+def test_bulk_insert(sqlite_session):
+    repo = SQLAlchemyRepository(sqlite_session)
+    repo.bulk_insert(
+        ProductSeen,
+        [
+            {"product_sku": "123", "user_email": "admin@test.com", "role": Roles.admin},
+            {"product_sku": "456", "user_email": "anonymous", "role": Roles.anonymous},
+        ],
+    )
+
+    assert repo.get(ProductSeen, {"product_sku": "456"}).role == Roles.anonymous
+
+
+def test_update_where_returns_the_old_and_the_new_values(sqlite_session):
+    repo = SQLAlchemyRepository(sqlite_session)
+    repo.add(
+        Product(sku="123", name="Harry Potter", price=10, brand="J.K.", quantity=1)
+    )
+    sqlite_session.flush()
+
+    [(old, new)] = repo.update_where(
+        Product,
+        {"sku": "123"},
+        values={"price": 12},
+        on_change={"brand": "Rowling"},
+        version_column="version",
+    )
+    assert (old["price"], old["brand"], old["version"]) == (10, "J.K.", 1)
+    assert (new["price"], new["brand"], new["version"]) == (12, "Rowling", 2)
+
+    # the values don't change the product, so on_change and the version are not applied
+    [(old, new)] = repo.update_where(
+        Product,
+        {"sku": "123"},
+        values={"price": 12},
+        on_change={"brand": "other"},
+        version_column="version",
+    )
+    assert old == new
+    assert repo.update_where(Product, {"sku": "456"}, values={"price": 1}) == []
+
+
+def test_update_returns_the_old_values_in_the_same_statement_on_postgresql():
+    statement = update_returning_statement(
+        products, [products.c.sku == "123"], {"price": 12}, {}, "version"
+    )
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+
+    assert sql.startswith("UPDATE products SET price=")
+    assert "FOR UPDATE) AS previous WHERE products.id = previous.id" in sql
+    assert "RETURNING previous.id" in sql
+
+
+def test_delete_returning(sqlite_session):
+    repo = SQLAlchemyRepository(sqlite_session)
+    repo.add(
+        Product(sku="123", name="Harry Potter", price=10, brand="J.K.", quantity=1)
+    )
+    sqlite_session.flush()
+
+    [deleted] = repo.delete_returning(Product, {"sku": "123"})
+    assert deleted["name"] == "Harry Potter"
+    assert repo.delete_returning(Product, {"sku": "123"}) == []
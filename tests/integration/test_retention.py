@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from adapters.orm import product_seen, product_views_daily, product_views_hourly
+from schemas.enums import Roles
+from service_layer.retention import ViewRetention
+from service_layer.unit_of_work import SqlalchemyUnitOfWork
+
+
+def test_compact_deletes_expired_views_in_batches(session_factory):
+    now = datetime(2026, 10, 18, 12)
+    session = session_factory()
+    session.execute(
+        insert(product_seen),
+        [
+            {
+                "product_sku": "sku1",
+                "user_email": "anonymous",
+                "role": Roles.anonymous,
+                "date": now - timedelta(days=days),
+            }
+            for days in [40, 40, 35, 31, 29, 1]
+        ],
+    )
+    session.execute(
+        insert(product_views_hourly),
+        [
+            {
+                "product_sku": "sku1",
+                "role": Roles.anonymous,
+                "hour": now - timedelta(days=days),
+                "views": 1,
+            }
+            for days in [9, 8, 1]
+        ],
+    )
+    session.execute(
+        insert(product_views_daily),
+        {"product_sku": "sku1", "role": Roles.anonymous, "day": now.date(), "views": 6},
+    )
+    session.commit()
+    retention = ViewRetention(
+        lambda: SqlalchemyUnitOfWork(session_factory),
+        retention_days=30,
+        hourly_retention_days=7,
+        batch_size=2,
+        batch_pause=0,
+    )
+
+    report = retention.compact(now=now)
+
+    assert report["raw_rows_deleted"] == 4
+    assert report["hourly_rows_deleted"] == 2
+    assert report["rows_per_second"] > 0
+    for table, remaining in [
+        (product_seen, 2),
+        (product_views_hourly, 1),
+        (product_views_daily, 1),
+    ]:
+        assert session.execute(select(func.count()).select_from(table)).scalar() == (
+            remaining
+        )
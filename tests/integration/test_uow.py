@@ -1,17 +1,35 @@
+import contextvars
+
 import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import text
 
+from adapters.orm import mapper_registry
+from adapters.repositories import repository
+from adapters.repositories.repository import apply_update
+
+from domain.commands import product_commands, user_commands
 from domain.models import Product, User
 from schemas.enums import Roles
-from service_layer.handler.user_handler import pwd_context
-from service_layer.unit_of_work import SqlalchemyUnitOfWork
+from schemas.product import ProductSchema
+from service_layer import messagebus, metrics
+from service_layer.handler.product_handler import ProductHandler
+from service_layer.handler.user_handler import UserHandler
+from service_layer.password_hasher import password_hasher
+from service_layer.unit_of_work import (
+    ConcurrencyConflict,
+    RoundRobinSessionFactory,
+    SqlalchemyUnitOfWork,
+)
 
 
 def insert_product(session, product: Product):
     session.execute(
         text(
-            "INSERT INTO products (sku, name, price, brand, quantity)"
-            " VALUES (:sku, :name, :price, :brand, :quantity)"
+            "INSERT INTO products (sku, name, price, brand, quantity, version)"
+            " VALUES (:sku, :name, :price, :brand, :quantity, 1)"
         ),
         dict(
             sku=product.sku,
@@ -24,11 +42,11 @@ def insert_product(session, product: Product):
 
 
 def insert_user(session, user: User):
-    user.password = pwd_context.hash(user.password)
+    user.password = password_hasher.hash(user.password)
     session.execute(
         text(
-            "INSERT INTO users (role, username, password, email)"
-            " VALUES (:role, :username, :password, :email)"
+            "INSERT INTO users (role, username, password, email, version)"
+            " VALUES (:role, :username, :password, :email, 1)"
         ),
         dict(
             role=user.role.name,
@@ -90,3 +108,249 @@ def test_rolls_back_on_error(session_factory):
     new_session = session_factory()
     rows = list(new_session.execute(text('SELECT * FROM "products"')))
     assert rows == []
+
+
+def test_bulk_create_products_commits_each_chunk(session_factory):
+    session = session_factory()
+    insert_product(
+        session,
+        Product(sku="1", name="Harry Potter", price=10, brand="Rowling", quantity=10),
+    )
+    session.commit()
+    products = [
+        ProductSchema(sku=str(sku), name="name", price=1, brand="brand", quantity=1)
+        for sku in range(5)
+    ]
+
+    result = messagebus.handle(
+        product_commands.BulkCreateProducts(products=products, chunk_size=2),
+        SqlalchemyUnitOfWork(session_factory),
+    )
+
+    rows = list(session_factory().execute(text("SELECT sku FROM products")))
+    assert result["created"] == 4
+    assert result["conflicts"][0]["sku"] == "1"
+    assert len(rows) == 5
+
+
+@pytest.fixture
+def replica_session_factory(session_factory):
+    engine = create_engine("sqlite:///:memory:")
+    mapper_registry.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def test_read_only_uow_queries_the_replica(session_factory, replica_session_factory):
+    replica = replica_session_factory()
+    insert_product(
+        replica, Product(sku="123", name="replica", price=1, brand="b", quantity=1)
+    )
+    replica.commit()
+
+    def read():
+        uow = SqlalchemyUnitOfWork(
+            session_factory,
+            read_only=True,
+            read_session_factory=replica_session_factory,
+        )
+        with uow:
+            return (
+                uow.session.execute(text("SELECT name FROM products")).scalars().all()
+            )
+
+    assert contextvars.Context().run(read) == ["replica"]
+
+
+def test_reads_after_a_commit_go_to_the_primary(
+    session_factory, replica_session_factory
+):
+    def write_then_read():
+        with SqlalchemyUnitOfWork(session_factory) as uow:
+            insert_product(
+                uow.session,
+                Product(sku="123", name="primary", price=1, brand="b", quantity=1),
+            )
+        uow = SqlalchemyUnitOfWork(
+            session_factory,
+            read_only=True,
+            read_session_factory=replica_session_factory,
+        )
+        with uow:
+            return (
+                uow.session.execute(text("SELECT name FROM products")).scalars().all()
+            )
+
+    assert contextvars.Context().run(write_then_read) == ["primary"]
+
+
+def test_reads_after_a_commit_without_writes_go_to_the_replicas(
+    session_factory, replica_session_factory
+):
+    replica = replica_session_factory()
+    insert_product(
+        replica, Product(sku="123", name="replica", price=1, brand="b", quantity=1)
+    )
+    replica.commit()
+
+    def commit_then_read():
+        with SqlalchemyUnitOfWork(session_factory) as uow:
+            uow.session.execute(text("SELECT name FROM products")).all()
+        uow = SqlalchemyUnitOfWork(
+            session_factory,
+            read_only=True,
+            read_session_factory=replica_session_factory,
+        )
+        with uow:
+            return (
+                uow.session.execute(text("SELECT name FROM products")).scalars().all()
+            )
+
+    assert contextvars.Context().run(commit_then_read) == ["replica"]
+
+
+def test_round_robin_session_factory_cycles_over_the_replicas():
+    session_factory = RoundRobinSessionFactory([lambda: "a", lambda: "b"])
+
+    assert [session_factory() for _ in range(3)] == ["a", "b", "a"]
+
+
+def test_uow_that_was_not_entered_has_no_new_events(session_factory):
+    assert list(SqlalchemyUnitOfWork(session_factory).collect_new_events()) == []
+
+
+def test_commit_duration_is_recorded(session_factory):
+    before = metrics.COMMIT_SECONDS.collect()
+    with SqlalchemyUnitOfWork(session_factory) as uow:
+        insert_product(uow.session, Product("sku", "name", 1, "b", 1))
+    # nothing is written
+    with SqlalchemyUnitOfWork(session_factory) as uow:
+        uow.session.execute(text("SELECT name FROM products"))
+    # the read-only units of work roll back
+    with SqlalchemyUnitOfWork(session_factory, read_only=True):
+        pass
+
+    def _count(data):
+        return sum(
+            sample.value
+            for sample in data.samples
+            if sample.name == "uow_commit_seconds_count"
+            and sample.labels == {"uow": "sync"}
+        )
+
+    assert _count(metrics.COMMIT_SECONDS.collect()) - _count(before) == 1
+
+
+def _update_price(session_factory, price: float, version: int = None):
+    product = ProductSchema(sku="sku", name="name", price=price, brand="b", quantity=1)
+    messagebus.handle(
+        product_commands.UpdateProduct("sku", product, version),
+        SqlalchemyUnitOfWork(session_factory),
+    )
+
+
+def test_update_of_a_stale_product_is_a_conflict(session_factory):
+    session = session_factory()
+    insert_product(session, Product("sku", "name", 10, "b", 1))
+    session.commit()
+
+    with pytest.raises(ConcurrencyConflict):
+        with SqlalchemyUnitOfWork(session_factory) as uow:
+            product = uow.repository.get(Product, {"sku": "sku"})
+            # another request updates the product after it was read
+            _update_price(session_factory, 20)
+            product.price = 30
+            product.version += 1
+            uow.commit()
+
+    assert session.execute(text("SELECT price, version FROM products")).one() == (20, 2)
+
+
+def test_conflicting_update_is_retried_with_the_new_version(
+    session_factory, monkeypatch
+):
+    session = session_factory()
+    insert_product(session, Product("sku", "name", 10, "b", 1))
+    session.commit()
+    concurrent_updates = [20]
+
+    def update_after_another_request(row, *args, **kwargs):
+        if concurrent_updates:
+            _update_price(session_factory, concurrent_updates.pop())
+        return apply_update(row, *args, **kwargs)
+
+    monkeypatch.setattr(repository, "apply_update", update_after_another_request)
+    _update_price(session_factory, 30)
+    assert session.execute(text("SELECT price, version FROM products")).one() == (30, 3)
+
+    # the client read the version 3, the retry sees the version 4
+    concurrent_updates.append(40)
+    with pytest.raises(HTTPException) as error:
+        _update_price(session_factory, 50, version=3)
+    assert error.value.status_code == 409
+    assert session.execute(text("SELECT price, version FROM products")).one() == (40, 4)
+
+
+def test_admin_writes_only_write_the_changes_in_one_statement(session_factory):
+    session = session_factory()
+    insert_product(session, Product("sku", "name", 10, "b", 1))
+    session.execute(
+        text(
+            "INSERT INTO users (email, username, password, role, version)"
+            " VALUES ('admin@test.com', 'admin', 'password', 'admin', 1)"
+        )
+    )
+    session.commit()
+    statements = []
+    event.listen(
+        session_factory.kw["bind"],
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    # sqlite only returns the new values, the old ones are selected first
+    UserHandler.make_super_admin(
+        user_commands.MakeUserSuperAdmin(email="admin@test.com"),
+        SqlalchemyUnitOfWork(session_factory),
+    )
+    assert [statement.split()[0] for statement in statements] == ["SELECT", "UPDATE"]
+
+    # nothing changes, so nothing is written
+    statements.clear()
+    UserHandler.make_super_admin(
+        user_commands.MakeUserSuperAdmin(email="admin@test.com"),
+        SqlalchemyUnitOfWork(session_factory),
+    )
+    assert [statement.split()[0] for statement in statements] == ["SELECT"]
+
+    statements.clear()
+    ProductHandler.delete_product(
+        product_commands.DeleteProduct("sku"), SqlalchemyUnitOfWork(session_factory)
+    )
+    assert [statement.split()[0] for statement in statements] == ["DELETE"]
+
+
+def test_nested_blocks_are_savepoints_of_the_same_session(session_factory):
+    session = session_factory()
+    uow = SqlalchemyUnitOfWork(session_factory)
+
+    with uow:
+        outer_session = uow.repository.session
+        assert uow.session.execute(text("SELECT count(*) FROM products")).scalar() == 0
+        with pytest.raises(HTTPException):
+            with uow:
+                assert uow.session is outer_session
+                insert_product(uow.session, Product("failed", "name", 10, "b", 1))
+                raise HTTPException(status_code=400)
+        with uow:
+            insert_product(uow.session, Product("kept", "name", 10, "b", 1))
+        uow.commit()
+    assert list(session.execute(text("SELECT sku FROM products"))) == [("kept",)]
+
+    # the outer rollback also undoes the released savepoints
+    with pytest.raises(HTTPException):
+        with uow:
+            uow.session.execute(text("SELECT 1"))
+            with uow:
+                insert_product(uow.session, Product("undone", "name", 10, "b", 1))
+            raise HTTPException(status_code=400)
+    assert list(session.execute(text("SELECT sku FROM products"))) == [("kept",)]
@@ -1,29 +1,148 @@
+import asyncio
+import base64
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event, text
+from starlette.requests import Request
+
+from adapters.cache import LRUCache
 from domain.commands import user_commands, product_commands
-from schemas.enums import Roles
+from domain.models import Product
+from resources import http_cache
+from schemas.enums import Roles, ProductSortField, SortOrder
+from schemas.product import ProductSchema
 from schemas.user import UserLogin
 from service_layer import messagebus
-from service_layer.unit_of_work import SqlalchemyUnitOfWork
+from service_layer.auth import unknown_account_cache
+from service_layer.password_hasher import PasswordHasher
+from service_layer.product_cache import cached_product, invalidate_product
+from service_layer.view_recorder import ProductViewRecorder, view_recorder
+from service_layer.unit_of_work import SqlalchemyUnitOfWork, AsyncSqlalchemyUnitOfWork
+from tests.integration.test_uow import insert_product
 from views import user_views, product_views
 
 
-def test_login_view(session_factory):
-    uow = SqlalchemyUnitOfWork(session_factory)
-    messagebus.handle(
-        user_commands.RegisterUser(
-            username="admin",
-            password="admin",
-            email="admin@test.com",
-            role=Roles.super_admin,
-        ),
-        uow,
-    )
+def test_login_view(async_session_factory):
+    async def login():
+        uow = AsyncSqlalchemyUnitOfWork(async_session_factory)
+        await messagebus.handle_async(
+            user_commands.RegisterUser(
+                username="admin",
+                password="admin",
+                email="admin@test.com",
+                role=Roles.super_admin,
+            ),
+            uow,
+        )
+        return await user_views.login_user(
+            UserLogin(email="admin@test.com", password="admin"), uow
+        )
 
-    _, role = user_views.login_user(
-        UserLogin(email="admin@test.com", password="admin"), uow
-    )
+    _, role = asyncio.run(login())
     assert role == Roles.super_admin
 
 
+def test_login_rehashes_the_password_when_the_cost_changes(async_session_factory):
+    async def login_and_get_hash():
+        uow = AsyncSqlalchemyUnitOfWork(async_session_factory)
+        await messagebus.handle_async(
+            user_commands.RegisterUser(
+                username="admin",
+                password="admin",
+                email="admin@test.com",
+                role=Roles.super_admin,
+            ),
+            uow,
+        )
+        await user_views.login_user(
+            UserLogin(email="admin@test.com", password="admin"),
+            uow,
+            rehash_uow=AsyncSqlalchemyUnitOfWork(async_session_factory),
+            hasher=PasswordHasher(rounds=4),
+        )
+        async with uow:
+            return (
+                await uow.session.execute(text("SELECT password, version FROM users"))
+            ).one()
+
+    password, version = asyncio.run(login_and_get_hash())
+    assert password.startswith("$2b$04$")
+    assert version == 2
+
+
+def test_unknown_account_is_cached_until_it_is_registered(async_session_factory):
+    credentials = UserLogin(email="new@test.com", password="admin")
+
+    async def login():
+        try:
+            await user_views.login_user(
+                credentials, AsyncSqlalchemyUnitOfWork(async_session_factory)
+            )
+        except HTTPException as ex:
+            return ex.status_code
+
+    async def register():
+        await messagebus.handle_async(
+            user_commands.RegisterUser(
+                username="new", password="admin", email="new@test.com", role=Roles.admin
+            ),
+            AsyncSqlalchemyUnitOfWork(async_session_factory),
+        )
+
+    assert asyncio.run(login()) == 400
+    assert unknown_account_cache.get("new@test.com")
+    asyncio.run(register())
+    assert unknown_account_cache.get("new@test.com") is None
+    assert asyncio.run(login()) is None
+
+
+def test_login_matches_the_email_without_case(async_session_factory):
+    async def login(email: str):
+        try:
+            await user_views.login_user(
+                UserLogin(email=email, password="admin"),
+                AsyncSqlalchemyUnitOfWork(async_session_factory),
+            )
+        except HTTPException as ex:
+            return ex.status_code
+
+    assert asyncio.run(login("Other@Test.com")) == 400
+    # the unknown e-mail is cached with the key of the rate limiter
+    assert unknown_account_cache.get("other@test.com")
+    asyncio.run(
+        messagebus.handle_async(
+            user_commands.RegisterUser(
+                username="other",
+                password="admin",
+                email="Other@test.com",
+                role=Roles.admin,
+            ),
+            AsyncSqlalchemyUnitOfWork(async_session_factory),
+        )
+    )
+    assert asyncio.run(login("OTHER@TEST.COM")) is None
+
+
+def test_emails_are_unique_without_case(session_factory):
+    def register(email: str):
+        messagebus.handle(
+            user_commands.RegisterUser(
+                username="new", password="admin", email=email, role=Roles.admin
+            ),
+            SqlalchemyUnitOfWork(session_factory),
+        )
+
+    register("New@Test.com")
+    with pytest.raises(HTTPException) as e:
+        register("new@test.com")
+
+    assert e.value.status_code == 400
+    emails = session_factory().execute(text("SELECT email FROM users")).scalars()
+    assert list(emails) == ["new@test.com"]
+
+
 def test_get_user_by_email_view(session_factory):
     uow = SqlalchemyUnitOfWork(session_factory)
     messagebus.handle(
@@ -52,3 +171,172 @@ def test_get_product(session_factory):
     product = product_views.get_product(sku="test", uow=uow)
 
     assert product.sku == "test"
+
+
+def test_get_products_reads_many_skus_and_reports_the_missing_ones(session_factory):
+    session = session_factory()
+    for sku in ["a", "b"]:
+        insert_product(
+            session, Product(sku=sku, name=sku, price=1, brand="acme", quantity=1)
+        )
+    session.commit()
+    uow = SqlalchemyUnitOfWork(session_factory)
+    cache = LRUCache(max_size=10, ttl=60)
+    cache.set(
+        "b",
+        cached_product(
+            {"sku": "b", "name": "cached", "price": 1, "brand": "acme", "quantity": 1},
+            1,
+            datetime(2026, 10, 18),
+        ),
+    )
+    view_recorder.flush(uow)
+
+    batch = product_views.get_products(
+        ["b", "nope", "a", "b"],
+        uow,
+        user_email="admin@test.com",
+        user_role=Roles.admin,
+        cache=cache,
+    )
+
+    assert [product["name"] for product in batch["products"]] == ["cached", "a"]
+    # the products loaded by the batch and the cached ones have the same fields
+    assert [set(product) for product in batch["products"]] == [
+        {*ProductSchema.__fields__, "version", "updated_at"}
+    ] * 2
+    assert batch["missing"] == ["nope"]
+    assert cache.get("a")["sku"] == "a"
+    assert view_recorder.flush(uow) == 2
+
+
+def test_products_of_a_batch_read_have_validators(session_factory):
+    session = session_factory()
+    insert_product(
+        session, Product(sku="a", name="a", price=1, brand="acme", quantity=1)
+    )
+    session.commit()
+    uow = SqlalchemyUnitOfWork(session_factory)
+    cache = LRUCache(max_size=10, ttl=60)
+
+    product_views.get_products(["a"], uow, cache=cache)
+    product = product_views.get_product("a", uow, cache=cache)
+
+    headers = http_cache.validators(product)
+    assert headers["ETag"] == http_cache.entity_tag(product)
+    assert "Last-Modified" in headers
+    conditional = Request(
+        {"type": "http", "headers": [(b"if-none-match", headers["ETag"].encode())]}
+    )
+    assert http_cache.is_not_modified(conditional, product)
+    view_recorder.flush(uow)
+
+
+def test_read_that_started_before_an_update_is_not_cached(session_factory):
+    session = session_factory()
+    insert_product(
+        session, Product(sku="a", name="old", price=1, brand="acme", quantity=1)
+    )
+    session.commit()
+    cache = LRUCache(max_size=10, ttl=60)
+
+    updated = []
+
+    def update_during_the_read(*args):
+        # the update commits and invalidates the product after the read selected it
+        if not updated:
+            updated.append(True)
+            session.execute(text("UPDATE products SET name = 'new', version = 2"))
+            session.commit()
+            invalidate_product(cache, "a")
+
+    event.listen(
+        session_factory.kw["bind"], "after_cursor_execute", update_during_the_read
+    )
+    product = product_views.get_product(
+        "a", SqlalchemyUnitOfWork(session_factory), cache=cache
+    )
+
+    assert product.name == "old"
+    assert cache.get("a") is None
+    view_recorder.flush(SqlalchemyUnitOfWork(session_factory))
+
+
+def test_list_products_paginates_with_cursor(session_factory):
+    session = session_factory()
+    for sku, price, brand, quantity in [
+        ("a", 3, "acme", 1),
+        ("b", 1, "acme", 0),
+        ("c", 3, "acme", 5),
+        ("d", 2, "other", 1),
+        ("e", 5, "acme", 2),
+    ]:
+        insert_product(session, Product(sku, "name", price, brand, quantity))
+    session.commit()
+    uow = SqlalchemyUnitOfWork(session_factory)
+
+    skus, cursor = [], None
+    while True:
+        page = product_views.list_products(
+            uow,
+            brand="acme",
+            in_stock=True,
+            sort_by=ProductSortField.price,
+            order=SortOrder.desc,
+            limit=2,
+            cursor=cursor,
+        )
+        skus.extend(product.sku for product in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert skus == ["e", "c", "a"]
+
+
+def test_list_products_sorted_by_id_is_ordered_by_id_once(session_factory):
+    statements = []
+    event.listen(
+        session_factory.kw["bind"],
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    product_views.list_products(SqlalchemyUnitOfWork(session_factory), limit=2)
+
+    assert "ORDER BY products.id ASC\n" in statements[-1]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [b"not json", b"{}", b"[1]", b'["a", 1]', b'[1, "a"]', b"[true, 1]", b"[1, null]"],
+)
+def test_list_products_rejects_invalid_cursors(session_factory, payload):
+    with pytest.raises(HTTPException) as e:
+        product_views.list_products(
+            SqlalchemyUnitOfWork(session_factory),
+            cursor=base64.urlsafe_b64encode(payload).decode(),
+        )
+    assert e.value.status_code == 400
+
+
+def test_view_stats_and_top_products_are_read_from_the_rollups(session_factory):
+    recorder = ProductViewRecorder(lambda: SqlalchemyUnitOfWork(session_factory))
+    recorder.record_many(["a", "a", "b"], "admin@test.com", Roles.admin)
+    recorder.flush()
+    recorder.record_many(["a", "c"], "anonymous", Roles.anonymous)
+    recorder.flush()
+    uow = SqlalchemyUnitOfWork(session_factory)
+
+    stats = product_views.get_product_stats("a", uow)
+    top = product_views.get_top_products(uow, limit=2)
+    top_admin = product_views.get_top_products(uow, role=Roles.admin)
+
+    assert stats.total == 3
+    assert stats.by_role == {Roles.admin: 2, Roles.anonymous: 1}
+    assert sum(hour.views for hour in stats.hourly) == 3
+    assert [(product.sku, product.views) for product in top] == [("a", 3), ("b", 1)]
+    assert [(product.sku, product.views) for product in top_admin] == [
+        ("a", 2),
+        ("b", 1),
+    ]
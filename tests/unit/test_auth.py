@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+from domain.commands import user_commands
+from domain.models import User
+from schemas.enums import Roles
+from service_layer import messagebus
+from service_layer.auth import AuthManager, user_cache
+from tests.common import FakeUnitOfWork, FakeAsyncUnitOfWork
+
+
+def _register_admin(uow):
+    messagebus.handle(
+        user_commands.RegisterUser(
+            email="admin@test.com",
+            password="test",
+            username="admin",
+            role=Roles.admin,
+        ),
+        uow,
+    )
+
+
+def test_user_is_cached_by_token():
+    uow = FakeUnitOfWork()
+    _register_admin(uow)
+    token = AuthManager.encode_token(User(email="admin@test.com"))
+    request = SimpleNamespace(state=SimpleNamespace())
+
+    asyncio.run(
+        AuthManager.get_user_from_token(token, request, FakeAsyncUnitOfWork(uow))
+    )
+    uow.repository.delete(User, "email", "admin@test.com")
+    user = asyncio.run(
+        AuthManager.get_user_from_token(token, request, FakeAsyncUnitOfWork(uow))
+    )
+
+    assert user.email == "admin@test.com"
+    assert request.state.user == user
+    user_cache.clear()
+
+
+def test_user_commands_invalidate_cached_tokens():
+    uow = FakeUnitOfWork()
+    _register_admin(uow)
+    token = AuthManager.encode_token(User(email="admin@test.com"))
+    request = SimpleNamespace(state=SimpleNamespace())
+    asyncio.run(
+        AuthManager.get_user_from_token(token, request, FakeAsyncUnitOfWork(uow))
+    )
+
+    messagebus.handle(user_commands.MakeUserSuperAdmin(email="admin@test.com"), uow)
+    user = asyncio.run(
+        AuthManager.get_user_from_token(token, request, FakeAsyncUnitOfWork(uow))
+    )
+
+    assert user.role == Roles.super_admin
+    user_cache.clear()
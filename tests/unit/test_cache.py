@@ -0,0 +1,28 @@
+import time
+
+import pytest
+
+from adapters.cache import LRUCache, SharedCacheStandIn
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1, "expirations": 0}
+
+
+@pytest.mark.parametrize(
+    "cache", [LRUCache(max_size=2, ttl=60), SharedCacheStandIn(ttl=60)]
+)
+def test_cache_entries_expire(cache):
+    cache.set("a", 1, ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 0, "misses": 1, "evictions": 0, "expirations": 1}
@@ -8,6 +8,8 @@ from schemas.enums import Roles
 from schemas.product import ProductSchema
 from schemas.user import UserRegisterIn
 from service_layer import messagebus
+from service_layer.product_cache import product_cache
+from service_layer.view_recorder import view_recorder
 from tests.common import FakeUnitOfWork
 
 
@@ -81,6 +83,85 @@ class TestProductHandler:
         assert uow.repository.get(Product, {"sku": "test"}).name == "test2"
         assert uow.committed
 
+    @staticmethod
+    def test_update_product_bumps_the_version_only_on_changes():
+        uow = FakeUnitOfWork()
+        fields = dict(sku="test", name="test", price=10, brand="test", quantity=10)
+        messagebus.handle(product_commands.CreateProduct(**fields), uow)
+        for price in (10, 20, 20):
+            messagebus.handle(
+                product_commands.UpdateProduct(
+                    sku="test", product=ProductSchema(**{**fields, "price": price})
+                ),
+                uow,
+            )
+        assert uow.repository.get(Product, {"sku": "test"}).version == 2
+
+    @staticmethod
+    def test_product_commands_invalidate_the_cached_product(monkeypatch):
+        uow = FakeUnitOfWork()
+        messagebus.handle(
+            product_commands.CreateProduct(
+                sku="test", name="test", price=10, brand="test", quantity=10
+            ),
+            uow,
+        )
+        # the event handlers run in the outbox relay, not in this process
+        monkeypatch.setitem(messagebus.EVENT_HANDLERS, events.ProductModified, [])
+        monkeypatch.setitem(messagebus.EVENT_HANDLERS, events.ProductDeleted, [])
+        product_cache.set("test", {"sku": "test"})
+        messagebus.handle(
+            product_commands.UpdateProduct(
+                sku="test",
+                product=ProductSchema(
+                    sku="test", name="new", price=10, brand="test", quantity=10
+                ),
+            ),
+            uow,
+        )
+        assert product_cache.get("test") is None
+
+        product_cache.set("test", {"sku": "test"})
+        messagebus.handle(product_commands.DeleteProduct(sku="test"), uow)
+        assert product_cache.get("test") is None
+
+    @staticmethod
+    def test_bulk_create_products_reports_conflicts():
+        uow = FakeUnitOfWork()
+        messagebus.handle(
+            product_commands.CreateProduct(
+                sku="test", name="test", price=10, brand="test", quantity=10
+            ),
+            uow,
+        )
+        products = [
+            ProductSchema(sku=sku, name="test", price=10, brand="test", quantity=10)
+            for sku in ["bulk1", "test", "bulk2", "bulk1"]
+        ]
+        result = messagebus.handle(
+            product_commands.BulkCreateProducts(products=products, chunk_size=2), uow
+        )
+
+        assert result["created"] == 2
+        assert [(c["index"], c["sku"]) for c in result["conflicts"]] == [
+            (1, "test"),
+            (3, "bulk1"),
+        ]
+        assert uow.repository.get(Product, {"sku": "bulk2"}) is not None
+
+    @staticmethod
+    def test_product_changes_are_notified_with_one_digest():
+        uow = FakeUnitOfWork()
+        messagebus.handle_many(
+            [events.ProductDeleted(sku=f"sku{i}") for i in range(3)], uow
+        )
+
+        (notification,) = uow.repository._fake_db_dict["notification_outbox"]
+        assert notification.subject == "3 product changes"
+        assert notification.body.splitlines()[1:] == [
+            f"Product sku{i} has been deleted" for i in range(3)
+        ]
+
 
 class TestUserHandler:
     """Test UserHandler"""
@@ -207,5 +288,45 @@ class TestUserHandler:
             events.ProductViewed(user_email="admin@test.com", sku="test"),
             uow,
         )
+        view_recorder.flush(uow)
         product_seen = uow.repository.get(ProductSeen, {"product_sku": "test"})
         assert product_seen is not None
+
+    @staticmethod
+    def test_product_views_are_coalesced(monkeypatch):
+        uow = FakeUnitOfWork()
+        messagebus.handle(
+            user_commands.RegisterUser(
+                email="admin@test.com",
+                password="test",
+                username="admin",
+                role=Roles.admin,
+            ),
+            uow,
+        )
+        view_recorder.flush(uow)
+        reads = []
+        get_user = uow.repository.get
+
+        def counting_get(table, dict_to_filter):
+            reads.append(table)
+            return get_user(table, dict_to_filter)
+
+        monkeypatch.setattr(uow.repository, "get", counting_get)
+        messagebus.handle_many(
+            [
+                events.ProductViewed(user_email="admin@test.com", sku=f"sku{i}")
+                for i in range(3)
+            ]
+            + [events.ProductViewed(user_email=None, sku="sku0")],
+            uow,
+        )
+
+        assert reads == [User]
+        assert view_recorder.flush(uow) == 4
+        viewers = {
+            (row.product_sku, row.user_email)
+            for row in uow.repository._fake_db_dict["product_seen"]
+        }
+        assert ("sku0", "anonymous") in viewers
+        assert ("sku2", "admin@test.com") in viewers
@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from resources import http_cache
+from schemas.product import VersionedProduct
+
+PRODUCT = VersionedProduct(
+    sku="test",
+    name="test",
+    price=10,
+    brand="test",
+    quantity=10,
+    version=3,
+    updated_at=datetime(2026, 10, 18, 12, 30, 15, 500),
+)
+
+
+def _request(**headers) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "headers": [
+                (name.replace("_", "-").lower().encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+def test_validators_of_a_product():
+    headers = http_cache.validators(PRODUCT)
+
+    assert headers["ETag"] == '"3-1792326615"'
+    assert headers["Last-Modified"] == "Sun, 18 Oct 2026 12:30:15 GMT"
+    assert headers["Cache-Control"] == http_cache.PRODUCT_CACHE_CONTROL
+
+
+def test_conditional_requests():
+    etag = http_cache.entity_tag(PRODUCT)
+
+    assert http_cache.is_not_modified(_request(If_None_Match=f'"x", W/{etag}'), PRODUCT)
+    assert not http_cache.is_not_modified(_request(If_None_Match='"2-1"'), PRODUCT)
+    assert http_cache.is_not_modified(
+        _request(If_Modified_Since="Sun, 18 Oct 2026 12:30:15 GMT"), PRODUCT
+    )
+    assert not http_cache.is_not_modified(
+        _request(If_Modified_Since="Sun, 18 Oct 2026 12:30:14 GMT"), PRODUCT
+    )
+    # If-None-Match takes precedence
+    assert not http_cache.is_not_modified(
+        _request(
+            If_None_Match='"2-1"', If_Modified_Since="Sun, 18 Oct 2026 12:30:15 GMT"
+        ),
+        PRODUCT,
+    )
+    assert not http_cache.is_not_modified(_request(If_Modified_Since="bad"), PRODUCT)
+    assert not http_cache.is_not_modified(_request(), PRODUCT)
+
+
+def test_version_of_the_if_match_header():
+    assert http_cache.if_match_version(_request(If_Match='"3-1792326615"')) == 3
+    assert http_cache.if_match_version(_request(If_Match='"2"')) == 2
+    assert http_cache.if_match_version(_request(If_Match="*")) is None
+    assert http_cache.if_match_version(_request()) is None
+    with pytest.raises(HTTPException) as error:
+        http_cache.if_match_version(_request(If_Match="W/x"))
+    assert error.value.status_code == 400
@@ -0,0 +1,64 @@
+import json
+import logging
+import logging.handlers
+import queue
+
+import logger
+
+
+def _record(name: str, level: int, msg: str, *args) -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_lines_are_queued_with_the_request_id_and_written_as_json():
+    log_queue = queue.SimpleQueue()
+    handler = logger.NonBlockingQueueHandler(log_queue)
+    handler.addFilter(logger.RequestIdFilter())
+    sku = ["test"]
+
+    token = logger.request_id.set("abc123")
+    try:
+        handler.handle(_record("RestAPI_logger.views", logging.INFO, "Sku: %s", sku))
+    finally:
+        logger.request_id.reset(token)
+    # the message was built when the line was logged
+    sku.append("changed")
+
+    line = json.loads(logger.JsonFormatter().format(log_queue.get_nowait()))
+    assert line["message"] == "Sku: ['test']"
+    assert line["request_id"] == "abc123"
+    assert line["level"] == "INFO"
+    assert line["logger"] == "RestAPI_logger.views"
+
+
+def test_info_lines_of_the_sampled_modules_are_sampled():
+    sampling = logger.SamplingFilter(
+        {"service_layer": 0.5, "service_layer.unit_of_work": 0.1}
+    )
+
+    def kept(name: str, level: int = logging.INFO) -> int:
+        records = (_record(f"RestAPI_logger.{name}", level, "line") for _ in range(100))
+        return sum(sampling.filter(record) for record in records)
+
+    assert kept("service_layer.unit_of_work") == 10
+    assert kept("service_layer.messagebus") == 50
+    assert kept("views.product_views") == 100
+    assert kept("service_layer.unit_of_work", logging.WARNING) == 100
+
+
+def test_lines_are_written_directly_until_the_listener_starts():
+    written = []
+    collector = logging.Handler()
+    collector.emit = written.append
+    listener = logging.handlers.QueueListener(queue.SimpleQueue(), collector)
+    handler = logger.ListenerHandler(listener)
+
+    handler.handle(_record("RestAPI_logger.views", logging.INFO, "before"))
+    assert [record.getMessage() for record in written] == ["before"]
+
+    listener.start()
+    handler.listening = True
+    handler.handle(_record("RestAPI_logger.views", logging.INFO, "queued"))
+    handler.listening = False
+    listener.stop()
+    assert [record.getMessage() for record in written] == ["before", "queued"]
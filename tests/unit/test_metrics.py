@@ -0,0 +1,80 @@
+import pytest
+from fastapi import HTTPException
+
+from domain.commands import product_commands
+from service_layer import messagebus
+from service_layer.metrics import (
+    InMemoryMetricsExporter,
+    MetricsRegistry,
+    PrometheusExporter,
+    metrics_registry,
+)
+from tests.common import FakeUnitOfWork
+
+
+def test_histogram_is_rendered_in_the_prometheus_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram(
+        "request_seconds", "Request latency", ("path",), buckets=(0.1, 1.0)
+    )
+    errors = registry.counter("errors_total", "Errors")
+    histogram.labels(path="/a").observe(0.05)
+    histogram.labels(path="/a").observe(0.5)
+    histogram.labels(path="/a").observe(5)
+    errors.inc()
+
+    assert PrometheusExporter().export(registry.collect()).splitlines() == [
+        "# HELP request_seconds Request latency",
+        "# TYPE request_seconds histogram",
+        'request_seconds_bucket{path="/a",le="0.1"} 1',
+        'request_seconds_bucket{path="/a",le="1.0"} 2',
+        'request_seconds_bucket{path="/a",le="+Inf"} 3',
+        'request_seconds_sum{path="/a"} 5.55',
+        'request_seconds_count{path="/a"} 3',
+        "# HELP errors_total Errors",
+        "# TYPE errors_total counter",
+        "errors_total 1",
+    ]
+
+
+def test_bus_records_handler_latency_and_errors():
+    exporter = InMemoryMetricsExporter()
+    metrics_registry.add_exporter(exporter)
+    labels = {"kind": "command", "message": "DeleteProduct"}
+    try:
+        metrics_registry.export()
+        errors_before = sum(
+            s.value
+            for s in exporter.get_samples("messagebus_handler_errors_total", **labels)
+        )
+        calls_before = sum(
+            s.value for s in exporter.get_samples("messagebus_handler_seconds_count")
+        )
+        uow = FakeUnitOfWork()
+        messagebus.handle(
+            product_commands.CreateProduct(
+                sku="test", name="test", price=10, brand="test", quantity=10
+            ),
+            uow,
+        )
+        messagebus.handle(product_commands.DeleteProduct(sku="test"), uow)
+        with pytest.raises(HTTPException):
+            messagebus.handle(product_commands.DeleteProduct(sku="test"), uow)
+        metrics_registry.export()
+    finally:
+        metrics_registry.remove_exporter(exporter)
+
+    (errors,) = exporter.get_samples("messagebus_handler_errors_total", **labels)
+    assert errors.labels["handler"] == "ProductHandler.delete_product"
+    assert errors.value - errors_before == 1
+    # two commands and the handlers of the created and deleted events
+    calls = sum(
+        s.value for s in exporter.get_samples("messagebus_handler_seconds_count")
+    )
+    assert calls - calls_before == 7
+    assert exporter.get_samples(
+        "messagebus_handler_seconds_count",
+        kind="event",
+        message="ProductDeleted",
+        handler="UserHandler.notify_product_change_to_all_users",
+    )
@@ -0,0 +1,63 @@
+import asyncio
+from concurrent.futures import Future
+
+import pytest
+from fastapi import HTTPException
+
+from service_layer.password_hasher import PasswordHasher, Slots
+
+
+class StuckExecutor:
+    """Accepts operations that never finish, so every slot stays taken"""
+
+    def submit(self, fn, *args):
+        return Future()
+
+
+def test_hash_and_verify():
+    hasher = PasswordHasher(rounds=4)
+    hashed_password = hasher.hash("password")
+
+    assert hasher.verify_and_update("password", hashed_password) == (True, None)
+    assert hasher.verify_and_update("wrong", hashed_password) == (False, None)
+    hasher.shutdown()
+
+
+def test_verify_returns_a_new_hash_when_the_cost_changes():
+    hashed_password = PasswordHasher(rounds=4).hash("password")
+    hasher = PasswordHasher(rounds=5)
+
+    verified, new_hash = asyncio.run(
+        hasher.verify_and_update_async("password", hashed_password)
+    )
+
+    assert verified
+    assert new_hash.startswith("$2b$05$")
+    hasher.shutdown()
+
+
+def test_saturated_hasher_rejects_operations_after_the_wait_timeout():
+    hasher = PasswordHasher(max_pending=1, wait_timeout=0.01, executor=StuckExecutor())
+    hasher._submit(lambda: None)
+
+    with pytest.raises(HTTPException) as ex:
+        asyncio.run(hasher.hash_async("password"))
+    assert ex.value.status_code == 503
+
+
+def test_released_slots_are_handed_to_the_waiting_coroutines():
+    slots = Slots(1)
+    assert slots.try_acquire()
+
+    async def wait_for_the_slot():
+        waiting = asyncio.ensure_future(slots.acquire_async(timeout=1))
+        await asyncio.sleep(0)
+        # the release comes from the thread of the pool that finished an operation
+        await asyncio.get_running_loop().run_in_executor(None, slots.release)
+        return await waiting
+
+    assert asyncio.run(wait_for_the_slot())
+    assert not slots.try_acquire()
+    assert not asyncio.run(slots.acquire_async(timeout=0.01))
+    slots.release()
+    assert slots.try_acquire()
@@ -0,0 +1,70 @@
+import time
+
+from adapters.cache import LRUCache, SharedCacheStandIn, TieredCache
+from domain.commands import product_commands
+from schemas.product import ProductSchema
+from service_layer import messagebus
+from service_layer.product_cache import (
+    cache_product,
+    cached_product,
+    invalidate_product,
+    product_cache,
+)
+from tests.common import FakeUnitOfWork
+from views import product_views
+
+PRODUCT = {"sku": "test", "name": "test", "price": 10, "brand": "test", "quantity": 10}
+
+
+def test_get_product_reads_from_cache():
+    cache = LRUCache(max_size=10, ttl=60)
+    cache.set("test", PRODUCT)
+
+    product = product_views.get_product("test", uow=FakeUnitOfWork(), cache=cache)
+
+    assert product.name == "test"
+    assert cache.stats()["hits"] == 1
+
+
+def test_product_events_refresh_the_cache():
+    uow = FakeUnitOfWork()
+    messagebus.handle(product_commands.CreateProduct(**PRODUCT), uow)
+    assert product_cache.get("test")["name"] == "test"
+
+    messagebus.handle(
+        product_commands.UpdateProduct(
+            sku="test", product=ProductSchema(**{**PRODUCT, "name": "test2"})
+        ),
+        uow,
+    )
+    assert product_cache.get("test") is None
+
+    product_cache.clear()
+
+
+def test_tiered_cache_fills_local_cache_from_shared():
+    shared = SharedCacheStandIn(ttl=60)
+    shared.set("test", PRODUCT)
+    cache = TieredCache(LRUCache(max_size=10, ttl=60), shared)
+
+    assert cache.get("test") == PRODUCT
+    assert cache.local.get("test") == PRODUCT
+
+    cache.delete("test")
+    assert shared.get("test") is None
+
+
+def test_older_reads_do_not_replace_the_cached_product():
+    cache = LRUCache(max_size=10, ttl=60)
+    cache_product(cache, "test", cached_product(PRODUCT, 2, None), time.time())
+    cache_product(cache, "test", cached_product(PRODUCT, 1, None), time.time())
+    assert cache.get("test")["version"] == 2
+
+    read_at = time.time()
+    invalidate_product(cache, "test")
+    cache_product(cache, "test", cached_product(PRODUCT, 2, None), read_at)
+    assert cache.get("test") is None
+
+    # the reads that start after the change are cached
+    cache_product(cache, "test", cached_product(PRODUCT, 3, None), time.time())
+    assert cache.get("test")["version"] == 3
@@ -0,0 +1,54 @@
+import asyncio
+import csv
+
+from adapters.product_import import (
+    validate_rows,
+    validate_stream,
+    _csv_rows,
+    _lines,
+    _ndjson_rows,
+)
+
+
+async def _stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_validate_csv_rows():
+    lines = [
+        "sku,name,price,brand,quantity",
+        "a,name,1.5,brand,2",
+        "b,name,cheap,brand,2",
+    ]
+
+    products, invalid = validate_rows(csv.DictReader(lines))
+
+    assert [(row, product.price) for row, product in products] == [(1, 1.5)]
+    assert invalid[0]["row"] == 2
+
+
+def test_validate_ndjson_rows():
+    lines = [
+        '{"sku": "a", "name": "name", "price": 1, "brand": "brand", "quantity": 2}',
+        '{"sku": "b", "name":',
+    ]
+
+    products, invalid = asyncio.run(validate_stream(_ndjson_rows(_stream(*lines))))
+
+    assert products[0][1].sku == "a"
+    assert invalid[0]["row"] == 2
+
+
+def test_csv_rows_are_validated_as_they_arrive():
+    body = 'sku,name,price,brand,quantity\na,"café\nnoir",1.5,brand,2\nb,n,x,brand,2\n'
+    encoded = body.encode("utf-8")
+    # the "é" is split between two chunks
+    split = encoded.index("é".encode("utf-8")) + 1
+
+    products, invalid = asyncio.run(
+        validate_stream(_csv_rows(_lines(_stream(encoded[:split], encoded[split:]))))
+    )
+
+    assert [(row, product.name) for row, product in products] == [(1, "café\nnoir")]
+    assert invalid[0]["row"] == 2
@@ -0,0 +1,34 @@
+import time
+
+from adapters.cache import LRUCache, SharedCacheStandIn
+from service_layer.rate_limiter import TokenBucketRateLimiter
+
+
+def _limiter(store=None):
+    return TokenBucketRateLimiter(
+        "test",
+        capacity=2,
+        refill_per_second=1,
+        store=store or LRUCache(max_size=100, ttl=60),
+    )
+
+
+def test_bucket_allows_the_capacity_and_then_asks_to_retry():
+    limiter = _limiter()
+
+    assert limiter.consume("1.2.3.4") == 0
+    assert limiter.consume("1.2.3.4") == 0
+    assert 0 < limiter.consume("1.2.3.4") <= 1
+    assert limiter.consume("5.6.7.8") == 0
+
+
+def test_bucket_is_refilled_over_time(monkeypatch):
+    limiter = _limiter(SharedCacheStandIn(ttl=60))
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    limiter.consume("key")
+    limiter.consume("key")
+    assert limiter.consume("key") > 0
+
+    monkeypatch.setattr(time, "time", lambda: now + 1)
+    assert limiter.consume("key") == 0
@@ -0,0 +1,26 @@
+import pytest
+
+import config
+import main
+
+
+def test_settings_are_read_from_the_environment_when_used(monkeypatch):
+    monkeypatch.delenv("ASYNC_DATABASE_URL", raising=False)
+    settings = config.Settings(database_url="sqlite:///catalog.db")
+    monkeypatch.setenv("DEBUG", "true")
+
+    assert settings.debug is True
+    assert settings.async_database_url == "sqlite+aiosqlite:///catalog.db"
+    # the value is kept once it was read
+    monkeypatch.setenv("DEBUG", "false")
+    assert settings.debug is True
+
+
+def test_unknown_settings_are_rejected():
+    with pytest.raises(TypeError):
+        config.Settings(database="sqlite:///catalog.db")
+
+
+def test_the_app_of_main_is_built_on_first_use():
+    assert main.app is main.app
+    assert main.app.state.settings.title
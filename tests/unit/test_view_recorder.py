@@ -0,0 +1,84 @@
+from domain.models import ProductSeen
+from schemas.enums import Roles
+from service_layer import metrics
+from service_layer.view_recorder import ProductViewRecorder
+from tests.common import FakeUnitOfWork
+
+
+def test_flush_writes_views_in_batches():
+    uow = FakeUnitOfWork()
+    recorder = ProductViewRecorder(uow_factory=lambda: uow, batch_size=2)
+    for sku in ["sku1", "sku2", "sku3"]:
+        recorder.record(sku, "admin@test.com", Roles.admin)
+
+    assert recorder.flush() == 3
+    assert uow.repository.get(ProductSeen, {"product_sku": "sku3"}).role == Roles.admin
+    assert recorder.stats()["pending"] == 0
+    assert uow.committed
+
+
+def _value(metric) -> float:
+    return sum(sample.value for sample in metric.collect().samples)
+
+
+def test_full_buffer_drops_and_counts_views():
+    dropped = _value(metrics.PRODUCT_VIEWS_DROPPED)
+    recorder = ProductViewRecorder(uow_factory=FakeUnitOfWork, max_size=1)
+    assert recorder.record("sku1", "admin@test.com", Roles.admin)
+    assert not recorder.record("sku2", "admin@test.com", Roles.admin)
+    assert recorder.stats()["dropped"] == 1
+    # the drops are seen out of the process through the metrics
+    assert _value(metrics.PRODUCT_VIEWS_DROPPED) - dropped == 1
+    assert _value(metrics.PRODUCT_VIEWS_PENDING) == 1
+
+
+def test_stop_flushes_pending_views():
+    uow = FakeUnitOfWork()
+    recorder = ProductViewRecorder(uow_factory=lambda: uow, flush_interval=60)
+    recorder.worker.start()
+    recorder.record("sku1", "anonymous", Roles.anonymous)
+    recorder.worker.stop()
+
+    assert uow.repository.get(ProductSeen, {"product_sku": "sku1"}) is not None
+
+
+def test_record_many_queues_the_views_until_the_buffer_is_full():
+    recorder = ProductViewRecorder(uow_factory=FakeUnitOfWork, max_size=2)
+
+    queued = recorder.record_many(
+        ["sku1", "sku2", "sku3"], "admin@test.com", Roles.admin
+    )
+
+    assert queued == 2
+    assert recorder.stats()["pending"] == 2
+    assert recorder.stats()["dropped"] == 1
+
+
+def test_flush_increments_the_hourly_and_daily_rollups():
+    uow = FakeUnitOfWork()
+    recorder = ProductViewRecorder(uow_factory=lambda: uow)
+    recorder.record_many(["sku1", "sku1", "sku2"], "admin@test.com", Roles.admin)
+    recorder.flush()
+    recorder.record("sku1", "anonymous", Roles.anonymous)
+    recorder.flush()
+
+    daily = uow.repository._fake_counters["product_views_daily"]
+    assert sorted((sku, role, views) for (sku, role, _), views in daily.items()) == [
+        ("sku1", Roles.admin, 2),
+        ("sku1", Roles.anonymous, 1),
+        ("sku2", Roles.admin, 1),
+    ]
+    assert sum(uow.repository._fake_counters["product_views_hourly"].values()) == 4
+
+
+def test_views_of_failed_batches_are_counted():
+    failed = _value(metrics.PRODUCT_VIEWS_FAILED)
+
+    def broken_uow():
+        raise RuntimeError("database is down")
+
+    recorder = ProductViewRecorder(uow_factory=broken_uow)
+    recorder.record("sku1", "admin@test.com", Roles.admin)
+
+    assert recorder.flush() == 0
+    assert _value(metrics.PRODUCT_VIEWS_FAILED) - failed == 1
@@ -1,32 +1,295 @@
+import base64
+import binascii
+import json
+import operator
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional
+
 from fastapi import HTTPException
-from sqlalchemy import text
+from sqlalchemy import and_, func, or_, select
 
 from domain import events
-from logger import logger
-from schemas.product import ProductSchema
+from logger import get_logger
+from adapters.cache import AbstractCache
+from adapters.orm import product_views_daily, product_views_hourly, products
+from schemas.enums import ProductSortField, Roles, SortOrder
+from schemas.product import (
+    ProductSchema,
+    ProductPage,
+    ProductStats,
+    ProductViews,
+    VersionedProduct,
+)
 from service_layer import messagebus
+from service_layer.product_cache import (
+    cache_product,
+    cached_product,
+    product_cache,
+)
 from service_layer.unit_of_work import AbstractUnitOfWork
 
+logger = get_logger(__name__)
+
 
 def get_product(
     sku: str,
     uow: AbstractUnitOfWork,
     message_bus=None,
     user_email=None,
-) -> ProductSchema:
-    """Get product by id"""
-    logger.info(f"Getting product with sku: {sku}")
-    with uow:
-        try:
-            product = next(
-                uow.session.execute(
-                    text("SELECT * FROM products WHERE sku = :sku"), {"sku": sku}
-                )
-            )
-        except StopIteration:
-            logger.error(f"Product with sku: {sku} not found")
-            raise HTTPException(status_code=404, detail="Product not found")
-    event = events.ProductViewed(sku=sku, user_email=user_email)
+    user_role=None,
+    cache: AbstractCache = None,
+) -> VersionedProduct:
+    """
+    Get product by id, the read model cache is consulted before the database. The
+    product comes with its version and the time of its last change
+    """
+    logger.info("Getting product with sku: %s", sku)
+    cache = product_cache if cache is None else cache
+    product = cache.get(sku)
+    if product is None:
+        read_at = time.time()
+        with uow:
+            row = uow.session.execute(
+                select(products).where(products.c.sku == sku)
+            ).first()
+            if row is None:
+                logger.error("Product with sku: %s not found", sku)
+                raise HTTPException(status_code=404, detail="Product not found")
+        product = cached_product(
+            ProductSchema.from_orm(row).dict(), row.version, row.updated_at
+        )
+        cache_product(cache, sku, product, read_at)
+    event = events.ProductViewed(sku=sku, user_email=user_email, role=user_role)
     message_bus = message_bus or messagebus
     message_bus.handle(event, uow)
-    return ProductSchema.from_orm(product)
+    updated_at = product.get("updated_at")
+    return VersionedProduct.construct(
+        **{**product, "updated_at": updated_at and datetime.fromisoformat(updated_at)}
+    )
+
+
+def get_products(
+    skus: List[str],
+    uow: AbstractUnitOfWork,
+    message_bus=None,
+    user_email=None,
+    user_role=None,
+    cache: AbstractCache = None,
+) -> dict:
+    """
+    Get many products by sku, the skus that are not cached are read with a single
+    query and cached like get_product does. The products are returned as the cached
+    dicts, with their version and the time of their last change, in the order of the
+    request, and the skus that don't exist are reported as missing
+    """
+    skus = list(dict.fromkeys(skus))
+    logger.info("Getting %d products", len(skus))
+    cache = product_cache if cache is None else cache
+    found = {}
+    for sku in skus:
+        product = cache.get(sku)
+        if product is not None:
+            found[sku] = product
+    not_cached = [sku for sku in skus if sku not in found]
+    if not_cached:
+        statement = select(
+            products.c.sku,
+            products.c.name,
+            products.c.price,
+            products.c.brand,
+            products.c.quantity,
+            products.c.version,
+            products.c.updated_at,
+        ).where(products.c.sku.in_(not_cached))
+        read_at = time.time()
+        with uow:
+            rows = uow.session.execute(statement).all()
+        for row in rows:
+            # built from the row tuple, no schema is validated per row
+            fields = row._asdict()
+            version = fields.pop("version")
+            updated_at = fields.pop("updated_at")
+            product = cached_product(fields, version, updated_at)
+            cache_product(cache, row.sku, product, read_at)
+            found[row.sku] = product
+    viewed = [sku for sku in skus if sku in found]
+    if viewed:
+        event = events.ProductsViewed(
+            skus=viewed, user_email=user_email, role=user_role
+        )
+        message_bus = message_bus or messagebus
+        message_bus.handle(event, uow)
+    return {
+        "products": [found[sku] for sku in viewed],
+        "missing": [sku for sku in skus if sku not in found],
+    }
+
+
+def list_products(
+    uow: AbstractUnitOfWork,
+    brand: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    sort_by: ProductSortField = ProductSortField.id,
+    order: SortOrder = SortOrder.asc,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+) -> ProductPage:
+    """
+    List products with keyset pagination, the cursor holds the sort value and the id of
+    the last product of the previous page, so every page is an index seek instead of
+    skipping the previous rows like OFFSET does
+    """
+    logger.info("Listing products sorted by %s %s", sort_by.value, order.value)
+    sort_column = products.c[sort_by.value]
+    descending = order == SortOrder.desc
+    statement = select(
+        products.c.id,
+        products.c.sku,
+        products.c.name,
+        products.c.price,
+        products.c.brand,
+        products.c.quantity,
+    )
+    if brand is not None:
+        statement = statement.where(products.c.brand == brand)
+    if min_price is not None:
+        statement = statement.where(products.c.price >= min_price)
+    if max_price is not None:
+        statement = statement.where(products.c.price <= max_price)
+    if in_stock:
+        statement = statement.where(products.c.quantity > 0)
+    if cursor:
+        last_value, last_id = _decode_cursor(cursor, sort_by)
+        after = operator.lt if descending else operator.gt
+        if sort_by in (ProductSortField.id, ProductSortField.sku):
+            statement = statement.where(after(sort_column, last_value))
+        else:
+            statement = statement.where(
+                or_(
+                    after(sort_column, last_value),
+                    and_(sort_column == last_value, after(products.c.id, last_id)),
+                )
+            )
+    order_by = [sort_column]
+    # the id breaks the ties of the sort values, the ids are unique
+    if sort_by != ProductSortField.id:
+        order_by.append(products.c.id)
+    statement = statement.order_by(
+        *(column.desc() if descending else column.asc() for column in order_by)
+    )
+    # one extra row tells if there is a next page
+    statement = statement.limit(limit + 1)
+    with uow:
+        rows = list(uow.session.execute(statement))
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(getattr(rows[-1], sort_by.value), rows[-1].id)
+    return ProductPage(
+        items=[ProductSchema.from_orm(row) for row in rows], next_cursor=next_cursor
+    )
+
+
+def get_product_stats(sku: str, uow: AbstractUnitOfWork, days: int = 7) -> ProductStats:
+    """Views of a product in the last days, read from the hourly and daily rollups"""
+    logger.info("Getting view stats of product with sku: %s", sku)
+    now = datetime.now()
+    since_day = now.date() - timedelta(days=days - 1)
+    since_hour = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+    daily_statement = (
+        select(
+            product_views_daily.c.day,
+            product_views_daily.c.role,
+            func.sum(product_views_daily.c.views).label("views"),
+        )
+        .where(product_views_daily.c.product_sku == sku)
+        .where(product_views_daily.c.day >= since_day)
+        .group_by(product_views_daily.c.day, product_views_daily.c.role)
+        .order_by(product_views_daily.c.day)
+    )
+    hourly_statement = (
+        select(
+            product_views_hourly.c.hour,
+            func.sum(product_views_hourly.c.views).label("views"),
+        )
+        .where(product_views_hourly.c.product_sku == sku)
+        .where(product_views_hourly.c.hour >= since_hour)
+        .group_by(product_views_hourly.c.hour)
+        .order_by(product_views_hourly.c.hour)
+    )
+    with uow:
+        daily_rows = uow.session.execute(daily_statement).all()
+        hourly_rows = uow.session.execute(hourly_statement).all()
+    by_role = Counter()
+    daily = Counter()
+    for row in daily_rows:
+        by_role[row.role] += row.views
+        daily[row.day] += row.views
+    return ProductStats(
+        sku=sku,
+        days=days,
+        total=sum(daily.values()),
+        by_role=by_role,
+        daily=[{"day": day, "views": views} for day, views in daily.items()],
+        hourly=[{"hour": row.hour, "views": row.views} for row in hourly_rows],
+    )
+
+
+def get_top_products(
+    uow: AbstractUnitOfWork,
+    limit: int = 10,
+    days: int = 7,
+    role: Optional[Roles] = None,
+) -> List[ProductViews]:
+    """Most viewed products of the last days, read from the daily rollup"""
+    logger.info("Getting the top %d products of the last %d days", limit, days)
+    since_day = datetime.now().date() - timedelta(days=days - 1)
+    views = func.sum(product_views_daily.c.views).label("views")
+    statement = select(product_views_daily.c.product_sku, views).where(
+        product_views_daily.c.day >= since_day
+    )
+    if role is not None:
+        statement = statement.where(product_views_daily.c.role == role)
+    statement = (
+        statement.group_by(product_views_daily.c.product_sku)
+        .order_by(views.desc(), product_views_daily.c.product_sku)
+        .limit(limit)
+    )
+    with uow:
+        rows = uow.session.execute(statement).all()
+    return [ProductViews(sku=row.product_sku, views=row.views) for row in rows]
+
+
+def _encode_cursor(last_value, last_id: int) -> str:
+    payload = json.dumps([last_value, last_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+# types of the sort value of a cursor, of each sort field
+CURSOR_VALUE_TYPES = {
+    ProductSortField.id: (int,),
+    ProductSortField.sku: (str,),
+    ProductSortField.name: (str,),
+    ProductSortField.price: (int, float),
+}
+
+
+def _decode_cursor(cursor: str, sort_by: ProductSortField) -> tuple:
+    try:
+        last_value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        last_value = last_id = None
+    value_types = CURSOR_VALUE_TYPES[sort_by]
+    if not (_is_of(last_value, value_types) and _is_of(last_id, (int,))):
+        logger.error("Invalid cursor: %s", cursor)
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return last_value, last_id
+
+
+def _is_of(value, types: tuple) -> bool:
+    """JSON booleans are ints for isinstance, they are never a valid cursor value"""
+    return isinstance(value, types) and not isinstance(value, bool)
@@ -1,37 +1,85 @@
 from fastapi import HTTPException
-from passlib.context import CryptContext
 from sqlalchemy import text
 
-from logger import logger
-from schemas.user import UserLogin, UserOut
-from service_layer.auth import AuthManager
-from service_layer.unit_of_work import AbstractUnitOfWork
+from domain.models import User
+from logger import get_logger
+from schemas.user import UserLogin, VersionedUser, normalize_email
+from service_layer.auth import AuthManager, unknown_account_cache
+from service_layer.password_hasher import PasswordHasher, password_hasher
+from service_layer.unit_of_work import (
+    AbstractUnitOfWork,
+    AbstractAsyncUnitOfWork,
+    ConcurrencyConflict,
+)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = get_logger(__name__)
 
 
-def login_user(user: UserLogin, uow: AbstractUnitOfWork):
-    """Login user"""
-    with uow:
+async def login_user(
+    user: UserLogin,
+    uow: AbstractAsyncUnitOfWork,
+    rehash_uow: AbstractAsyncUnitOfWork = None,
+    hasher: PasswordHasher = None,
+):
+    """
+    Login user, the password is verified in the password hasher process pool to keep
+    the event loop free. When the hashing cost changed, the password is hashed again
+    with the new cost through rehash_uow. The e-mail is matched without case and the
+    unknown e-mails are cached for a short time, so repeated attempts don't reach the
+    database
+    """
+    hasher = hasher or password_hasher
+    email = normalize_email(user.email)
+    if unknown_account_cache.get(email):
+        logger.error("User not found")
+        raise HTTPException(status_code=400, detail="Wrong email or password")
+    async with uow:
         logger.info("Logging in user")
+        result = await uow.session.execute(
+            text("SELECT * FROM users WHERE lower(email) = :email"),
+            {"email": email},
+        )
+        user_database = result.first()
+    if user_database is None:
+        logger.error("User not found")
+        unknown_account_cache.set(email, True)
+        raise HTTPException(status_code=400, detail="Wrong email or password")
+    verified, new_hash = await hasher.verify_and_update_async(
+        user.password, user_database.password
+    )
+    if not verified:
+        logger.error("Wrong password")
+        raise HTTPException(status_code=400, detail="Wrong email or password")
+    if new_hash and rehash_uow is not None:
         try:
-            user_database = next(
-                uow.session.execute(
-                    text("SELECT * FROM users WHERE email = :email"),
-                    {"email": user.email},
-                )
+            await rehash_uow.run_sync(
+                _rehash_password,
+                user_database.email,
+                user_database.password,
+                new_hash,
             )
-        except StopIteration:
-            logger.error("User not found")
-            raise HTTPException(status_code=400, detail="Wrong email or password")
-        if not pwd_context.verify(user.password, user_database.password):
-            logger.error("Wrong password")
-            raise HTTPException(status_code=400, detail="Wrong email or password")
-        return AuthManager.encode_token(user_database), user_database.role
+        except ConcurrencyConflict:
+            # the user was changed meanwhile, the next login hashes it again
+            logger.warning("The password hash of the user was not updated")
+    return AuthManager.encode_token(user_database), user_database.role
+
+
+def _rehash_password(
+    email: str, old_password: str, new_hash: str, uow: AbstractUnitOfWork
+):
+    """The password is not replaced when it was changed meanwhile"""
+    with uow:
+        logger.info("Updating the password hash of the user")
+        uow.repository.update_where(
+            User,
+            {"email": email, "password": old_password},
+            {"password": new_hash},
+            version_column="version",
+        )
 
 
-def get_user_by_email(email: str, uow: AbstractUnitOfWork) -> UserOut:
-    """Get user by email"""
+def get_user_by_email(email: str, uow: AbstractUnitOfWork) -> VersionedUser:
+    """Get user by email and its version"""
     with uow:
         logger.info("Getting user by email")
         try:
@@ -43,4 +91,4 @@ def get_user_by_email(email: str, uow: AbstractUnitOfWork) -> UserOut:
         except StopIteration:
             logger.error("User not found")
             raise HTTPException(status_code=404, detail="User not found")
-        return UserOut.from_orm(user)
+        return VersionedUser.from_orm(user)